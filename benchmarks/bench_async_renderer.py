@@ -0,0 +1,101 @@
+"""
+Benchmark comparing the synchronous renderer path with the asyncio client.
+
+A local stub renderer (a threaded HTTP server replying with canned JSON after a
+fixed delay) is started on 127.0.0.1, and the same batch of RenderRequests is
+sent sequentially with send_render_request() and then with render_many().
+
+Run from the repository root, inside the LMS virtual environment:
+
+    python -m benchmarks.bench_async_renderer [--requests 200] [--delay 0.05] [--concurrency 16]
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from webwork import async_renderer
+from webwork.async_renderer import render_many
+from webwork.render_requests import RenderRequest, send_render_request
+
+SECRET = "AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA"
+CANNED_RESPONSE = json.dumps({
+    "renderedHTML": "<html><body>" + "x" * 20000 + "</body></html>",
+    "form_data": {},
+    "flags": {"KEPT_EXTRA_ANSWERS": []},
+    "answers": {},
+    "problem_result": {"score": 0},
+}).encode("utf8")
+
+
+def start_stub(delay):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self): # pylint: disable=invalid-name
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(CANNED_RESPONSE)))
+            self.end_headers()
+            self.wfile.write(CANNED_RESPONSE)
+
+        def log_message(self, *args): # Keep the output readable
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_requests(url, count):
+    return [
+        RenderRequest(
+            server_settings={"server_type": "standalone", "server_api_url": url},
+            auth_data={"aud": "http://127.0.0.1", "problemJWTsecret": SECRET},
+            server_key="bench",
+            seed=seed,
+            psvn=1234,
+            problem="Library/Rochester/setAlgebra18FunInverse/ur_inv_2.pg",
+            params={"format": "json", "outputFormat": "simple"},
+            timeout=10,
+        )
+        for seed in range(1, count + 1)
+    ]
+
+
+def report(label, count, elapsed, failures):
+    print("{label:14s} {count:6d} requests {elapsed:8.3f}s {rate:9.1f} req/s  failures={failures}".format(
+        label=label, count=count, elapsed=elapsed, rate=count / elapsed, failures=failures))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.05, help="stub renderer latency (seconds)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    server = start_stub(args.delay)
+    url = "http://127.0.0.1:{port}/render-api".format(port=server.server_address[1])
+    batch = make_requests(url, args.requests)
+    try:
+        start = time.perf_counter()
+        failures = sum(1 for render_request in batch if send_render_request(render_request) is None)
+        report("sync", len(batch), time.perf_counter() - start, failures)
+
+        for use_aiohttp, label in ((False, "async/threads"), (True, "async/aiohttp")):
+            if use_aiohttp and async_renderer.aiohttp is None:
+                # render_many() would fall back to the threads
+                print("{label:14s} skipped, aiohttp is not installed".format(label=label))
+                continue
+            start = time.perf_counter()
+            results = render_many(batch, concurrency=args.concurrency, use_aiohttp=use_aiohttp)
+            report(label, len(batch), time.perf_counter() - start, sum(1 for r in results if not r.ok))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark suite for the submission handler, against a canned renderer.
+
+The block runs with a fake runtime (see support.py), and the renderer calls
+are answered in-process with recorded replies, so the numbers are the cost of
+the XBlock code itself (settings, periods, JWT, parsing, grading, saving).
+
+Micro benchmarks:
+  * sanitize_request         - _sanitize_request of a submitted form
+  * problem_from_json        - _problem_from_json of a reply
+  * result_from_json         - _result_from_json of a graded reply
+  * jwt cold / warm          - make_problemJWT_for_standalone with a new seed each call / the same seed
+Handler benchmarks (submit_webwork_iframed, end to end):
+  * initialLoad cached / uncached (a new seed each call, so the render cache misses)
+  * previewAnswers, submitAnswers, showCorrectAnswers
+
+Run from the repository root, inside the LMS virtual environment:
+
+    DJANGO_SETTINGS_MODULE=lms.envs.test python -m benchmarks.bench_handler \\
+        [--server-type standalone|html2xml] [--iterations 2000] \\
+        [--save results.json] [--baseline old-results.json]
+"""
+import argparse
+import json
+
+from benchmarks import harness, support
+
+
+def micro_benchmarks(server_type, iterations):
+    block = support.make_block(server_type)
+    block.set_current_server_settings()
+    replies = support.CannedReplies(server_type)
+    initial = json.loads(replies.initial.decode("utf8"))
+    submitted = json.loads(replies.submitted.decode("utf8"))
+    form = dict(support.submit_data(server_type, "submitAnswers"), problemSeed="1", psvn="1", format="json")
+
+    results = [
+        harness.measure("sanitize_request", lambda i: block._sanitize_request(dict(form)), iterations),
+        harness.measure("problem_from_json", lambda i: block._problem_from_json(initial), iterations),
+        harness.measure("result_from_json", lambda i: block._result_from_json(submitted), iterations),
+    ]
+    if server_type == "standalone":
+        def jwt_params(seed):
+            return block.prepare_webwork_params({
+                "problemSeed": seed, "psvn": block.get_psvn(), "sourceFilePath": block.problem})
+        results.append(harness.measure(
+            "jwt cold", lambda i: block.make_problemJWT_for_standalone(jwt_params(1000000 + i)), iterations))
+        results.append(harness.measure(
+            "jwt warm", lambda i: block.make_problemJWT_for_standalone(jwt_params(1)), iterations))
+    return results
+
+
+def handler_benchmarks(server_type, iterations):
+    results = []
+    requests_by_action = {
+        action: support.submit_data(server_type, action)
+        for action in ("initialLoad", "previewAnswers", "submitAnswers", "showCorrectAnswers")}
+
+    def handler_run(name, action, setup=None):
+        block = support.make_block(server_type, block_name=name.replace(" ", "_"))
+        data = requests_by_action[action]
+        results.append(harness.measure(
+            name, lambda i: block.submit_webwork_iframed(support.make_request(data)), iterations,
+            setup=(lambda i: setup(block, i)) if setup else None))
+
+    def new_seed(block, i):
+        block.seed = 1000000 + i
+
+    handler_run("handler initialLoad cached", "initialLoad")
+    handler_run("handler initialLoad uncached", "initialLoad", new_seed)
+    handler_run("handler previewAnswers", "previewAnswers")
+    handler_run("handler submitAnswers", "submitAnswers")
+    handler_run("handler showCorrectAnswers", "showCorrectAnswers")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--server-type", choices=sorted(support.SERVER_IDS), default="standalone")
+    parser.add_argument("--iterations", type=int, default=2000)
+    harness.add_result_arguments(parser)
+    args = parser.parse_args()
+
+    support.setup_django()
+    support.install_canned_renderer(args.server_type)
+
+    results = micro_benchmarks(args.server_type, args.iterations)
+    results += handler_benchmarks(args.server_type, args.iterations)
+
+    baseline = harness.load_results(args.baseline) if args.baseline else None
+    harness.print_results(results, baseline)
+    if args.save:
+        harness.save_results(args.save, "bench_handler", results, {
+            "server_type": args.server_type, "iterations": args.iterations})
+
+
+if __name__ == "__main__":
+    main()
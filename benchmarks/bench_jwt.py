@@ -0,0 +1,68 @@
+"""
+Benchmark for minting the problemJWT sent to the Standalone renderer.
+
+Reports tokens per second for:
+  * uncached - a new JWK and a full encryption for every token (the old behavior)
+  * cold     - the JWK is cached, but every token has new claims (new seed)
+  * warm     - the JWK and the token for the same claims are both cached
+
+Run from the repository root, inside the LMS virtual environment:
+
+    python -m benchmarks.bench_jwt [--tokens 2000]
+"""
+import argparse
+import time
+
+from webwork.jwt_cache import ProblemJWTFactory
+
+SECRET = "AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA"
+
+
+def make_claims(seed):
+    return {
+        "aud": "http://standalone.domain.tld:3000",
+        "problemSeed": str(seed),
+        "psvn": "1234",
+        "sourceFilePath": "Library/Rochester/setAlgebra18FunInverse/ur_inv_2.pg",
+        "problemSourceURL": "",
+        "problemSource": "",
+        "numCorrect": "0",
+        "numIncorrect": "0",
+        "format": "json",
+        "outputFormat": "simple",
+        "permissionLevel": "0",
+        "showSummary": "1",
+        "showComments": "0",
+        "showHints": "0",
+        "showSolutions": "0",
+        "includeTags": "0",
+    }
+
+
+def run(label, count, mint):
+    start = time.perf_counter()
+    for i in range(count):
+        mint(i)
+    elapsed = time.perf_counter() - start
+    print("{label:10s} {count:7d} tokens {elapsed:8.3f}s {rate:10.1f} tokens/s".format(
+        label=label, count=count, elapsed=elapsed, rate=count / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tokens", type=int, default=2000)
+    args = parser.parse_args()
+
+    def uncached(i):
+        ProblemJWTFactory().make_token("bench", SECRET, make_claims(i), use_cache=False)
+    run("uncached", args.tokens, uncached)
+
+    cold_factory = ProblemJWTFactory(max_tokens=args.tokens)
+    run("cold", args.tokens, lambda i: cold_factory.make_token("bench", SECRET, make_claims(i)))
+
+    # Same claims as the cold run, so every token is already in the cache
+    run("warm", args.tokens, lambda i: cold_factory.make_token("bench", SECRET, make_claims(i)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Timing, reporting and storing of benchmark results.
+
+Results are saved as JSON (--save), and a later run can be compared with a
+saved baseline (--baseline), showing the change of the mean and p99 latency
+and of the throughput of each operation.
+"""
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(percent / 100.0 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(name, durations, elapsed=None):
+    """
+    Statistics (in ms, and operations per second) of a list of durations in seconds.
+    """
+    my_sorted = sorted(durations)
+    my_elapsed = elapsed if elapsed is not None else sum(durations)
+    return {
+        "name": name,
+        "iterations": len(durations),
+        "ops_per_s": round(len(durations) / my_elapsed, 1) if my_elapsed else 0.0,
+        "mean_ms": round(statistics.mean(durations) * 1000, 4) if durations else 0.0,
+        "p50_ms": round(percentile(my_sorted, 50) * 1000, 4),
+        "p95_ms": round(percentile(my_sorted, 95) * 1000, 4),
+        "p99_ms": round(percentile(my_sorted, 99) * 1000, 4),
+        "max_ms": round(my_sorted[-1] * 1000, 4) if my_sorted else 0.0,
+    }
+
+
+def measure(name, operation, iterations, warmup=None, setup=None):
+    """
+    Run operation(i) iterations times (after warmup runs) and summarize.
+    setup(i), when given, runs before each call and is not timed.
+    """
+    warmup = min(iterations // 10, 100) if warmup is None else warmup
+    for i in range(warmup):
+        if setup:
+            setup(i)
+        operation(i)
+    durations = []
+    for i in range(warmup, warmup + iterations):
+        if setup:
+            setup(i)
+        start = time.perf_counter()
+        operation(i)
+        durations.append(time.perf_counter() - start)
+    return summarize(name, durations)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(path, suite, results, parameters=None):
+    data = {
+        "suite": suite,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "parameters": parameters or {},
+        "results": results,
+    }
+    with open(path, "w") as my_file:
+        json.dump(data, my_file, indent=1)
+        my_file.write("\n")
+
+
+def load_results(path):
+    with open(path) as my_file:
+        return json.load(my_file)
+
+
+def _change(new, old):
+    if not old:
+        return ""
+    return "{:+.1f}%".format((new - old) * 100.0 / old)
+
+
+def print_results(results, baseline=None):
+    """
+    Print a table of the results, with the changes relative to baseline (loaded results).
+    """
+    old = {item["name"]: item for item in (baseline or {}).get("results", [])}
+    header = "{:44s} {:>8s} {:>10s} {:>10s} {:>10s} {:>10s}".format(
+        "operation", "iters", "ops/s", "mean ms", "p95 ms", "p99 ms")
+    if old:
+        header += " {:>9s} {:>9s} {:>9s}".format("d ops/s", "d mean", "d p99")
+    print(header)
+    for item in results:
+        line = "{name:44s} {iterations:8d} {ops_per_s:10.1f} {mean_ms:10.3f} {p95_ms:10.3f} {p99_ms:10.3f}".format(**item)
+        if item["name"] in old:
+            before = old[item["name"]]
+            line += " {:>9s} {:>9s} {:>9s}".format(
+                _change(item["ops_per_s"], before["ops_per_s"]),
+                _change(item["mean_ms"], before["mean_ms"]),
+                _change(item["p99_ms"], before["p99_ms"]))
+        print(line)
+
+
+def add_result_arguments(parser):
+    parser.add_argument("--save", metavar="PATH", help="save the results as JSON")
+    parser.add_argument("--baseline", metavar="PATH", help="compare with results saved by an earlier run")
@@ -0,0 +1,264 @@
+"""
+Load test simulating learner sessions against the stub renderer.
+
+Each simulated learner works through a unit of --problems problems. For each
+problem it loads the problem (initialLoad), then makes a few attempts, each
+one optionally preceded by previews, and sometimes asks for the correct
+answers at the end. Learners think between actions (exponentially distributed
+around --think-time). All calls go through submit_webwork_iframed of a block
+bound to the learner, and the renderer calls go over HTTP to a stub renderer
+(stub_renderer.py) started in this process.
+
+Learners arrive spread over --duration seconds. With a deadline surge,
+--surge-learners more arrive during the last --surge-window seconds before
+the deadline (the end of --duration), and think --surge-think-factor times
+faster, as learners do just before an exam deadline.
+
+--time-scale compresses all the waiting (think times and arrivals), so a one
+hour session can be simulated in a minute. The renderer latency is not scaled.
+
+Reported per action: throughput, p50/p95/p99 latency, renderer calls per
+action (calls which reached the stub renderer, so render cache hits and
+retries show up), DB writes per action (field data writes, each a database
+write in the LMS: the block is saved after each handler call, as the LMS
+runtime does) and grade events per action, and the block saves which the
+dirty tracking of the user state avoided (see webwork/persistence.py).
+
+Run from the repository root, inside the LMS virtual environment:
+
+    DJANGO_SETTINGS_MODULE=lms.envs.test python -m benchmarks.load_test \\
+        [--learners 200] [--problems 5] [--think-time 30] [--duration 3600] \\
+        [--surge-learners 300] [--surge-window 600] [--time-scale 0.01] \\
+        [--latency lognormal:0.2:0.5] [--error-rate 0.01] [--workers 64] \\
+        [--save results.json] [--baseline old-results.json]
+"""
+import argparse
+import copy
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import harness, support
+from benchmarks.stub_renderer import start_stub_renderer
+
+ACTIONS = ("initialLoad", "previewAnswers", "submitAnswers", "showCorrectAnswers")
+
+# Bounds of the simulated behavior of a learner on one problem
+MAX_ATTEMPTS = 10
+MAX_PREVIEWS = 3 # before each submission
+
+# Paths of the two renderer APIs on the stub
+STUB_PATHS = {"standalone": "/render-api", "html2xml": "/webwork2/html2xml"}
+
+
+class LoadStats:
+    """
+    Thread safe collection of the per action measurements.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {action: [] for action in ACTIONS}
+        self.writes = {action: 0 for action in ACTIONS}
+        self.grade_events = {action: 0 for action in ACTIONS}
+        self.failures = {action: 0 for action in ACTIONS}
+        self.timeline = [] # perf_counter() at the end of each action
+
+    def record(self, action, finished, duration, writes, grade_events, ok):
+        with self._lock:
+            self.durations[action].append(duration)
+            self.writes[action] += writes
+            self.grade_events[action] += grade_events
+            if not ok:
+                self.failures[action] += 1
+            self.timeline.append(finished)
+
+
+def learner_plan(rng, args):
+    """
+    The actions of one learner on one problem.
+    """
+    my_plan = ["initialLoad"]
+    my_attempts = 1
+    while my_attempts < MAX_ATTEMPTS and rng.random() < 1.0 - 1.0 / max(args.attempts, 1.0):
+        my_attempts += 1
+    for _ in range(my_attempts):
+        my_previews = 0
+        while my_previews < MAX_PREVIEWS and rng.random() < args.preview_rate:
+            my_plan.append("previewAnswers")
+            my_previews += 1
+        my_plan.append("submitAnswers")
+    if rng.random() < args.show_answers_rate:
+        my_plan.append("showCorrectAnswers")
+    return my_plan
+
+
+def make_answers(rng, args):
+    """
+    Submitted answers, each correct with probability --correct-rate.
+    """
+    return {key: value if rng.random() < args.correct_rate else str(rng.randint(-9, 9))
+            for key, value in support.ANSWERS.items()}
+
+
+def run_learner(learner, start_at, surge, args, webwork_settings, stats, clock_start):
+    rng = random.Random(args.seed * 100003 + learner)
+    think_time = args.think_time * (args.surge_think_factor if surge else 1.0)
+
+    def wait_until(moment):
+        my_delay = clock_start + moment * args.time_scale - time.monotonic()
+        if my_delay > 0:
+            time.sleep(my_delay)
+
+    wait_until(start_at)
+    my_now = start_at
+    runtime = support.FakeRuntime(webwork_settings=webwork_settings)
+    for problem in range(args.problems):
+        block = support.make_block(
+            args.server_type, runtime=runtime, student="learner{n}".format(n=learner),
+            block_name="unit_problem{n}".format(n=problem),
+            problem="Bench/Unit/problem{n}.pg".format(n=problem),
+            seed=rng.randint(1, 2 ** 31 - 1))
+        field_data = block._field_data # pylint: disable=protected-access
+        for action in learner_plan(rng, args):
+            my_now += rng.expovariate(1.0 / think_time) if think_time > 0 else 0.0
+            wait_until(my_now)
+            data = support.submit_data(args.server_type, action)
+            if action != "initialLoad":
+                data.update(make_answers(rng, args))
+            writes_before, events_before = field_data.writes, len(runtime.published)
+            started = time.perf_counter()
+            try:
+                response = block.submit_webwork_iframed(support.make_request(data))
+                ok = response.status_code == 200 and bool(response.json_body.get("success"))
+            except Exception: # Counted as a failure, the session continues
+                ok = False
+            try:
+                block.save() # As the LMS runtime does after each handler call
+            except Exception:
+                ok = False
+            finished = time.perf_counter()
+            stats.record(action, finished, finished - started, field_data.writes - writes_before,
+                         len(runtime.published) - events_before, ok)
+
+
+def arrival_schedule(args):
+    """
+    (learner number, arrival time in simulated seconds, in surge) for every learner.
+    """
+    rng = random.Random(args.seed)
+    my_schedule = [(n, rng.uniform(0, args.duration), False) for n in range(args.learners)]
+    my_surge_start = max(args.duration - args.surge_window, 0)
+    my_schedule += [(args.learners + n, rng.uniform(my_surge_start, args.duration), True)
+                    for n in range(args.surge_learners)]
+    return sorted(my_schedule, key=lambda item: item[1])
+
+
+def course_settings_for_stub(server_type, base_url):
+    my_settings = copy.deepcopy(support.WEBWORK_SETTINGS)
+    my_server = my_settings["server_settings"][support.SERVER_IDS[server_type]]
+    my_server["server_api_url"] = base_url + STUB_PATHS[server_type]
+    return my_settings
+
+
+def print_timeline(timeline, started, buckets=10):
+    if not timeline:
+        return
+    my_span = max(timeline) - started
+    my_width = my_span / buckets or 1.0
+    my_counts = [0] * buckets
+    for moment in timeline:
+        my_counts[min(int((moment - started) / my_width), buckets - 1)] += 1
+    print("\nThroughput over the run ({w:.1f}s per bucket):".format(w=my_width))
+    for index, count in enumerate(my_counts):
+        print("  {s:8.1f}s {rate:9.1f} actions/s {bar}".format(
+            s=index * my_width, rate=count / my_width, bar="#" * int(60 * count / max(my_counts))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--server-type", choices=sorted(support.SERVER_IDS), default="standalone")
+    parser.add_argument("--learners", type=int, default=200)
+    parser.add_argument("--problems", type=int, default=5, help="problems per unit")
+    parser.add_argument("--attempts", type=float, default=2.0, help="mean submissions per problem")
+    parser.add_argument("--preview-rate", type=float, default=0.5, help="chance of a(nother) preview before a submission")
+    parser.add_argument("--show-answers-rate", type=float, default=0.3)
+    parser.add_argument("--correct-rate", type=float, default=0.7, help="chance each submitted answer is correct")
+    parser.add_argument("--think-time", type=float, default=30.0, help="mean seconds between actions")
+    parser.add_argument("--duration", type=float, default=3600.0, help="seconds over which learners arrive")
+    parser.add_argument("--surge-learners", type=int, default=0, help="extra learners arriving just before the deadline")
+    parser.add_argument("--surge-window", type=float, default=600.0)
+    parser.add_argument("--surge-think-factor", type=float, default=0.5)
+    parser.add_argument("--time-scale", type=float, default=0.01, help="factor applied to all waiting")
+    parser.add_argument("--workers", type=int, default=64, help="learners simulated at the same time")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency", default="lognormal:0.2:0.5", help="stub renderer latency, see stub_renderer.py")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--payload-bytes", type=int, default=0)
+    harness.add_result_arguments(parser)
+    args = parser.parse_args()
+
+    support.setup_django()
+    from webwork.persistence import user_state_write_stats
+    server = start_stub_renderer({
+        "latency": args.latency, "error_rate": args.error_rate,
+        "hang_rate": args.hang_rate, "payload_bytes": args.payload_bytes})
+    webwork_settings = course_settings_for_stub(args.server_type, server.base_url)
+    stats = LoadStats()
+    schedule = arrival_schedule(args)
+    user_state_write_stats.reset()
+
+    print("Simulating {n} learners x {p} problems ({s} in the deadline surge) on {url}".format(
+        n=len(schedule), p=args.problems, s=args.surge_learners, url=server.base_url))
+    clock_start = time.monotonic()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(run_learner, learner, start_at, surge, args, webwork_settings, stats, clock_start)
+                   for learner, start_at, surge in schedule]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - started
+    stub_stats = server.stats_snapshot()
+    server.shutdown()
+
+    results = []
+    total = 0
+    for action in ACTIONS:
+        count = len(stats.durations[action])
+        if not count:
+            continue
+        total += count
+        my_result = harness.summarize(action, stats.durations[action], elapsed)
+        my_result.update({
+            "failures": stats.failures[action],
+            "renderer_calls_per_action": round(
+                stub_stats.get("{t}.{a}".format(t=args.server_type, a=action), 0) / count, 3),
+            "db_writes_per_action": round(stats.writes[action] / count, 3),
+            "grade_events_per_action": round(stats.grade_events[action] / count, 3),
+        })
+        results.append(my_result)
+
+    baseline = harness.load_results(args.baseline) if args.baseline else None
+    harness.print_results(results, baseline)
+    print("\n{:44s} {:>9s} {:>15s} {:>12s} {:>12s}".format(
+        "action", "failures", "renderer calls", "DB writes", "grade events"))
+    for item in results:
+        print("{name:44s} {failures:9d} {renderer_calls_per_action:15.3f} {db_writes_per_action:12.3f} "
+              "{grade_events_per_action:12.3f}".format(**item))
+    print("\n{total} actions in {elapsed:.1f}s: {rate:.1f} actions/s, {calls} renderer calls, stub faults: {faults}".format(
+        total=total, elapsed=elapsed, rate=total / elapsed, calls=stub_stats.get("requests", 0),
+        faults={key: value for key, value in stub_stats.items() if key.startswith("fault.")} or "none"))
+    save_stats = user_state_write_stats.stats()
+    print("User state saves: {writes} written, {avoided} avoided (nothing changed), {skipped} unchanged fields skipped".format(
+        writes=save_stats["writes"], avoided=save_stats["writes_avoided"], skipped=save_stats["fields_skipped"]))
+    print_timeline(stats.timeline, started)
+
+    if args.save:
+        parameters = {key: value for key, value in vars(args).items() if key not in ("save", "baseline")}
+        parameters["user_state_saves"] = save_stats
+        harness.save_results(args.save, "load_test", results, parameters)
+
+
+if __name__ == "__main__":
+    main()
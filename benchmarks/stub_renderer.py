@@ -0,0 +1,337 @@
+"""
+Local stand-in for the WeBWorK renderers, for load and latency testing.
+
+A threaded HTTP server on 127.0.0.1 which speaks both renderer APIs:
+
+  * POST .../render-api - Standalone. The problemJWT is decrypted with the key
+    built from "secret" exactly as the XBlock builds it (webwork.jwt_cache),
+    and its header and claims are checked: the audience, problemSeed, psvn and
+    sourceFilePath, the STANDALONE_ADD_INTO_JWT values and every
+    STANDALONE_MOVE_INTO_JWT key. A bad token gets HTTP 403.
+  * POST .../html2xml - html2xml. courseID, userID and course_password must
+    match, and problemSeed, psvn and sourceFilePath must be sent (HTTP 403 otherwise).
+
+Replies are built from the fixtures of the benchmarks (see support.py): the
+submitted AnSwEr* values are echoed in form_data, flags.KEPT_EXTRA_ANSWERS and
+answers, and problem_result.score is the fraction of them equal to
+support.ANSWERS. renderedHTML is padded to "payload_bytes" when set.
+
+Injected faults, each drawn per request:
+  * latency      - "fixed:S", "uniform:MIN:MAX", "lognormal:MEDIAN:SIGMA" or "pareto:MIN:ALPHA"
+                   (seconds), multiplied by "slow_factor" for problems whose path
+                   contains "slow_problem"
+  * error_rate   - HTTP "error_status" (default 500)
+  * bad_json_rate - HTTP 200 with a body which is not JSON
+  * hang_rate    - no reply for "hang_seconds", so the client times out
+  * drop_rate    - the connection is closed without a reply
+
+The settings can be changed while the server runs (to start an outage in the
+middle of a test) by posting a JSON object to /__stub__/settings, and the
+counters are served as JSON by GET /__stub__/stats.
+
+Run from the repository root, inside the LMS virtual environment:
+
+    python -m benchmarks.stub_renderer [--port 3000] [--latency lognormal:0.15:0.6] \\
+        [--error-rate 0.01] [--hang-rate 0.001] [--payload-bytes 40000]
+
+and point a server_api_url at http://127.0.0.1:3000/render-api (Standalone)
+or http://127.0.0.1:3000/webwork2/html2xml (html2xml). The settings of the
+benchmark courses (support.WEBWORK_SETTINGS) use the same secret and credentials.
+
+In-process use (as the load test does): start_stub_renderer(settings) returns
+the server, whose base_url attribute is its http://127.0.0.1:<port> address.
+"""
+import argparse
+import json
+import math
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+from jwcrypto import jwt
+
+from webwork.jwt_cache import JWT_HEADER, ProblemJWTFactory
+from webwork.render_requests import STANDALONE_ADD_INTO_JWT, STANDALONE_MOVE_INTO_JWT
+
+from benchmarks import support
+
+DEFAULT_STUB_SETTINGS = {
+    "secret": support.SECRET,
+    "audience": "http://standalone.bench.invalid:3000",
+    "ww_course": "daemon_course",
+    "ww_username": "daemon",
+    "ww_password": "daemon_password",
+    "latency": "fixed:0",
+    "slow_problem": None, # substring of sourceFilePath
+    "slow_factor": 10.0,
+    "error_rate": 0.0,
+    "error_status": 500,
+    "bad_json_rate": 0.0,
+    "hang_rate": 0.0,
+    "hang_seconds": 60.0,
+    "drop_rate": 0.0,
+    "payload_bytes": 0, # minimum size of renderedHTML, 0 keeps the fixture size
+}
+
+# Claims which must be in every problemJWT, besides the STANDALONE_MOVE_INTO_JWT keys
+REQUIRED_CLAIMS = ("aud", "problemSeed", "psvn", "sourceFilePath")
+HTML2XML_REQUIRED = ("problemSeed", "psvn", "sourceFilePath")
+
+ACTION_KEYS = (
+    ("submitAnswers", "submitAnswers"), ("WWsubmit", "submitAnswers"),
+    ("previewAnswers", "previewAnswers"), ("preview", "previewAnswers"),
+    ("showCorrectAnswers", "showCorrectAnswers"), ("WWcorrectAns", "showCorrectAnswers"),
+)
+
+
+def parse_latency(spec):
+    """
+    A function returning latencies in seconds, from a "kind:arg:arg" specification.
+    """
+    my_kind, _, my_args = str(spec).partition(":")
+    my_values = [float(v) for v in my_args.split(":")] if my_args else []
+    if my_kind == "fixed" and len(my_values) == 1:
+        return lambda: my_values[0]
+    if my_kind == "uniform" and len(my_values) == 2:
+        return lambda: random.uniform(my_values[0], my_values[1])
+    if my_kind == "lognormal" and len(my_values) == 2:
+        return lambda: random.lognormvariate(math.log(my_values[0]), my_values[1])
+    if my_kind == "pareto" and len(my_values) == 2:
+        return lambda: my_values[0] * random.paretovariate(my_values[1])
+    raise ValueError("Bad latency specification: {spec}".format(spec=spec))
+
+
+class ReplyBuilder:
+    """
+    Builds the JSON replies of one renderer type from the fixtures.
+    """
+    def __init__(self, server_type):
+        if server_type == "standalone":
+            self.initial = support.load_fixture("standalone_initial.json")
+            self.submitted = support.load_fixture("standalone_submit.json")
+        else:
+            self.initial = support.html2xml_reply(False)
+            self.submitted = support.html2xml_reply(True)
+        self.answer_template = next(iter(self.submitted["answers"].values()), {})
+
+    def build(self, action, form, seed, payload_bytes):
+        my_reply = dict(self.initial if action == "initialLoad" else self.submitted)
+        my_answers = {key: value for key, value in form.items() if key.startswith("AnSwEr")}
+        my_reply["form_data"] = dict(my_reply.get("form_data", {}), problemSeed=str(seed), **my_answers)
+        my_reply["flags"] = dict(my_reply.get("flags", {}),
+                                 KEPT_EXTRA_ANSWERS=sorted(set(support.ANSWERS) | set(my_answers)))
+        if action != "initialLoad":
+            my_correct = {key for key, value in my_answers.items() if support.ANSWERS.get(key) == value.strip()}
+            my_reply["answers"] = {
+                key: dict(self.answer_template, ans_name=key, ans_label=key, student_value=value,
+                          original_student_ans=value, correct_value=support.ANSWERS.get(key, ""),
+                          score=1 if key in my_correct else 0)
+                for key, value in my_answers.items()}
+            my_score = len(my_correct) / len(support.ANSWERS)
+            my_reply["problem_result"] = dict(my_reply.get("problem_result", {}), score=my_score)
+        my_html = my_reply["renderedHTML"]
+        if payload_bytes and len(my_html) < payload_bytes:
+            my_reply["renderedHTML"] = my_html + "<!--" + "x" * (payload_bytes - len(my_html) - 7) + "-->"
+        return json.dumps(my_reply).encode("utf8")
+
+
+class StubRendererServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, stub_settings=None):
+        super().__init__(address, StubRendererHandler)
+        self._lock = threading.Lock()
+        self.stats = {}
+        self.stub_settings = dict(DEFAULT_STUB_SETTINGS)
+        self.latency = None
+        self.update_settings(stub_settings or {})
+        self.keys = ProblemJWTFactory()
+        self.replies = {"standalone": ReplyBuilder("standalone"), "html2xml": ReplyBuilder("html2xml")}
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:{port}".format(port=self.server_address[1])
+
+    def update_settings(self, changes):
+        my_settings = dict(self.stub_settings)
+        my_settings.update(changes)
+        self.latency = parse_latency(my_settings["latency"])
+        self.stub_settings = my_settings
+
+    def count(self, *names):
+        with self._lock:
+            for name in names:
+                self.stats[name] = self.stats.get(name, 0) + 1
+
+    def handle_error(self, request, client_address):
+        # Clients which gave up (timeouts) and dropped connections are expected here
+        self.count("connection_errors")
+
+    def stats_snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def check_jwt(self, token):
+        """
+        The claims of a valid problemJWT, or raise ValueError.
+        """
+        my_settings = self.stub_settings
+        my_key, _ = self.keys.get_key("stub", my_settings["secret"])
+        try:
+            my_token = jwt.JWT(jwt=token, key=my_key)
+        except Exception as err:
+            raise ValueError("cannot decrypt problemJWT: {err}".format(err=err))
+        my_header = json.loads(my_token.header)
+        if {key: my_header.get(key) for key in JWT_HEADER} != JWT_HEADER:
+            raise ValueError("unexpected JWT header {h}".format(h=my_header))
+        my_claims = json.loads(my_token.claims)
+        my_missing = [key for key in REQUIRED_CLAIMS + tuple(STANDALONE_MOVE_INTO_JWT) if key not in my_claims]
+        if my_missing:
+            raise ValueError("missing claims {m}".format(m=my_missing))
+        if my_claims["aud"] != my_settings["audience"]:
+            raise ValueError("unexpected audience {a}".format(a=my_claims["aud"]))
+        for key, value in STANDALONE_ADD_INTO_JWT.items():
+            if my_claims.get(key) != value:
+                raise ValueError("claim {k} must be {v!r}".format(k=key, v=value))
+        return my_claims
+
+    def check_html2xml(self, form):
+        my_settings = self.stub_settings
+        if (form.get("courseID"), form.get("userID"), form.get("course_password")) != (
+                my_settings["ww_course"], my_settings["ww_username"], my_settings["ww_password"]):
+            raise ValueError("bad course credentials")
+        my_missing = [key for key in HTML2XML_REQUIRED if not form.get(key)]
+        if my_missing:
+            raise ValueError("missing {m}".format(m=my_missing))
+        return form
+
+
+class StubRendererHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, like the real renderers behind a proxy
+
+    def log_message(self, *args): # Keep the output readable
+        pass
+
+    def _reply(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._reply(status, json.dumps({"error": message}).encode("utf8"))
+
+    def do_GET(self): # pylint: disable=invalid-name
+        if self.path.startswith("/__stub__/stats"):
+            self._reply(200, json.dumps(self.server.stats_snapshot()).encode("utf8"))
+        elif self.path.startswith("/__stub__/settings"):
+            self._reply(200, json.dumps(self.server.stub_settings).encode("utf8"))
+        else:
+            self._error(404, "not found")
+
+    def do_POST(self): # pylint: disable=invalid-name
+        my_body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        my_path = self.path.split("?", 1)[0].rstrip("/")
+        if my_path == "/__stub__/settings":
+            try:
+                self.server.update_settings(json.loads(my_body.decode("utf8")))
+            except (ValueError, KeyError) as err:
+                self._error(400, str(err))
+                return
+            self._reply(200, json.dumps(self.server.stub_settings).encode("utf8"))
+            return
+        if my_path.endswith("render-api"):
+            my_type = "standalone"
+        elif my_path.endswith("html2xml"):
+            my_type = "html2xml"
+        else:
+            self._error(404, "not found")
+            return
+        self.render(my_type, dict(parse_qsl(my_body.decode("utf8"), keep_blank_values=True)))
+
+    def render(self, server_type, form):
+        my_server = self.server
+        my_settings = my_server.stub_settings
+        my_action = next((action for key, action in ACTION_KEYS if key in form), "initialLoad")
+        my_server.count("requests", server_type + "." + my_action)
+        try:
+            if server_type == "standalone":
+                my_values = my_server.check_jwt(form.get("problemJWT", ""))
+            else:
+                my_values = my_server.check_html2xml(form)
+        except ValueError as err:
+            my_server.count("rejected")
+            self._error(403, str(err))
+            return
+
+        my_latency = my_server.latency()
+        if my_settings["slow_problem"] and my_settings["slow_problem"] in str(my_values.get("sourceFilePath")):
+            my_latency *= my_settings["slow_factor"]
+
+        # One draw decides which fault (if any) hits this request
+        my_draw = random.random()
+        for my_fault in ("drop", "hang", "error", "bad_json"):
+            my_rate = my_settings[my_fault + "_rate"]
+            if my_draw < my_rate:
+                break
+            my_draw -= my_rate
+        else:
+            my_fault = None
+        if my_fault:
+            my_server.count("fault." + my_fault)
+
+        if my_fault == "drop":
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        time.sleep(my_settings["hang_seconds"] if my_fault == "hang" else max(my_latency, 0.0))
+        if my_fault == "error":
+            self._error(my_settings["error_status"], "injected error")
+        elif my_fault == "bad_json":
+            self._reply(200, b"<html><body>Internal error</body></html>", "text/html")
+        else:
+            self._reply(200, my_server.replies[server_type].build(
+                my_action, form, my_values.get("problemSeed"), my_settings["payload_bytes"]))
+
+
+def start_stub_renderer(stub_settings=None, port=0):
+    """
+    Start a stub renderer in a background thread, and return the server.
+    """
+    server = StubRendererServer(("127.0.0.1", port), stub_settings)
+    threading.Thread(target=server.serve_forever, name="stub-renderer", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--latency", default=DEFAULT_STUB_SETTINGS["latency"],
+                        help="fixed:S, uniform:MIN:MAX, lognormal:MEDIAN:SIGMA or pareto:MIN:ALPHA (seconds)")
+    parser.add_argument("--slow-problem", help="problems whose path contains this are slower")
+    parser.add_argument("--slow-factor", type=float, default=DEFAULT_STUB_SETTINGS["slow_factor"])
+    for name in ("error_rate", "bad_json_rate", "hang_rate", "drop_rate"):
+        parser.add_argument("--" + name.replace("_", "-"), type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=DEFAULT_STUB_SETTINGS["error_status"])
+    parser.add_argument("--hang-seconds", type=float, default=DEFAULT_STUB_SETTINGS["hang_seconds"])
+    parser.add_argument("--payload-bytes", type=int, default=0)
+    parser.add_argument("--secret", default=DEFAULT_STUB_SETTINGS["secret"])
+    parser.add_argument("--audience", default=DEFAULT_STUB_SETTINGS["audience"])
+    args = parser.parse_args()
+
+    my_settings = {key: value for key, value in vars(args).items() if key != "port"}
+    server = StubRendererServer(("127.0.0.1", args.port), my_settings)
+    print("Stub renderer on {url}/render-api and {url}/webwork2/html2xml".format(url=server.base_url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(server.stats_snapshot(), indent=1, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Running WeBWorK blocks outside of the LMS, for the benchmarks and load tests.
+
+  * FakeRuntime - the few runtime features the block uses (i18n service,
+    course_id, modulestore().get_course() for the "Other course settings",
+    publish(), resource and handler URLs). Grade events are kept in a list.
+  * CountingFieldData - DictFieldData counting the writes, each of which would
+    be a database write in the LMS.
+  * CannedRendererAdapter - a requests transport adapter answering the renderer
+    calls with canned JSON (no network), mounted on the pooled session of the
+    renderer URL, so the whole request path of the block is used. For real
+    HTTP calls, with latency and faults, use stub_renderer.py instead.
+  * Fixtures: the recorded Standalone replies in benchmarks/fixtures/, and an
+    html2xml reply built from webwork/sample.json.
+
+The block modules import edx-platform code, so they must run inside the LMS
+virtual environment, with DJANGO_SETTINGS_MODULE set (for example to
+lms.envs.test).
+"""
+import ast
+import datetime
+import json
+import os
+from urllib.parse import parse_qsl
+
+import requests
+from requests.adapters import BaseAdapter
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+SAMPLE_JSON = os.path.join(os.path.dirname(os.path.dirname(__file__)), "webwork", "sample.json")
+
+COURSE_ID = "course-v1:Bench+WeBWorK+2024"
+STANDALONE_URL = "http://standalone.bench.invalid:3000/render-api"
+HTML2XML_URL = "http://webwork.bench.invalid/webwork2/html2xml"
+SECRET = "AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA"
+PROBLEM = "Technion/LinAlg/Matrices/en/SplitAsUpperLower.pg"
+
+WEBWORK_SETTINGS = {
+    "server_settings": {
+        "BenchStandalone": {
+            "server_type": "standalone",
+            "server_api_url": STANDALONE_URL,
+            "auth_data": {
+                "aud": "http://standalone.bench.invalid:3000",
+                "problemJWTsecret": SECRET,
+            },
+        },
+        "BenchHtml2xml": {
+            "server_type": "html2xml",
+            "server_api_url": HTML2XML_URL,
+            "server_static_files_url": "http://webwork.bench.invalid/webwork2_files",
+            "auth_data": {
+                "ww_course": "daemon_course",
+                "ww_username": "daemon",
+                "ww_password": "daemon_password",
+            },
+        },
+    },
+    "course_defaults": {
+        "default_server": "BenchStandalone",
+        "psvn_shift": 51,
+    },
+}
+
+SERVER_IDS = {
+    "standalone": "BenchStandalone",
+    "html2xml": "BenchHtml2xml",
+}
+
+# Answers submitted by the benchmarks (the problem of the fixtures has 9 answer blanks)
+ANSWERS = {"AnSwEr%04d" % n: value for n, value in enumerate(("0", "4", "-6", "5", "0", "0", "0", "1", "0"), 1)}
+
+# Submit types as sent by the JS code, per server type
+SUBMIT_TYPES = {
+    "standalone": {
+        "initialLoad": "initialLoad",
+        "previewAnswers": "previewAnswers",
+        "submitAnswers": "submitAnswers",
+        "showCorrectAnswers": "showCorrectAnswers",
+    },
+    "html2xml": {
+        "initialLoad": "initialLoad",
+        "previewAnswers": "preview",
+        "submitAnswers": "WWsubmit",
+        "showCorrectAnswers": "WWcorrectAns",
+    },
+}
+
+
+def setup_django():
+    """
+    Set up Django (DJANGO_SETTINGS_MODULE must point to LMS settings).
+    """
+    import django
+    if not os.environ.get("DJANGO_SETTINGS_MODULE"):
+        raise SystemExit("Set DJANGO_SETTINGS_MODULE to the LMS settings (for example lms.envs.test)")
+    django.setup()
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name)) as my_file:
+        return json.load(my_file)
+
+
+# Parts of sample.json only present in the reply to a submission
+HTML2XML_RESULT_PARTS = ("body_part300", "body_part650")
+
+
+def html2xml_reply(submitted=False):
+    """
+    An html2xml (standalone_style=1) reply, with the problem HTML assembled from
+    the head_part* / body_part* entries of webwork/sample.json.
+    """
+    with open(SAMPLE_JSON) as my_file:
+        sample = ast.literal_eval(my_file.read())
+    parts = [sample[key] for key in sorted(k for k in sample if k.startswith("head_part"))]
+    parts += [sample[key] for key in sorted(k for k in sample if k.startswith("body_part"))
+              if submitted or key not in HTML2XML_RESULT_PARTS]
+    html = "".join(parts)
+    html = html.replace("TO_SET_LATER_SITE_URL", sample["real_webwork_SITE_URL"])
+    html = html.replace("TO_SET_LATER_FORM_ACTION_URL", sample["real_webwork_FORM_ACTION_URL"])
+    form_data = {key[len("hidden_input_field_"):]: value for key, value in sample.items()
+                 if key.startswith("hidden_input_field_")}
+    if submitted:
+        form_data.update(ANSWERS)
+    return {
+        "renderedHTML": html,
+        "form_data": form_data,
+        "flags": {"KEPT_EXTRA_ANSWERS": list(ANSWERS)},
+        "answers": {} if not submitted else {
+            name: {"ans_label": name, "ans_name": name, "student_value": value, "correct_value": value,
+                   "original_student_ans": value, "score": 1, "type": "Value (Real)"}
+            for name, value in ANSWERS.items()},
+        "problem_result": {"score": float(sample.get("score", 0)) if submitted else 0},
+    }
+
+
+class CannedReplies:
+    """
+    The encoded canned replies of a server type, chosen by the posted form data.
+    """
+    SUBMIT_KEYS = ("submitAnswers", "previewAnswers", "showCorrectAnswers", "WWsubmit", "preview", "WWcorrectAns")
+
+    def __init__(self, server_type):
+        if server_type == "standalone":
+            initial, submitted = load_fixture("standalone_initial.json"), load_fixture("standalone_submit.json")
+        else:
+            initial, submitted = html2xml_reply(False), html2xml_reply(True)
+        self.initial = json.dumps(initial).encode("utf8")
+        self.submitted = json.dumps(submitted).encode("utf8")
+        self.calls = 0
+
+    def __call__(self, form):
+        self.calls += 1
+        if any(key in form for key in self.SUBMIT_KEYS):
+            return 200, self.submitted
+        return 200, self.initial
+
+
+class CannedRendererAdapter(BaseAdapter):
+    """
+    requests transport adapter answering with responder(form_data) -> (status, body).
+    """
+    def __init__(self, responder):
+        super().__init__()
+        self.responder = responder
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        body = request.body or ""
+        if isinstance(body, bytes):
+            body = body.decode("utf8")
+        status, content = self.responder(dict(parse_qsl(body)))
+        response = requests.Response()
+        response.status_code = status
+        response._content = content # pylint: disable=protected-access
+        response.headers["Content-Type"] = "application/json"
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def install_canned_renderer(server_type, responder=None):
+    """
+    Mount a CannedRendererAdapter on the pooled session of the server URL.
+    Returns the responder (a CannedReplies by default).
+    """
+    from webwork.renderer_client import pool_settings_from_server_settings, renderer_clients
+    responder = responder or CannedReplies(server_type)
+    server_settings = WEBWORK_SETTINGS["server_settings"][SERVER_IDS[server_type]]
+    url = server_settings["server_api_url"]
+    session = renderer_clients.get_session(url, pool_settings_from_server_settings(server_settings))
+    session.mount(url, CannedRendererAdapter(responder))
+    return responder
+
+
+class FakeI18nService:
+    def ugettext(self, text):
+        return text
+
+    gettext = ugettext
+
+    def ngettext(self, singular, plural, count):
+        return singular if count == 1 else plural
+
+    ungettext = ngettext
+
+
+class FakeCourse:
+    def __init__(self, webwork_settings):
+        self.other_course_settings = {"webwork_settings": webwork_settings}
+
+
+class FakeModulestore:
+    def __init__(self, webwork_settings):
+        self.course = FakeCourse(webwork_settings)
+
+    def get_course(self, course_id):
+        return self.course
+
+
+class FakeRuntime:
+    """
+    The runtime features used by WeBWorKXBlock.
+    """
+    def __init__(self, course_id=COURSE_ID, webwork_settings=None, user_is_staff=False):
+        self.course_id = course_id
+        self.modulestore = FakeModulestore(webwork_settings or WEBWORK_SETTINGS)
+        self.user_is_staff = user_is_staff
+        self.anonymous_student_id = "bench-anonymous-id"
+        self.published = []
+        self._services = {"i18n": FakeI18nService()}
+
+    def service(self, block, service_name):
+        return self._services[service_name]
+
+    def publish(self, block, event_type, event_data):
+        self.published.append((event_type, event_data))
+
+    def local_resource_url(self, block, uri):
+        return "/xblock/resource/webwork/" + uri
+
+    def handler_url(self, block, handler_name, suffix='', query='', thirdparty=False):
+        return "/xblock/handler/{name}/{suffix}".format(name=handler_name, suffix=suffix)
+
+
+def counting_field_data_class():
+    from xblock.field_data import DictFieldData
+
+    class CountingFieldData(DictFieldData):
+        """
+        DictFieldData counting the writes (a database write each in the LMS).
+        """
+        def __init__(self, data):
+            super().__init__(data)
+            self.writes = 0
+
+        def set(self, block, name, value):
+            self.writes += 1
+            super().set(block, name, value)
+
+        def set_many(self, block, update_dict):
+            self.writes += 1
+            for name, value in update_dict.items():
+                super().set(block, name, value)
+
+    return CountingFieldData
+
+
+def make_block(server_type="standalone", runtime=None, student="student", block_name="problem1", **fields):
+    """
+    A WeBWorKXBlock bound to student, with no due date and no attempt limit.
+    """
+    from xblock.fields import ScopeIds
+    from webwork.webwork import WeBWorKXBlock
+    from webwork.problem_periods import problem_period_engine
+
+    runtime = runtime or FakeRuntime()
+    # The grading policy is read from the modulestore, which the fake runtime does not have
+    problem_period_engine.grace_period(runtime.course_id, lambda: datetime.timedelta(0))
+    my_fields = {
+        "settings_type": 1,
+        "ww_server_id": SERVER_IDS[server_type],
+        "problem": PROBLEM,
+        "max_attempts": 0,
+        "no_attempt_limit_required_attempts_before_show_answers": 0,
+    }
+    my_fields.update(fields)
+    usage_id = "block-v1:Bench+WeBWorK+2024+type@webwork+block@{name}".format(name=block_name)
+    scope_ids = ScopeIds(student, "webwork", usage_id, usage_id)
+    return WeBWorKXBlock(runtime, field_data=counting_field_data_class()(my_fields), scope_ids=scope_ids)
+
+
+def make_request(data, headers=None):
+    """
+    A webob request like the ones the JS code posts to submit_webwork_iframed.
+    """
+    from webob import Request
+    request = Request.blank("/", method="POST", body=json.dumps(data).encode("utf8"),
+                            content_type="application/json", headers=headers or {})
+    return request
+
+
+def submit_data(server_type, submit_type):
+    """
+    The JSON posted by the JS code for one of the 4 actions.
+    """
+    data = {"submit_type": SUBMIT_TYPES[server_type][submit_type]}
+    if submit_type != "initialLoad":
+        data.update(ANSWERS)
+    return data
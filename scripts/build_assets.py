@@ -0,0 +1,171 @@
+"""
+Build the minified, content-hashed static bundles used by the student view.
+
+The bundles are written into webwork/public/bundles/ together with a
+manifest.json which maps the logical bundle names to the hashed file names.
+In the LMS the files listed in the manifest are served by the bundle view of
+the webwork app (/webwork/bundles/, see webwork/views.py) with
+"Cache-Control: public, max-age=31536000, immutable", which is safe since the
+file names change whenever the content changes. Studio serves them through
+runtime.local_resource_url(). The XBlock falls back to inlining the sources if
+there is no manifest.
+
+iframeResizer is vendored into webwork/public/vendor/ and listed in the
+manifest. When the file is missing it is copied from --iframe-resizer (a local
+copy of the pinned release, e.g. from "npm pack iframe-resizer@4.2.9"), or
+downloaded from the pinned IFRAME_RESIZER_URL. The build fails if that is not
+possible, unless --allow-cdn is given (the student view then loads it from
+the CDN, and logs a warning).
+
+Run from the repository root after changing the JS or CSS sources:
+
+    python scripts/build_assets.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.join(ROOT, "webwork")
+BUNDLES_DIR = os.path.join(PACKAGE, "public", "bundles")
+VENDOR_DIR = os.path.join(PACKAGE, "public", "vendor")
+
+IFRAME_RESIZER_VERSION = "4.2.9"
+IFRAME_RESIZER_URL = "https://cdnjs.cloudflare.com/ajax/libs/iframe-resizer/{v}/iframeResizer.min.js".format(
+    v=IFRAME_RESIZER_VERSION)
+IFRAME_RESIZER_FILE = "iframeResizer-{v}.min.js".format(v=IFRAME_RESIZER_VERSION)
+
+# logical name -> (source path relative to the package, type)
+BUNDLES = {
+    "webwork_in_iframe.js": ("static/js/src/webwork_in_iframe.js", "js"),
+    "webwork.css": ("static/css/webwork.css", "css"),
+}
+
+
+def _strip_block_comments(text):
+    """
+    Remove /* ... */ comments which are not inside a string literal.
+    """
+    out = []
+    i = 0
+    quote = None
+    while i < len(text):
+        c = text[i]
+        if quote:
+            out.append(c)
+            if c == "\\" and i + 1 < len(text):
+                out.append(text[i + 1])
+                i += 1
+            elif c == quote:
+                quote = None
+        elif c in "\"'`":
+            quote = c
+            out.append(c)
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = len(text) if end == -1 else end + 2
+            continue
+        else:
+            out.append(c)
+        i += 1
+    return "".join(out)
+
+
+def minify_js(text):
+    """
+    Conservative JS minification: drop block comments, full line // comments,
+    indentation and blank lines. Code inside a line is never rewritten, so the
+    result behaves exactly like the source.
+    """
+    lines = []
+    for line in _strip_block_comments(text).splitlines():
+        line = line.strip()
+        if not line or line.startswith("//"):
+            continue
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def minify_css(text):
+    text = _strip_block_comments(text)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};:,>])\s*", r"\1", text)
+    return text.replace(";}", "}").strip() + "\n"
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def fetch_iframe_resizer(local_copy=None):
+    target = os.path.join(VENDOR_DIR, IFRAME_RESIZER_FILE)
+    if os.path.exists(target):
+        return target
+    os.makedirs(VENDOR_DIR, exist_ok=True)
+    if local_copy:
+        print("Copying " + local_copy)
+        shutil.copyfile(local_copy, target)
+        return target
+    print("Downloading " + IFRAME_RESIZER_URL)
+    with urllib.request.urlopen(IFRAME_RESIZER_URL, timeout=30) as response, open(target, "wb") as out:
+        shutil.copyfileobj(response, out)
+    return target
+
+
+def build(fetch=True, allow_cdn=False, iframe_resizer=None):
+    vendored = os.path.join(VENDOR_DIR, IFRAME_RESIZER_FILE)
+    if fetch or iframe_resizer:
+        try:
+            vendored = fetch_iframe_resizer(iframe_resizer)
+        except OSError as err:
+            print("Could not vendor iframeResizer ({err}).".format(err=err))
+    # Checked first, so a failed build leaves the current bundles in place
+    if not os.path.exists(vendored):
+        if not allow_cdn:
+            raise SystemExit("{f} is not vendored: run with network access, give --iframe-resizer, "
+                             "or add --allow-cdn".format(f=IFRAME_RESIZER_FILE))
+        print("iframeResizer is not vendored, the CDN copy will be used.")
+
+    os.makedirs(BUNDLES_DIR, exist_ok=True)
+    for name in os.listdir(BUNDLES_DIR):
+        os.remove(os.path.join(BUNDLES_DIR, name))
+    manifest = {}
+    for logical_name, (source, kind) in sorted(BUNDLES.items()):
+        with open(os.path.join(PACKAGE, source), encoding="utf8") as src:
+            text = src.read()
+        data = (minify_js(text) if kind == "js" else minify_css(text)).encode("utf8")
+        base, ext = os.path.splitext(logical_name)
+        file_name = "{base}.{digest}.min{ext}".format(base=base, digest=content_hash(data), ext=ext)
+        with open(os.path.join(BUNDLES_DIR, file_name), "wb") as out:
+            out.write(data)
+        manifest[logical_name] = "public/bundles/" + file_name
+        print("{name}: {before} -> {after} bytes".format(name=file_name, before=len(text.encode("utf8")), after=len(data)))
+
+    if os.path.exists(vendored):
+        manifest["iframeResizer.js"] = "public/vendor/" + IFRAME_RESIZER_FILE
+
+    with open(os.path.join(BUNDLES_DIR, "manifest.json"), "w", encoding="utf8") as out:
+        json.dump(manifest, out, indent=2, sort_keys=True)
+        out.write("\n")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--no-fetch", action="store_true", help="do not download iframeResizer")
+    parser.add_argument("--allow-cdn", action="store_true",
+                        help="build without the vendored iframeResizer (loaded from the CDN)")
+    parser.add_argument("--iframe-resizer", metavar="PATH",
+                        help="local copy of iframeResizer.min.js {v} to vendor".format(v=IFRAME_RESIZER_VERSION))
+    args = parser.parse_args()
+    build(fetch=not args.no_fetch, allow_cdn=args.allow_cdn, iframe_resizer=args.iframe_resizer)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
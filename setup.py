@@ -61,12 +61,21 @@ setup(
     ],
     packages=[
         'webwork',
+        'webwork.management',
+        'webwork.management.commands',
+        'webwork.migrations',
     ],
     install_requires=load_requirements('requirements/base.in'),
     entry_points={
         'xblock.v1': [
             'webwork = webwork:WeBWorKXBlock',
-        ]
+        ],
+        'lms.djangoapp': [
+            'webwork = webwork.apps:WeBWorKAppConfig',
+        ],
+        'cms.djangoapp': [
+            'webwork = webwork.apps:WeBWorKAppConfig',
+        ],
     },
     package_data=package_data("webwork", ["static", "public", "translations"]),
 )
@@ -0,0 +1,39 @@
+"""
+Configuration of the unit tests, which run without the LMS: Django only gets
+the settings the tested modules read.
+"""
+import django
+import pytest
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    )
+    django.setup()
+
+
+class FakeClock:
+    """
+    A monotonic clock which only moves when told to.
+    """
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture(autouse=True)
+def clear_django_cache():
+    from django.core.cache import caches # pylint: disable=import-outside-toplevel
+    caches["default"].clear()
+    yield
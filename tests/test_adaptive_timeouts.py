@@ -0,0 +1,60 @@
+"""
+Tests of the learned request timeouts (webwork/adaptive_timeouts.py).
+"""
+import pytest
+
+from webwork.adaptive_timeouts import BUCKET_BOUNDS, AdaptiveTimeouts, LatencyHistogram
+
+
+def observe(timeouts, latency, count, problem="problem.pg"):
+    for _ in range(count):
+        timeouts.observe("server", problem, latency)
+
+
+def test_ceiling_until_enough_samples(clock):
+    timeouts = AdaptiveTimeouts(clock)
+    observe(timeouts, 0.5, 49)
+    assert timeouts.timeout_for("server", "problem.pg", 10) == 10
+    observe(timeouts, 0.5, 1)
+    learned = timeouts.timeout_for("server", "problem.pg", 10)
+    assert 1.5 <= learned <= 1.5 * 1.2 # 3 times the upper bound of the bucket of 0.5s
+    assert timeouts.timeout_for("server", "other.pg", 10) == 10
+
+
+def test_clamped_between_min_timeout_and_ceiling(clock):
+    timeouts = AdaptiveTimeouts(clock)
+    observe(timeouts, 0.01, 50)
+    assert timeouts.timeout_for("server", "problem.pg", 10) == 1.0
+    observe(timeouts, 5, 50, problem="slow.pg")
+    assert timeouts.timeout_for("server", "slow.pg", 10) == 10
+
+
+def test_timed_out_calls_raise_the_timeout(clock):
+    timeouts = AdaptiveTimeouts(clock)
+    observe(timeouts, 0.5, 98)
+    for _ in range(2):
+        timeouts.observe("server", "problem.pg", 4.0, timed_out=True)
+    assert timeouts.timeout_for("server", "problem.pg", 30) > 4.0 * 3
+    assert timeouts.stats()[0]["timeouts"] == 2
+
+
+def test_old_samples_are_forgotten(clock):
+    timeouts = AdaptiveTimeouts(clock)
+    observe(timeouts, 0.5, 50)
+    clock.advance(2 * 3600)
+    assert timeouts.timeout_for("server", "problem.pg", 10) == 10
+
+
+def test_histogram_percentile(clock):
+    histogram = LatencyHistogram(3600, clock())
+    assert histogram.percentile(50, clock()) is None
+    for latency in (0.1,) * 90 + (2.0,) * 10:
+        histogram.add(latency, clock())
+    assert histogram.percentile(50, clock()) == pytest.approx(min(b for b in BUCKET_BOUNDS if b >= 0.1))
+    assert histogram.percentile(99, clock()) == pytest.approx(min(b for b in BUCKET_BOUNDS if b >= 2.0))
+    # The previous window still counts, the one before it does not
+    clock.advance(3600)
+    assert histogram.count(clock()) == 100
+    clock.advance(3600)
+    histogram.add(0.1, clock())
+    assert histogram.count(clock()) == 1
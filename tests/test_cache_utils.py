@@ -0,0 +1,69 @@
+"""
+Tests of BoundedTTLCache (webwork/cache_utils.py).
+"""
+from webwork.cache_utils import BoundedTTLCache
+
+
+def test_get_and_set(clock):
+    cache = BoundedTTLCache(clock=clock)
+    assert cache.get("a") is None
+    assert cache.get("a", "default") == "default"
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.stats() == {"entries": 1, "bytes": 0, "hits": 1, "misses": 2, "evictions": 0}
+
+
+def test_entries_expire(clock):
+    cache = BoundedTTLCache(ttl=10, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=20)
+    clock.advance(10)
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.items() == [("b", 2)]
+    assert len(cache) == 1
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = BoundedTTLCache(max_entries=2, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_size_bound(clock):
+    cache = BoundedTTLCache(max_bytes=10, sizeof=len, clock=clock)
+    cache.set("a", "12345")
+    cache.set("b", "12345")
+    assert cache.total_bytes == 10
+    cache.set("c", "123")
+    assert cache.get("a") is None
+    assert cache.total_bytes == 8
+    cache.set("d", "x" * 11) # Larger than the whole cache
+    assert cache.get("d") is None
+    assert cache.total_bytes == 8
+
+
+def test_replacing_a_value_updates_the_size(clock):
+    cache = BoundedTTLCache(max_bytes=10, sizeof=len, clock=clock)
+    cache.set("a", "12345")
+    cache.set("a", "12")
+    assert cache.total_bytes == 2
+    cache.delete("a")
+    assert cache.total_bytes == 0
+    cache.delete("a")
+
+
+def test_delete_matching_and_clear(clock):
+    cache = BoundedTTLCache(clock=clock)
+    for course, problem in (("c1", "p1"), ("c1", "p2"), ("c2", "p1")):
+        cache.set((course, problem), problem)
+    cache.delete_matching(lambda key: key[0] == "c1")
+    assert [key for key, _ in cache.items()] == [("c2", "p1")]
+    cache.clear()
+    assert len(cache) == 0
@@ -0,0 +1,108 @@
+"""
+Tests of the circuit breaker and the retry budget (webwork/circuit_breaker.py).
+"""
+from webwork.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    NORMAL,
+    OPEN,
+    PROBE,
+    REJECTED,
+    CircuitBreaker,
+    CircuitBreakerRegistry,
+    circuit_breaker_settings_from_server_settings,
+)
+
+
+def make_breaker(clock, **settings):
+    return CircuitBreaker(
+        "server", circuit_breaker_settings_from_server_settings({"circuit_breaker": settings}), clock)
+
+
+def fail_calls(breaker, count):
+    for _ in range(count):
+        breaker.record(breaker.acquire(), ok=False)
+
+
+def test_settings_are_merged_and_coerced():
+    my_settings = circuit_breaker_settings_from_server_settings(
+        {"circuit_breaker": {"min_requests": "5", "open_seconds": "bad", "half_open_probes": 0}})
+    assert my_settings["min_requests"] == 5
+    assert my_settings["open_seconds"] == 15
+    assert my_settings["half_open_probes"] == 1
+    assert circuit_breaker_settings_from_server_settings(None)["enabled"] is True
+
+
+def test_opens_after_enough_failures(clock):
+    breaker = make_breaker(clock, min_requests=4, failure_percent=50)
+    for _ in range(2):
+        breaker.record(breaker.acquire(), ok=True)
+    fail_calls(breaker, 1)
+    assert breaker.state == CLOSED
+    fail_calls(breaker, 1)
+    assert breaker.state == OPEN
+    assert breaker.acquire() is REJECTED
+    assert breaker.as_dict()["rejected"] == 1
+
+
+def test_half_open_probes_close_the_breaker(clock):
+    breaker = make_breaker(clock, min_requests=2, open_seconds=10, half_open_probes=2)
+    fail_calls(breaker, 2)
+    clock.advance(10)
+    first, second = breaker.acquire(), breaker.acquire()
+    assert (first, second) == (PROBE, PROBE)
+    assert breaker.state == HALF_OPEN
+    assert breaker.acquire() is REJECTED # No more probes in flight
+    breaker.record(first, ok=True)
+    breaker.record(second, ok=True)
+    assert breaker.state == CLOSED
+    assert breaker.acquire() == NORMAL
+
+
+def test_failed_probe_opens_the_breaker_again(clock):
+    breaker = make_breaker(clock, min_requests=2, open_seconds=10)
+    fail_calls(breaker, 2)
+    clock.advance(10)
+    breaker.record(breaker.acquire(), ok=False)
+    assert breaker.state == OPEN
+    assert breaker.as_dict()["opened_count"] == 2
+    assert breaker.acquire() is REJECTED
+
+
+def test_failures_leave_the_window(clock):
+    breaker = make_breaker(clock, min_requests=2, window_seconds=30)
+    fail_calls(breaker, 1)
+    clock.advance(31)
+    fail_calls(breaker, 1)
+    assert breaker.state == CLOSED
+
+
+def test_disabled_breaker_never_rejects(clock):
+    breaker = make_breaker(clock, enabled=False, min_requests=1)
+    fail_calls(breaker, 10)
+    assert breaker.acquire() == NORMAL
+
+
+def test_retry_budget(clock):
+    breaker = make_breaker(clock, retry_budget_percent=10, retry_budget_min=2)
+    assert breaker.allow_retry()
+    assert breaker.allow_retry()
+    assert not breaker.allow_retry()
+    for _ in range(30):
+        breaker.record(breaker.acquire(), ok=True)
+    assert breaker.allow_retry() # 10% of 30 calls
+    assert not breaker.allow_retry()
+    assert breaker.as_dict()["retries_denied"] == 2
+    clock.advance(31)
+    assert breaker.allow_retry()
+
+
+def test_registry_keeps_one_breaker_per_server_and_settings(clock):
+    registry = CircuitBreakerRegistry(clock)
+    breaker = registry.get("server", {})
+    assert registry.get("server", {}) is breaker
+    other = registry.get("server", {"circuit_breaker": {"open_seconds": 60}})
+    assert other is not breaker
+    assert breaker.settings["open_seconds"] == 15
+    assert other.settings["open_seconds"] == 60
+    assert len(registry.stats()) == 2
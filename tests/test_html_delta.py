@@ -0,0 +1,47 @@
+"""
+Tests of the patches of the delta responses (webwork/html_delta.py).
+"""
+from webwork.html_delta import apply_patch, make_patch, page_hash
+
+OLD_PAGE = "\n".join([
+    "<html>",
+    "<head><title>Problem</title></head>",
+    "<body>",
+    '<div id="answer">Your answer: 3</div>',
+    '<div id="result">incorrect</div>',
+    "</body>",
+    "</html>",
+])
+
+
+def test_patch_round_trip():
+    new_page = OLD_PAGE.replace("Your answer: 3", "Your answer: 4").replace("incorrect", "correct")
+    patch = make_patch(page_hash(OLD_PAGE), OLD_PAGE, new_page)
+    assert patch["base"] == page_hash(OLD_PAGE)
+    assert patch["baseLines"] == 7
+    assert patch["lines"] == 7
+    assert apply_patch(OLD_PAGE, patch) == new_page
+
+
+def test_patch_with_inserted_and_removed_lines():
+    new_page = OLD_PAGE.replace('<div id="result">incorrect</div>\n', "").replace(
+        "<body>", "<body>\n<p>Hint</p>\n<p>More</p>")
+    patch = make_patch("base", OLD_PAGE, new_page)
+    assert patch["lines"] == 8
+    assert apply_patch(OLD_PAGE, patch) == new_page
+
+
+def test_identical_pages_give_an_empty_patch():
+    patch = make_patch("base", OLD_PAGE, OLD_PAGE)
+    assert patch["ops"] == []
+    assert apply_patch(OLD_PAGE, patch) == OLD_PAGE
+
+
+def test_patch_against_another_page_is_refused():
+    patch = make_patch("base", OLD_PAGE, OLD_PAGE + "\n<!-- end -->")
+    assert apply_patch(OLD_PAGE + "\nextra line", patch) is None
+
+
+def test_page_hash():
+    assert page_hash(OLD_PAGE) == page_hash(OLD_PAGE)
+    assert page_hash(OLD_PAGE) != page_hash(OLD_PAGE + " ")
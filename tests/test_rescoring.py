@@ -0,0 +1,101 @@
+"""
+Tests of the replay of submissions when rescoring (webwork/rescoring.py).
+"""
+import pytest
+
+from webwork import rescoring
+
+
+class FakeContext:
+    """
+    A ReplayContext whose render requests are the answers of the submission.
+    """
+    server_key = "server"
+    max_score = 3.0
+
+    @staticmethod
+    def render_request(submission_data):
+        return submission_data.get("answers_processed") or None
+
+
+def submission(answer, seed="1"):
+    return {
+        "answers_processed": {"AnSwEr0001": answer},
+        "provided_settings": {"problemSeed": seed, "psvn": "1", "numCorrect": "0", "numIncorrect": "0"},
+    }
+
+
+@pytest.fixture
+def renderer(monkeypatch):
+    """
+    The scores returned for each answer, and the list of the answers sent.
+    """
+    scores = {}
+    sent = []
+
+    def send_render_request(render_request):
+        sent.append(render_request["AnSwEr0001"])
+        my_score = scores.get(render_request["AnSwEr0001"])
+        return None if my_score is None else {"problem_result": {"score": my_score}}
+
+    monkeypatch.setattr(rescoring, "send_render_request", send_render_request)
+    return scores, sent
+
+
+def test_best_score_is_scaled(renderer):
+    scores, sent = renderer
+    scores.update({"1": 0.0, "2": 1.0, "3": 0.5})
+    assert rescoring.replay_best_score(FakeContext(), [submission("1"), submission("2"), submission("3")], 2) == 3.0
+    assert sorted(sent) == ["1", "2", "3"]
+
+
+def test_identical_submissions_are_replayed_once(renderer):
+    scores, sent = renderer
+    scores.update({"1": 0.5})
+    assert rescoring.replay_best_score(FakeContext(), [submission("1"), submission("1")], 2) == 1.5
+    assert sent == ["1"]
+
+
+def test_different_seeds_are_replayed(renderer):
+    scores, sent = renderer
+    scores.update({"1": 0.5})
+    rescoring.replay_best_score(FakeContext(), [submission("1", seed="1"), submission("1", seed="2")], 2)
+    assert sent == ["1", "1"]
+
+
+def test_nothing_to_replay(renderer):
+    _, sent = renderer
+    assert rescoring.replay_best_score(FakeContext(), [], 2) is None
+    assert rescoring.replay_best_score(FakeContext(), [{"answers_processed": {}}], 2) is None
+    assert sent == []
+
+
+def test_failed_replay_keeps_the_grade(renderer):
+    scores, _ = renderer
+    scores.update({"1": 1.0}) # No reply for "2"
+    assert rescoring.replay_best_score(FakeContext(), [submission("1"), submission("2")], 2) is None
+
+
+def test_limiter_is_used(renderer):
+    scores, _ = renderer
+    scores.update({"1": 1.0, "2": 1.0})
+
+    class Limiter:
+        waits = 0
+
+        def wait(self):
+            self.waits += 1
+
+    limiter = Limiter()
+    rescoring.replay_best_score(FakeContext(), [submission("1"), submission("2")], 2, limiter)
+    assert limiter.waits == 2
+
+
+def test_replay_history():
+    logged = [submission("1"), submission("2")]
+    assert rescoring.replay_history(logged, {"student_attempts": 2}, only_if_higher=False) == logged
+    # A partial history may only raise the grade
+    assert rescoring.replay_history(logged, {"student_attempts": 3}, only_if_higher=False) == []
+    assert rescoring.replay_history(logged, {"student_attempts": 3}, only_if_higher=True) == logged
+    cut = submission("x" * 300 + "...")
+    assert rescoring.replay_history([cut], {"student_attempts": 1}, only_if_higher=True) == []
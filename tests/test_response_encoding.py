@@ -0,0 +1,27 @@
+"""
+Tests of the minification of the rendered HTML (webwork/response_encoding.py).
+"""
+from webwork.response_encoding import minify_html
+
+
+def test_whitespace_is_collapsed():
+    assert minify_html("<p>  a   b\t c </p>\n\n   <p>d</p>") == "<p> a b c </p>\n<p>d</p>"
+
+
+def test_comments_are_removed_except_conditional_comments():
+    html = "<p>a</p><!-- a comment -->\n<!--[if IE]><p>old</p><![endif]-->"
+    assert minify_html(html) == "<p>a</p>\n<!--[if IE]><p>old</p><![endif]-->"
+
+
+def test_preformatted_content_and_tags_are_kept():
+    html = '<pre>  a\n   b  </pre>  <textarea>x   y</textarea> <script>var a  =  1;</script> <a title="a   b">c</a>'
+    assert minify_html(html) == html.replace("</pre>  <", "</pre> <")
+
+
+def test_newlines_of_tex_comments_are_kept():
+    html = "\\( x % comment\n   + 1 \\)"
+    assert minify_html(html) == "\\( x % comment\n+ 1 \\)"
+
+
+def test_non_breaking_spaces_are_content():
+    assert minify_html("a  b") == "a  b"
@@ -0,0 +1,140 @@
+"""
+Tests of the coalescing of identical renderer calls (webwork/single_flight.py).
+"""
+import threading
+
+import pytest
+from django.core.cache import caches
+
+from webwork.single_flight import (
+    DEFAULT_SINGLE_FLIGHT_SETTINGS,
+    LOCK_KEY_PREFIX,
+    RESULT_KEY_PREFIX,
+    SingleFlight,
+    SingleFlightTimeout,
+)
+
+LOCAL = dict(DEFAULT_SINGLE_FLIGHT_SETTINGS)
+SHARED = dict(DEFAULT_SINGLE_FLIGHT_SETTINGS, shared=True, poll_interval=0.01)
+
+
+def run_followers(flight, key, count, timeout, my_settings):
+    """
+    Start count callers of key which must not call the renderer themselves.
+    Returns the threads and the list their results (or exceptions) are added to.
+    """
+    results = []
+
+    def follow():
+        try:
+            results.append(flight.do(key, lambda: "own call", timeout, my_settings=my_settings))
+        except Exception as err: # pylint: disable=broad-except
+            results.append(err)
+
+    threads = [threading.Thread(target=follow) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_followers_share_the_result_of_the_leader():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def call():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    leader = threading.Thread(target=lambda: calls.append(flight.do("key", call, 5, my_settings=LOCAL)))
+    leader.start()
+    started.wait(5)
+    threads, results = run_followers(flight, "key", 3, 5, LOCAL)
+    while flight.stats()["followers"] < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads + [leader]:
+        thread.join(5)
+    assert results == ["result"] * 3
+    assert calls == [1, "result"]
+    assert flight.stats() == {
+        "leaders": 1, "followers": 3, "shared_followers": 0, "shared_retakes": 0, "timeouts": 0, "in_flight": 0}
+
+
+def test_followers_get_the_error_of_the_leader():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def call():
+        started.set()
+        release.wait(5)
+        raise ValueError("renderer error")
+
+    leader = threading.Thread(target=lambda: pytest.raises(ValueError, flight.do, "key", call, 5, my_settings=LOCAL))
+    leader.start()
+    started.wait(5)
+    threads, results = run_followers(flight, "key", 1, 5, LOCAL)
+    while flight.stats()["followers"] < 1:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads + [leader]:
+        thread.join(5)
+    assert isinstance(results[0], ValueError)
+
+
+def test_waiting_follower_times_out_without_calling():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def call():
+        started.set()
+        release.wait(5)
+        return "result"
+
+    leader = threading.Thread(target=flight.do, args=("key", call, 5), kwargs={"my_settings": LOCAL})
+    leader.start()
+    started.wait(5)
+    with pytest.raises(SingleFlightTimeout):
+        flight.do("key", lambda: pytest.fail("the follower called the renderer"), 0.05, my_settings=LOCAL)
+    release.set()
+    leader.join(5)
+    assert flight.stats()["timeouts"] == 1
+
+
+def test_disabled():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: "result", 1, my_settings=dict(LOCAL, enabled=False)) == "result"
+    assert flight.stats()["leaders"] == 0
+
+
+def test_shared_result_of_another_process():
+    flight = SingleFlight()
+    cache = caches["default"]
+    cache.add(LOCK_KEY_PREFIX + "key", "other process", 30)
+    cache.set(RESULT_KEY_PREFIX + "key", {"r": "stored result"}, 10)
+    assert flight.do("key", lambda: pytest.fail("called the renderer"), 1, my_settings=SHARED) == "stored result"
+    assert flight.stats()["shared_followers"] == 1
+
+
+def test_shared_lock_released_without_result_is_taken_again():
+    flight = SingleFlight()
+    cache = caches["default"]
+    cache.add(LOCK_KEY_PREFIX + "key", "other process", 30)
+    threading.Timer(0.05, cache.delete, args=(LOCK_KEY_PREFIX + "key",)).start()
+    assert flight.do("key", lambda: "own call", 2, my_settings=SHARED) == "own call"
+    assert flight.stats()["shared_retakes"] == 1
+    assert cache.get(RESULT_KEY_PREFIX + "key") == {"r": "own call"}
+    assert cache.get(LOCK_KEY_PREFIX + "key") is None
+
+
+def test_shared_follower_times_out_without_calling():
+    flight = SingleFlight()
+    caches["default"].add(LOCK_KEY_PREFIX + "key", "other process", 30)
+    with pytest.raises(SingleFlightTimeout):
+        flight.do("key", lambda: pytest.fail("called the renderer"), 0.05, my_settings=SHARED)
+    assert flight.stats()["timeouts"] == 1
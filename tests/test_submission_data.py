@@ -0,0 +1,110 @@
+"""
+Tests of the encoding of the submission_data_to_save field (webwork/submission_data.py).
+"""
+from webwork.submission_data import (
+    DEFAULT_SUBMISSION_DATA_SETTINGS,
+    SHOW_ANSWERS_ACTION,
+    TRUNCATED_MARK,
+    decode_submission_data,
+    encode_submission_data,
+    may_be_cut,
+)
+
+
+def make_settings(**overrides):
+    return dict(DEFAULT_SUBMISSION_DATA_SETTINGS, **overrides)
+
+
+def make_data(message="Your answer isn't a number"):
+    """
+    submission_data in format 1, as built by _result_from_json_standalone.
+    """
+    return {
+        "provided_settings": {
+            "problemSeed": "1234",
+            "psvn": "54321",
+            "sourceFilePath": "Library/Algebra/setLinear/problem1.pg",
+            "numCorrect": "1",
+            "numIncorrect": "2",
+        },
+        "submission_settings_processed": {"problemSeed": "1234", "showHints": "1"},
+        "answers_processed": {"AnSwEr0001": "3*x", "AnSwEr0002": "", "previewAnswers": "1"},
+        "problem_result": {"score": 0.5, "msg": ""},
+        "answer_results_data": {
+            "AnSwEr0001": {
+                "ans_label": "AnSwEr0001",
+                "ans_message": message,
+                "ans_name": "AnSwEr0001",
+                "original_student_ans": "3*x",
+                "score": 1,
+                "type": "Value (Formula)",
+            },
+            "AnSwEr0002": {
+                "ans_name": "AnSwEr0002",
+                "original_student_ans": "",
+                "score": 0,
+            },
+        },
+        "num_attempts": 3,
+        "last_submission_time": "2024-05-01 10:00:00+00:00",
+        "current_submission_ww_raw_score": 0.5,
+        "current_submission_scaled_score": 1.5,
+    }
+
+
+def test_format_1_is_stored_unchanged():
+    data = make_data()
+    assert encode_submission_data(data, make_settings(format=1)) is data
+    assert decode_submission_data(data) is data
+
+
+def test_format_2_round_trip():
+    data = make_data()
+    stored = encode_submission_data(data, make_settings())
+    assert stored["v"] == 2
+    assert decode_submission_data(stored) == dict(data, answer_results_data={
+        "AnSwEr0001": data["answer_results_data"]["AnSwEr0001"],
+        # Empty answer fields are not kept
+        "AnSwEr0002": {"ans_name": "AnSwEr0002", "score": 0},
+    })
+
+
+def test_format_2_is_smaller():
+    data = make_data()
+    stored = encode_submission_data(data, make_settings())
+    assert len(repr(stored)) < len(repr(data))
+
+
+def test_long_renderer_strings_are_cut_but_not_the_answers():
+    data = make_data(message="x" * 1000)
+    data["answer_results_data"]["AnSwEr0001"]["original_student_ans"] = "y" * 1000
+    data["answers_processed"]["AnSwEr0001"] = "y" * 1000
+    decoded = decode_submission_data(encode_submission_data(data, make_settings(max_string_bytes=64)))
+    result = decoded["answer_results_data"]["AnSwEr0001"]
+    assert result["ans_message"].endswith(TRUNCATED_MARK)
+    assert len(result["ans_message"].encode("utf8")) <= 64
+    assert may_be_cut(result["ans_message"], 64)
+    assert result["original_student_ans"] == "y" * 1000
+    assert decoded["answers_processed"]["AnSwEr0001"] == "y" * 1000
+
+
+def test_compressed_round_trip():
+    data = make_data(message="The answer is not correct. " * 8)
+    stored = encode_submission_data(data, make_settings(compress=True, compress_min_bytes=0, max_string_bytes=4096))
+    assert set(stored) == {"v", "z"}
+    assert decode_submission_data(stored) == decode_submission_data(
+        encode_submission_data(data, make_settings(max_string_bytes=4096)))
+
+
+def test_show_answers_record():
+    data = {"action": SHOW_ANSWERS_ACTION, "last_submission_time": "2024-05-01 10:00:00+00:00"}
+    stored = encode_submission_data(data, make_settings())
+    assert stored["act"] == "show_answers"
+    assert decode_submission_data(stored) == data
+
+
+def test_other_data_is_kept_as_it_is():
+    data = {"something": "else"}
+    assert encode_submission_data(data, make_settings()) is data
+    assert encode_submission_data({}, make_settings()) == {}
+    assert decode_submission_data(None) is None
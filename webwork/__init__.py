@@ -1 +1,13 @@
-from .webwork import WeBWorKXBlock
+"""
+WeBWorK XBlock.
+
+The XBlock class is imported on first use, so that the modules which do not
+need the LMS (e.g. in the unit tests) can be imported on their own.
+"""
+
+
+def __getattr__(name):
+    if name == "WeBWorKXBlock":
+        from .webwork import WeBWorKXBlock # pylint: disable=import-outside-toplevel
+        return WeBWorKXBlock
+    raise AttributeError("module {mod!r} has no attribute {name!r}".format(mod=__name__, name=name))
@@ -0,0 +1,191 @@
+"""
+Request timeouts learned from the observed renderer latency of each problem.
+
+The latency of the calls made for each (server, problem) pair is kept in a
+rolling histogram with logarithmic buckets. Once enough calls were observed,
+the timeout used for the problem is
+
+    percentile(latency) * factor
+
+clamped between "min_timeout" and the webwork_request_timeout of the block
+(which stays the ceiling). Until then, webwork_request_timeout is used.
+
+Calls which timed out are counted with the timeout as their latency, so a
+problem whose calls start timing out gets a longer timeout (up to the
+ceiling) instead of being cut short forever.
+
+Each histogram covers the last one to two "window_seconds": two windows are
+kept, and the older one is dropped when the current one is full.
+
+Settings are read from the optional WEBWORK_ADAPTIVE_TIMEOUTS dictionary in the
+Django settings, see DEFAULT_ADAPTIVE_TIMEOUTS_SETTINGS.
+"""
+import bisect
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from .cache_utils import BoundedTTLCache
+
+DEFAULT_ADAPTIVE_TIMEOUTS_SETTINGS = {
+    "enabled": True,
+    "percentile": 99,
+    "factor": 3.0,
+    "min_timeout": 1.0, # seconds
+    "min_samples": 50, # calls observed before the learned timeout is used
+    "window_seconds": 3600,
+    "max_problems": 5000, # (server, problem) pairs tracked per process
+}
+
+# Upper bounds of the histogram buckets: from 5 ms to about 5 minutes, each 20% larger
+BUCKET_BOUNDS = tuple(0.005 * 1.2 ** i for i in range(int(math.log(300 / 0.005, 1.2)) + 2))
+
+
+def adaptive_timeouts_settings():
+    my_settings = dict(DEFAULT_ADAPTIVE_TIMEOUTS_SETTINGS)
+    my_settings.update(getattr(settings, "WEBWORK_ADAPTIVE_TIMEOUTS", {}) or {})
+    return my_settings
+
+
+class LatencyHistogram:
+    """
+    Rolling histogram of latencies. Not thread safe - used under the lock of
+    AdaptiveTimeouts.
+    """
+    def __init__(self, window_seconds, now):
+        self.window_seconds = window_seconds
+        self._current = [0] * (len(BUCKET_BOUNDS) + 1)
+        self._previous = [0] * (len(BUCKET_BOUNDS) + 1)
+        self._current_started = now
+        self.timeouts = 0
+
+    def _rotate(self, now):
+        if now - self._current_started < self.window_seconds:
+            return
+        if now - self._current_started < 2 * self.window_seconds:
+            self._previous = self._current
+        else: # Nothing recent at all
+            self._previous = [0] * (len(BUCKET_BOUNDS) + 1)
+        self._current = [0] * (len(BUCKET_BOUNDS) + 1)
+        self._current_started = now
+
+    def add(self, latency, now, timed_out=False):
+        self._rotate(now)
+        self._current[bisect.bisect_left(BUCKET_BOUNDS, latency)] += 1
+        if timed_out:
+            self.timeouts += 1
+
+    def count(self, now):
+        self._rotate(now)
+        return sum(self._current) + sum(self._previous)
+
+    def percentile(self, percent, now):
+        """
+        Upper bound of the bucket holding the percentile, or None without data.
+        """
+        self._rotate(now)
+        my_counts = [a + b for a, b in zip(self._current, self._previous)]
+        my_total = sum(my_counts)
+        if not my_total:
+            return None
+        my_rank = math.ceil(my_total * percent / 100.0)
+        my_seen = 0
+        for index, count in enumerate(my_counts):
+            my_seen += count
+            if my_seen >= my_rank:
+                return BUCKET_BOUNDS[min(index, len(BUCKET_BOUNDS) - 1)]
+        return BUCKET_BOUNDS[-1]
+
+
+class AdaptiveTimeouts:
+    """
+    Thread safe store of the latency histograms, keyed by (server key, problem).
+    """
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._histograms = None
+        self._max_problems = None
+
+    def _get_histograms(self, my_settings):
+        if self._histograms is None or self._max_problems != my_settings["max_problems"]:
+            # Problems which were not used for two windows are forgotten
+            self._histograms = BoundedTTLCache(
+                max_entries=my_settings["max_problems"],
+                ttl=2 * my_settings["window_seconds"],
+                clock=self._clock)
+            self._max_problems = my_settings["max_problems"]
+        return self._histograms
+
+    def observe(self, server_key, problem, latency, timed_out=False):
+        """
+        Record the latency of a call (the timeout, when it timed out).
+        """
+        my_settings = adaptive_timeouts_settings()
+        if not my_settings["enabled"]:
+            return
+        my_key = (str(server_key), str(problem))
+        with self._lock:
+            now = self._clock()
+            my_histograms = self._get_histograms(my_settings)
+            my_histogram = my_histograms.get(my_key)
+            if my_histogram is None:
+                my_histogram = LatencyHistogram(my_settings["window_seconds"], now)
+            my_histogram.add(latency, now, timed_out)
+            my_histograms.set(my_key, my_histogram) # Refreshes the TTL
+
+    def _learned(self, my_histogram, my_settings, now):
+        if my_histogram is None or my_histogram.count(now) < my_settings["min_samples"]:
+            return None
+        return my_histogram.percentile(my_settings["percentile"], now) * my_settings["factor"]
+
+    def timeout_for(self, server_key, problem, ceiling):
+        """
+        The timeout to use for a call, never more than ceiling.
+        """
+        my_settings = adaptive_timeouts_settings()
+        if not my_settings["enabled"]:
+            return ceiling
+        with self._lock:
+            now = self._clock()
+            my_histogram = self._get_histograms(my_settings).get((str(server_key), str(problem)))
+            my_learned = self._learned(my_histogram, my_settings, now)
+        if my_learned is None:
+            return ceiling
+        return min(max(my_learned, my_settings["min_timeout"]), ceiling)
+
+    def stats(self):
+        """
+        The learned values of each tracked problem, for inspection. The learned
+        timeouts are not clamped to the webwork_request_timeout of the blocks.
+        """
+        my_settings = adaptive_timeouts_settings()
+        my_stats = []
+        with self._lock:
+            now = self._clock()
+            my_histograms = self._get_histograms(my_settings)
+            for (server_key, problem), my_histogram in my_histograms.items():
+                my_p50 = my_histogram.percentile(50, now)
+                my_pct = my_histogram.percentile(my_settings["percentile"], now)
+                my_learned = self._learned(my_histogram, my_settings, now)
+                my_stats.append({
+                    "server": server_key,
+                    "problem": problem,
+                    "samples": my_histogram.count(now),
+                    "timeouts": my_histogram.timeouts,
+                    "p50": round(my_p50, 3) if my_p50 is not None else None,
+                    "p{p:g}".format(p=my_settings["percentile"]): round(my_pct, 3) if my_pct is not None else None,
+                    "learned_timeout": round(max(my_learned, my_settings["min_timeout"]), 3) if my_learned is not None else None,
+                })
+        return my_stats
+
+    def clear(self):
+        with self._lock:
+            if self._histograms is not None:
+                self._histograms.clear()
+
+
+# The single store shared by all blocks in this process
+adaptive_timeouts = AdaptiveTimeouts()
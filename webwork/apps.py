@@ -0,0 +1,35 @@
+"""
+Django application configuration for the WeBWorK XBlock.
+
+The XBlock itself does not need a Django app, but the submission log model,
+management commands, celery tasks and signal handlers of the package do. The app is added to the LMS
+and Studio using the edx-platform plugin mechanism (see the "lms.djangoapp" and
+"cms.djangoapp" entry points in setup.py).
+"""
+from django.apps import AppConfig
+
+
+class WeBWorKAppConfig(AppConfig):
+    """
+    Configuration for the webwork Django application.
+    """
+    name = 'webwork'
+    verbose_name = 'WeBWorK XBlock'
+
+    # Plugin configuration for edx-platform. The LMS gets the /webwork/ URLs
+    # (the Prometheus metrics, the JS/CSS bundles and the grade export views).
+    # No settings are added. The models need the migrations of the app to be
+    # run (./manage.py lms migrate webwork).
+    plugin_app = {
+        'url_config': {
+            'lms.djangoapp': {
+                'namespace': 'webwork',
+                'regex': r'^webwork/',
+                'relative_path': 'urls',
+            },
+        },
+    }
+
+    def ready(self):
+        # Connect the signal receivers of the caches, even before the XBlock is loaded
+        from . import course_settings, problem_periods # pylint: disable=import-outside-toplevel,unused-import
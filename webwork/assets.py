@@ -0,0 +1,89 @@
+"""
+Static assets of the XBlock, loaded once when the module is imported.
+
+The student view uses the minified, content-hashed bundles built by
+scripts/build_assets.py (listed in public/bundles/manifest.json), which are
+served instead of being inlined into the fragment of every block. In the LMS
+they are served by the bundle view of the webwork app (/webwork/bundles/), with
+"Cache-Control: public, max-age=31536000, immutable" since their names change
+with their content. Elsewhere (Studio) the runtime serves them through
+local_resource_url(). If the manifest is missing (for example in a development
+checkout where the bundles were not built) the sources are inlined as before.
+"""
+import json
+import logging
+
+import pkg_resources # Used here to return resource name as a string
+
+log = logging.getLogger(__name__)
+
+# Sent with the bundles, whose file names change with their content
+BUNDLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+IFRAME_RESIZER_CDN_URL = 'https://cdnjs.cloudflare.com/ajax/libs/iframe-resizer/4.2.9/iframeResizer.js'
+
+
+def load_resource(path):
+    """
+    Read a resource of the package as a string.
+    """
+    return pkg_resources.resource_string(__name__, path).decode("utf8")
+
+
+def _load_manifest():
+    try:
+        return json.loads(load_resource("public/bundles/manifest.json"))
+    except (OSError, ValueError):
+        return {}
+
+
+# Templates and sources - read once per process
+STUDENT_VIEW_HTML = load_resource("static/html/webwork_in_iframe.html")
+STUDENT_VIEW_JS = load_resource("static/js/src/webwork_in_iframe.js")
+STUDENT_VIEW_CSS = load_resource("static/css/webwork.css")
+STUDIO_VIEW_JS = load_resource("static/js/xblock_studio_view.js")
+
+# logical bundle name -> path of the hashed file (relative to the package)
+BUNDLE_MANIFEST = _load_manifest()
+
+# file name -> path (relative to the package) of the files served by the bundle view
+BUNDLE_FILES = {path.rsplit("/", 1)[-1]: path for path in BUNDLE_MANIFEST.values()}
+
+if "iframeResizer.js" not in BUNDLE_MANIFEST:
+    log.warning("iframeResizer is not vendored (see scripts/build_assets.py), the student view loads it from %s",
+                IFRAME_RESIZER_CDN_URL)
+
+
+def bundle_url(block, path):
+    """
+    The URL of a bundle file: the bundle view when the webwork app URLs are
+    installed (the LMS), otherwise the runtime resource URL.
+    """
+    from django.urls import NoReverseMatch, reverse
+    try:
+        return reverse('webwork:bundle', kwargs={'name': path.rsplit("/", 1)[-1]})
+    except NoReverseMatch:
+        return block.runtime.local_resource_url(block, path)
+
+
+def add_student_view_assets(fragment, block):
+    """
+    Add the JS/CSS needed by the student view to fragment.
+    """
+    iframe_resizer = BUNDLE_MANIFEST.get("iframeResizer.js")
+    if iframe_resizer:
+        fragment.add_javascript_url(bundle_url(block, iframe_resizer))
+    else:
+        fragment.add_javascript_url(IFRAME_RESIZER_CDN_URL)
+
+    css_bundle = BUNDLE_MANIFEST.get("webwork.css")
+    if css_bundle:
+        fragment.add_css_url(bundle_url(block, css_bundle))
+    else:
+        fragment.add_css(STUDENT_VIEW_CSS)
+
+    js_bundle = BUNDLE_MANIFEST.get("webwork_in_iframe.js")
+    if js_bundle:
+        fragment.add_javascript_url(bundle_url(block, js_bundle))
+    else:
+        fragment.add_javascript(STUDENT_VIEW_JS)
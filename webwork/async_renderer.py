@@ -0,0 +1,193 @@
+"""
+Asyncio renderer client for bulk operations (cache warming, rescoring,
+validating the problems of a course, ...).
+
+The client uses the same RenderRequest objects as the synchronous path, so the
+request building, problemJWT minting and response parsing are shared, and the
+same endpoint selection and retry policy (endpoint_attempts), with the same
+metrics, tracing and adaptive timeout bookkeeping. The number of concurrent
+renderer calls is bounded by a semaphore.
+
+When aiohttp is installed it is used for the HTTP calls. Otherwise each call is
+made with the pooled requests session of the synchronous path in a thread pool
+executor, so no additional dependency is needed.
+"""
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from .render_requests import endpoint_attempts, send_render_request
+from .tracing import tracer
+
+try:
+    import aiohttp # pylint: disable=import-error
+except ImportError:
+    aiohttp = None # Fall back to the requests based client in a thread pool
+
+DEFAULT_CONCURRENCY = 8
+
+
+class RenderResult:
+    """
+    The result of one request of render_many().
+    response_json is None when the call failed, and then error describes why.
+    """
+    def __init__(self, render_request, response_json=None, error=None):
+        self.render_request = render_request
+        self.response_json = response_json
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.response_json is not None
+
+    def __repr__(self):
+        return "<RenderResult ok={ok} error={error!r}>".format(ok=self.ok, error=self.error)
+
+
+def parse_renderer_text(status, content):
+    """
+    The JSON data of a renderer reply (str or bytes), or None. Same rules as parse_renderer_response.
+    """
+    if status >= 400:
+        return None
+    try:
+        return json.loads(content)
+    except ValueError:
+        return None
+
+
+class AsyncRendererClient:
+    """
+    Asyncio client making RenderRequest calls with bounded concurrency.
+
+    Use as an async context manager, or call close() when done.
+    """
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, use_aiohttp=None):
+        self.concurrency = max(int(concurrency), 1)
+        self.use_aiohttp = (aiohttp is not None) if use_aiohttp is None else (use_aiohttp and aiohttp is not None)
+        self._session = None
+        self._executor = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _get_session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency))
+        return self._session
+
+    async def _post_aiohttp(self, url, my_data, timeout, headers):
+        async with self._get_session().post(
+                url, data=my_data, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as my_res:
+            return my_res.status, await my_res.read()
+
+    async def _send_aiohttp(self, render_request):
+        """
+        Same endpoint selection, retry and circuit breaker rules as send_render_request.
+        """
+        if not render_request.server_api_url:
+            return None, "no server_api_url"
+        my_data = render_request.post_data()
+        if my_data is None:
+            return None, "could not build the request data"
+        my_breaker = render_request.circuit_breaker()
+        my_ticket = my_breaker.acquire()
+        if my_ticket is None:
+            return None, "circuit breaker open"
+        my_reply, error = None, None
+        try:
+            my_reply, error = await self._post_to_endpoints(render_request, my_data, my_breaker)
+        finally:
+            my_breaker.record(my_ticket, ok=my_reply is not None)
+        if my_reply is None:
+            return None, error
+        my_status, my_content = my_reply
+        render_request.metrics.size("renderer_response_bytes", len(my_content))
+        with render_request.metrics.phase("json_parse"), tracer.span("webwork.json_parse"):
+            response_json = parse_renderer_text(my_status, my_content)
+        if response_json is None:
+            return None, "bad response (HTTP {status})".format(status=my_status)
+        return response_json, None
+
+    async def _post_to_endpoints(self, render_request, my_data, breaker):
+        """
+        Returns ((status, content), None) for the first reply without an HTTP 5xx
+        status, or (None, error).
+        """
+        error = "no endpoint available"
+        for my_attempt in endpoint_attempts(render_request, breaker):
+            try:
+                with my_attempt:
+                    my_status, my_content = await self._post_aiohttp(
+                        my_attempt.endpoint.url, my_data, my_attempt.timeout, my_attempt.headers)
+                    my_ok = my_attempt.replied(my_status)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                my_attempt.failed(timed_out=isinstance(err, asyncio.TimeoutError))
+                error = "{name}: {err}".format(name=type(err).__name__, err=err)
+                continue
+            except BaseException:
+                # Any other error, or the cancellation of the task: release the endpoint
+                my_attempt.failed()
+                raise
+            if my_ok:
+                return (my_status, my_content), None
+            error = "bad response (HTTP {status})".format(status=my_status)
+        return None, error
+
+    async def _send_in_executor(self, render_request):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        loop = asyncio.get_running_loop()
+        response_json = await loop.run_in_executor(self._executor, send_render_request, render_request)
+        if response_json is None:
+            return None, "renderer call failed"
+        return response_json, None
+
+    async def render(self, render_request):
+        """
+        Make one call, and return a RenderResult (never raises for renderer errors).
+        """
+        try:
+            if self.use_aiohttp:
+                response_json, error = await self._send_aiohttp(render_request)
+            else:
+                response_json, error = await self._send_in_executor(render_request)
+        except Exception as err: # Per item errors are reported, not raised
+            response_json, error = None, "{name}: {err}".format(name=type(err).__name__, err=err)
+        return RenderResult(render_request, response_json, error)
+
+    async def render_many(self, render_requests):
+        """
+        Make all the calls with at most self.concurrency in flight.
+        Returns the RenderResults in the order of render_requests.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(render_request):
+            async with semaphore:
+                return await self.render(render_request)
+
+        return await asyncio.gather(*(bounded(render_request) for render_request in render_requests))
+
+
+def render_many(render_requests, concurrency=DEFAULT_CONCURRENCY, use_aiohttp=None):
+    """
+    Synchronous entry point: run render_many() in a new event loop.
+    """
+    async def run():
+        async with AsyncRendererClient(concurrency=concurrency, use_aiohttp=use_aiohttp) as client:
+            return await client.render_many(render_requests)
+    return asyncio.run(run())
@@ -0,0 +1,105 @@
+"""
+Small in-process cache helpers shared by the different caches used by the XBlock.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class BoundedTTLCache:
+    """
+    Thread safe LRU cache with a time to live for each entry.
+
+    Entries are evicted when they expire, when there are more than max_entries
+    entries, or (when max_bytes is set) when the total size of the stored values,
+    as reported by the sizeof function, passes max_bytes.
+    """
+    def __init__(self, max_entries=1000, ttl=3600, max_bytes=None, sizeof=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._data = OrderedDict() # key -> (expires_at, size, value)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def total_bytes(self):
+        return self._bytes
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry[0] <= self._clock():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, ttl=None):
+        my_size = self.sizeof(value)
+        if self.max_bytes is not None and my_size > self.max_bytes:
+            return # Never cache a single value larger than the whole cache
+        my_expires = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (my_expires, my_size, value)
+            self._bytes += my_size
+            while len(self._data) > self.max_entries or (
+                    self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def delete_matching(self, predicate):
+        """
+        Remove all the entries whose key satisfies predicate(key).
+        """
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def items(self):
+        """
+        A list of the (key, value) pairs which did not expire, oldest used first.
+        Does not count as a use of the entries.
+        """
+        with self._lock:
+            now = self._clock()
+            return [(key, entry[2]) for key, entry in self._data.items() if entry[0] > now]
+
+    def stats(self):
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, key):
+        # Caller must hold the lock
+        entry = self._data.pop(key)
+        self._bytes -= entry[1]
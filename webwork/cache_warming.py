@@ -0,0 +1,279 @@
+"""
+Warm the rendered problem cache before homework deadlines.
+
+Before a deadline many students load the same problems at the same time. The
+warmer finds the WeBWorK blocks whose due date is within the next few hours,
+builds the initial load request each enrolled student who already has a seed
+would make (using the seed and WeBWorK attempt counters stored in their
+StudentModule state, and the psvn from their psvn_options preference - the same
+values get_psvn and student_view use), and renders the problems into the
+render cache in advance.
+
+Students who never viewed a problem do not have a seed yet (it is chosen
+randomly on the first view), so their problems cannot be rendered in advance.
+
+Settings are read from the optional WEBWORK_CACHE_WARMING dictionary in the
+Django settings, see DEFAULT_CACHE_WARMING_SETTINGS.
+"""
+import datetime
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .course_settings import course_settings_registry
+from .render_requests import RenderRequest, add_student_params, is_rendered, render_with_cache
+from .render_cache import render_cache
+
+DEFAULT_CACHE_WARMING_SETTINGS = {
+    "hours": 24, # warm problems due in the next "hours" hours
+    "concurrency": 4, # parallel renderer calls
+    "rate": 10.0, # maximal renderer calls per second (0 = no limit)
+    "batch_size": 500, # students read from the database at a time
+    "extra_ttl": 3600, # seconds to keep warmed entries after the due date
+}
+
+WEBWORK_BLOCK_TYPE = 'webwork'
+
+
+def cache_warming_settings(**overrides):
+    my_settings = dict(DEFAULT_CACHE_WARMING_SETTINGS)
+    my_settings.update(getattr(settings, "WEBWORK_CACHE_WARMING", {}) or {})
+    my_settings.update({key: value for key, value in overrides.items() if value is not None})
+    return my_settings
+
+
+class RateLimiter:
+    """
+    Thread safe limiter allowing at most "rate" calls per second (0 = no limit).
+    """
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._next = clock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            my_now = self._clock()
+            my_slot = max(self._next, my_now)
+            self._next = my_slot + self.interval
+        if my_slot > my_now:
+            self._sleep(my_slot - my_now)
+
+
+class WarmingProgress:
+    """
+    Counters of a warming run, reported through the report callback.
+    """
+    def __init__(self, report=None, every=100):
+        self._lock = threading.Lock()
+        self.report = report
+        self.every = every
+        self.started = time.monotonic()
+        self.blocks = 0
+        self.requests = 0
+        self.already_cached = 0
+        self.rendered = 0
+        self.failed = 0
+
+    def add(self, field, count=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + count)
+            done = self.already_cached + self.rendered + self.failed
+        if self.report and field in ("already_cached", "rendered", "failed") and done % self.every == 0:
+            self.report(self)
+
+    def as_dict(self):
+        elapsed = time.monotonic() - self.started
+        done = self.already_cached + self.rendered + self.failed
+        return {
+            "blocks": self.blocks,
+            "requests": self.requests,
+            "done": done,
+            "already_cached": self.already_cached,
+            "rendered": self.rendered,
+            "failed": self.failed,
+            "elapsed": round(elapsed, 1),
+            "per_second": round(done / elapsed, 2) if elapsed else 0.0,
+        }
+
+    def __str__(self):
+        return " ".join("{k}={v}".format(k=k, v=v) for k, v in self.as_dict().items())
+
+
+def upcoming_course_keys(now=None):
+    """
+    Keys of the courses which did not end yet.
+    """
+    from django.db.models import Q
+    from openedx.core.djangoapps.content.course_overviews.models import CourseOverview # pylint: disable=import-error
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return list(CourseOverview.objects.filter(Q(end__isnull=True) | Q(end__gte=now)).values_list('id', flat=True))
+
+
+def upcoming_webwork_blocks(course_key, hours, now=None):
+    """
+    Yield (course, block) for the WeBWorK blocks of the course due in the next hours.
+    The blocks are not bound to any student.
+    """
+    from xmodule.modulestore.django import modulestore # pylint: disable=import-error
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    horizon = now + datetime.timedelta(hours=hours)
+    store = modulestore()
+    with store.bulk_operations(course_key):
+        course = store.get_course(course_key)
+        if course is None:
+            return
+        for block in store.get_items(course_key, qualifiers={'category': WEBWORK_BLOCK_TYPE}):
+            if block.due is not None and now <= block.due <= horizon:
+                yield course, block
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def student_render_states(course_key, block, batch_size):
+    """
+    Yield (seed, psvn_options, numCorrect, numIncorrect) for each enrolled
+    student with a seed for block, reading the state in batches.
+    """
+    from lms.djangoapps.courseware.models import StudentModule, XModuleStudentPrefsField # pylint: disable=import-error
+    rows = StudentModule.objects.filter(
+        course_id=course_key,
+        module_state_key=block.location,
+        student__courseenrollment__course_id=course_key,
+        student__courseenrollment__is_active=True,
+    ).values_list('student_id', 'state').iterator()
+    for batch in _batches(rows, batch_size):
+        prefs = dict(XModuleStudentPrefsField.objects.filter(
+            module_type=WEBWORK_BLOCK_TYPE,
+            field_name='psvn_options',
+            student_id__in=[student_id for student_id, _ in batch],
+        ).values_list('student_id', 'value'))
+        for student_id, state in batch:
+            try:
+                my_state = json.loads(state or "{}")
+                my_psvn_options = json.loads(prefs.get(student_id) or "{}")
+            except ValueError:
+                continue
+            if not my_state.get('seed'):
+                continue
+            yield (my_state['seed'], my_psvn_options,
+                   my_state.get('ww_numCorrect', 0), my_state.get('ww_numIncorrect', 0))
+
+
+def block_render_requests(course, block, batch_size):
+    """
+    Yield the initial load RenderRequest of each student of block, built the way
+    the block builds it in submit_webwork_iframed / student_view.
+    """
+    from .webwork import STANDALONE_REQUEST_PARAMETERS, HTML2XML_REQUEST_PARAMETERS
+
+    # Resolve the server settings using the block code, with the registry entry of the course
+    entry = course_settings_registry.get(
+        course.id, lambda: course.other_course_settings.get('webwork_settings', {}))
+    block._course_settings_entry = entry # pylint: disable=protected-access
+    block.set_current_server_settings()
+    server_settings = dict(block.current_server_settings)
+    server_type = server_settings.get("server_type")
+    if server_type == 'standalone':
+        request_parameters = STANDALONE_REQUEST_PARAMETERS
+    elif server_type == 'html2xml':
+        request_parameters = HTML2XML_REQUEST_PARAMETERS
+    else:
+        return
+    auth_data = block.get_current_auth_data()
+    server_key = block.get_current_server_key()
+    psvn_shift = block.get_psvn_shift()
+    psvn_key = str(block.psvn_key)
+
+    for seed, psvn_options, num_correct, num_incorrect in student_render_states(course.id, block, batch_size):
+        if not isinstance(psvn_options.get(psvn_key), int):
+            continue # The psvn is created on the first load
+        params = add_student_params(
+            dict(request_parameters), server_type, block.ww_language,
+            num_correct, num_incorrect, block.allow_ww_hints)
+        yield RenderRequest(
+            server_settings = server_settings,
+            auth_data = auth_data,
+            server_key = server_key,
+            seed = seed,
+            psvn = psvn_shift + psvn_options[psvn_key],
+            problem = block.problem,
+            params = params,
+            timeout = max(block.webwork_request_timeout, 0.5),
+            course_id = course.id,
+            settings_fingerprint = entry.fingerprint,
+            idempotent = True,
+        )
+
+
+def warm_render_requests(render_requests, concurrency, limiter, progress, shared_ttl=None, dry_run=False):
+    """
+    Render the requests which are not cached yet, with at most concurrency
+    parallel calls, and the rate of calls limited by limiter.
+    """
+
+    def warm_one(render_request):
+        if render_cache.get(render_request.cache_key()) is not None:
+            progress.add("already_cached")
+            return
+        if dry_run:
+            progress.add("rendered")
+            return
+        limiter.wait()
+        if is_rendered(render_with_cache(render_request, shared_ttl=shared_ttl)):
+            progress.add("rendered")
+        else:
+            progress.add("failed")
+
+    with ThreadPoolExecutor(max_workers=max(int(concurrency), 1)) as executor:
+        # Bounded submission, so the requests are never all held in memory
+        pending = []
+        for render_request in render_requests:
+            progress.add("requests")
+            pending.append(executor.submit(warm_one, render_request))
+            if len(pending) >= concurrency * 4:
+                pending.pop(0).result()
+        for future in pending:
+            future.result()
+
+
+def warm_upcoming_deadlines(course_keys=None, hours=None, concurrency=None, rate=None,
+                            report=None, dry_run=False, now=None):
+    """
+    Warm the render cache for all the WeBWorK problems due in the next hours.
+    Returns the final WarmingProgress.
+    """
+    my_settings = cache_warming_settings(hours=hours, concurrency=concurrency, rate=rate)
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    progress = WarmingProgress(report=report)
+    limiter = RateLimiter(my_settings["rate"])
+    if course_keys is None:
+        course_keys = upcoming_course_keys(now)
+    for course_key in course_keys:
+        for course, block in upcoming_webwork_blocks(course_key, my_settings["hours"], now):
+            progress.add("blocks")
+            # Keep the entries until after the due date
+            shared_ttl = int((block.due - now).total_seconds()) + my_settings["extra_ttl"]
+            warm_render_requests(
+                block_render_requests(course, block, my_settings["batch_size"]),
+                my_settings["concurrency"], limiter, progress,
+                shared_ttl=shared_ttl, dry_run=dry_run)
+    if report:
+        report(progress)
+    return progress
@@ -0,0 +1,257 @@
+"""
+Per server circuit breaker and retry budget for the calls made to renderers.
+
+When a renderer is unhealthy every call waits for the full request timeout, and
+the LMS worker threads pile up waiting for it. The circuit breaker of a server
+counts the outcome of the calls made to it in a sliding window:
+
+  * closed    - calls are made normally. When at least "min_requests" calls
+                were made in the window, and "failure_percent" of them failed
+                (connection errors, timeouts, HTTP 5xx), the breaker opens.
+  * open      - calls fail immediately (the student sees the usual "An error
+                occurred" message) for "open_seconds".
+  * half open - up to "half_open_probes" calls at a time are let through as
+                probes. When that many probes succeed the breaker closes, and
+                any failed probe opens it again.
+
+The retry budget limits the retries of idempotent calls (see renderer_pool.py)
+to "retry_budget_percent" of the calls made in the window (but always allows
+"retry_budget_min" retries), so retries cannot multiply the load on a
+degraded renderer.
+
+The state is kept per server in each LMS process. The settings are read from an
+optional "circuit_breaker" object in the server settings, see
+doc/course-level-settings.md. Courses which use the same server with different
+circuit breaker settings get separate breakers.
+"""
+import collections
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CIRCUIT_BREAKER_SETTINGS = {
+    "enabled": True,
+    "window_seconds": 30,
+    "min_requests": 20,
+    "failure_percent": 50,
+    "open_seconds": 15,
+    "half_open_probes": 2,
+    "retry_budget_percent": 10,
+    "retry_budget_min": 3,
+}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Values returned by CircuitBreaker.acquire()
+REJECTED = None
+NORMAL = "normal"
+PROBE = "probe"
+
+
+def circuit_breaker_settings_from_server_settings(server_settings):
+    """
+    Merge the optional "circuit_breaker" object of a server settings dictionary
+    with the defaults, and coerce the values to the expected types.
+    """
+    my_settings = dict(DEFAULT_CIRCUIT_BREAKER_SETTINGS)
+    provided = (server_settings or {}).get("circuit_breaker", {})
+    if isinstance(provided, dict):
+        for key in DEFAULT_CIRCUIT_BREAKER_SETTINGS:
+            if key in provided:
+                my_settings[key] = provided[key]
+    my_settings["enabled"] = bool(my_settings["enabled"])
+    for key, cast, minimum in (
+            ("window_seconds", int, 1),
+            ("min_requests", int, 1),
+            ("failure_percent", float, 1.0),
+            ("open_seconds", float, 0.0),
+            ("half_open_probes", int, 1),
+            ("retry_budget_percent", float, 0.0),
+            ("retry_budget_min", int, 0)):
+        try:
+            my_settings[key] = max(cast(my_settings[key]), minimum)
+        except (TypeError, ValueError):
+            my_settings[key] = DEFAULT_CIRCUIT_BREAKER_SETTINGS[key]
+    return my_settings
+
+
+class WindowCounter:
+    """
+    Named counters over a sliding window, kept in one second buckets.
+    Not thread safe - used under the lock of its owner.
+    """
+    def __init__(self, window_seconds, clock):
+        self.window_seconds = window_seconds
+        self._clock = clock
+        self._buckets = collections.deque() # [second, {name: count}]
+
+    def _prune(self, now):
+        my_oldest = int(now) - self.window_seconds + 1
+        while self._buckets and self._buckets[0][0] < my_oldest:
+            self._buckets.popleft()
+
+    def add(self, name, count=1):
+        now = self._clock()
+        self._prune(now)
+        my_second = int(now)
+        if not self._buckets or self._buckets[-1][0] != my_second:
+            self._buckets.append([my_second, {}])
+        my_counts = self._buckets[-1][1]
+        my_counts[name] = my_counts.get(name, 0) + count
+
+    def total(self, name):
+        self._prune(self._clock())
+        return sum(counts.get(name, 0) for _, counts in self._buckets)
+
+    def clear(self):
+        self._buckets.clear()
+
+
+class CircuitBreaker:
+    """
+    The circuit breaker and retry budget of one server.
+    """
+    def __init__(self, server_key, breaker_settings, clock=time.monotonic):
+        self.server_key = server_key
+        self.settings = breaker_settings
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._window = WindowCounter(breaker_settings["window_seconds"], clock)
+        self.state = CLOSED
+        self.opened_at = None
+        self.opened_count = 0
+        self.rejected = 0
+        self.retries_denied = 0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.opened_count += 1
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._window.clear()
+
+    def acquire(self):
+        """
+        NORMAL or PROBE when the call may be made, REJECTED (None) when it must
+        fail fast. Each accepted call must be followed by a call to record().
+        """
+        if not self.settings["enabled"]:
+            return NORMAL
+        with self._lock:
+            if self.state == OPEN:
+                if self._clock() - self.opened_at < self.settings["open_seconds"]:
+                    self.rejected += 1
+                    return REJECTED
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self._probes_in_flight >= self.settings["half_open_probes"]:
+                    self.rejected += 1
+                    return REJECTED
+                self._probes_in_flight += 1
+                return PROBE
+            self._window.add("requests")
+            return NORMAL
+
+    def record(self, ticket, ok):
+        """
+        Record the outcome of a call accepted by acquire().
+        """
+        if not self.settings["enabled"]:
+            return
+        my_transition = None
+        with self._lock:
+            now = self._clock()
+            if ticket == PROBE:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+                if self.state != HALF_OPEN:
+                    return
+                if not ok:
+                    self._open(now)
+                    my_transition = OPEN
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.settings["half_open_probes"]:
+                        self.state = CLOSED
+                        self._window.clear()
+                        my_transition = CLOSED
+            elif not ok:
+                self._window.add("failures")
+                if self.state == CLOSED:
+                    my_requests = self._window.total("requests")
+                    my_failures = self._window.total("failures")
+                    if (my_requests >= self.settings["min_requests"] and
+                            my_failures * 100 >= self.settings["failure_percent"] * my_requests):
+                        self._open(now)
+                        my_transition = OPEN
+        if my_transition == OPEN:
+            log.warning("WeBWorK renderer circuit breaker opened for %s", self.server_key)
+        elif my_transition == CLOSED:
+            log.warning("WeBWorK renderer circuit breaker closed for %s", self.server_key)
+
+    def allow_retry(self):
+        """
+        True when one more retry fits in the retry budget (and counts it).
+        """
+        with self._lock:
+            my_allowed = max(
+                self.settings["retry_budget_min"],
+                self.settings["retry_budget_percent"] * self._window.total("requests") / 100.0)
+            if self._window.total("retries") >= my_allowed:
+                self.retries_denied += 1
+                return False
+            self._window.add("retries")
+            return True
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "server": self.server_key,
+                "settings": dict(self.settings),
+                "state": self.state,
+                "requests": self._window.total("requests"),
+                "failures": self._window.total("failures"),
+                "retries": self._window.total("retries"),
+                "opened_count": self.opened_count,
+                "rejected": self.rejected,
+                "retries_denied": self.retries_denied,
+            }
+
+
+class CircuitBreakerRegistry:
+    """
+    Thread safe registry holding one CircuitBreaker per server key and
+    circuit breaker settings.
+    """
+    def __init__(self, clock=time.monotonic):
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self._clock = clock
+
+    def get(self, server_key, server_settings):
+        my_settings = circuit_breaker_settings_from_server_settings(server_settings)
+        my_key = (server_key, tuple(sorted(my_settings.items())))
+        with self._lock:
+            breaker = self._breakers.get(my_key)
+            if breaker is None:
+                breaker = self._breakers[my_key] = CircuitBreaker(server_key, my_settings, self._clock)
+            return breaker
+
+    def stats(self):
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return [breaker.as_dict() for breaker in breakers]
+
+    def clear(self):
+        with self._lock:
+            self._breakers.clear()
+
+
+# The single registry shared by all blocks in this process
+circuit_breakers = CircuitBreakerRegistry()
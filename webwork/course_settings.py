@@ -0,0 +1,163 @@
+"""
+Process-level registry of the course-wide "webwork_settings".
+
+The settings are stored in the "Other course settings" of a course, so reading
+them requires loading the course descriptor from the modulestore. Instead of
+doing that on every student_view and handler call of every block, the parsed
+settings are kept per course id in a thread safe registry.
+
+An entry is reloaded:
+  * when the course is published in this process (course_published signal),
+  * when the shared version stamp of the course (bumped by the course_published
+    signal in any process, typically Studio) is different from the one seen when
+    the entry was loaded. The shared stamp is checked at most every
+    "check_interval" seconds,
+  * in any case after "ttl" seconds.
+
+Settings are read from the optional WEBWORK_COURSE_SETTINGS dictionary in the
+Django settings, see DEFAULT_COURSE_SETTINGS_REGISTRY_SETTINGS.
+"""
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.dispatch import receiver
+
+from .render_cache import settings_fingerprint
+
+try:
+    from xmodule.modulestore.django import SignalHandler # pylint: disable=import-error
+except ImportError:
+    SignalHandler = None # Outside of edx-platform (e.g. in the unit tests)
+
+DEFAULT_COURSE_SETTINGS_REGISTRY_SETTINGS = {
+    "ttl": 60, # seconds
+    "check_interval": 5, # seconds
+    "shared_cache_alias": "default",
+}
+
+VERSION_KEY_PREFIX = "webwork:course_settings_version:"
+
+
+def course_settings_registry_settings():
+    my_settings = dict(DEFAULT_COURSE_SETTINGS_REGISTRY_SETTINGS)
+    my_settings.update(getattr(settings, "WEBWORK_COURSE_SETTINGS", {}) or {})
+    return my_settings
+
+
+class CourseWebWorKSettings:
+    """
+    The parsed webwork_settings of a course. Treated as read only.
+    """
+    def __init__(self, webwork_settings, version=0, shared_version=None, clock=time.monotonic):
+        if not isinstance(webwork_settings, dict):
+            webwork_settings = {}
+        self.webwork_settings = webwork_settings
+        self.fingerprint = settings_fingerprint(webwork_settings)
+        self.version = version
+        self.shared_version = shared_version
+        self.loaded_at = clock()
+        self.checked_at = self.loaded_at
+        self.course_defaults = webwork_settings.get('course_defaults', {})
+        self.server_settings = {}
+        self.auth_data = {}
+        for server_id, server_settings in webwork_settings.get('server_settings', {}).items():
+            # Keep auth_data apart from the other settings, so it never gets copied into
+            # data which may be saved (see set_current_server_settings).
+            my_server_settings = copy.deepcopy(server_settings) if isinstance(server_settings, dict) else {}
+            self.auth_data[server_id] = my_server_settings.pop('auth_data', {})
+            self.server_settings[server_id] = my_server_settings
+
+    def get_server_settings(self, server_id):
+        return self.server_settings.get(server_id, {})
+
+    def get_auth_data(self, server_id):
+        return self.auth_data.get(server_id, {})
+
+
+class CourseSettingsRegistry:
+    """
+    Thread safe registry of CourseWebWorKSettings keyed by course id.
+    """
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {} # str(course_id) -> CourseWebWorKSettings
+        self.loads = 0
+        self.hits = 0
+
+    def get(self, course_id, loader, force=False):
+        """
+        Return the settings of course_id. loader() should return the
+        webwork_settings dictionary of the course, and is only called when the
+        entry is missing or stale.
+        """
+        my_course = str(course_id)
+        my_settings = course_settings_registry_settings()
+        my_now = self._clock()
+        entry = self._entries.get(my_course)
+        if entry is not None and not force and my_now - entry.loaded_at < my_settings["ttl"]:
+            if my_now - entry.checked_at < my_settings["check_interval"]:
+                self.hits += 1
+                return entry
+            entry.checked_at = my_now
+            if self._get_shared_version(my_course, my_settings) == entry.shared_version:
+                self.hits += 1
+                return entry
+
+        my_shared_version = self._get_shared_version(my_course, my_settings)
+        new_entry = CourseWebWorKSettings(loader(), shared_version=my_shared_version, clock=self._clock)
+        with self._lock:
+            current = self._entries.get(my_course)
+            if current is None:
+                new_entry.version = 1
+            elif current.fingerprint == new_entry.fingerprint:
+                new_entry.version = current.version
+            else:
+                new_entry.version = current.version + 1
+            self._entries[my_course] = new_entry
+            self.loads += 1
+        return new_entry
+
+    def invalidate(self, course_id=None):
+        with self._lock:
+            if course_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(course_id), None)
+
+    def bump_shared_version(self, course_id):
+        """
+        Tell the registries of the other processes the course settings may have changed.
+        """
+        my_settings = course_settings_registry_settings()
+        try:
+            my_cache = caches[my_settings["shared_cache_alias"]]
+            my_key = VERSION_KEY_PREFIX + str(course_id)
+            my_cache.add(my_key, 0, None)
+            my_cache.incr(my_key)
+        except Exception: # The TTL still limits how long stale settings are used
+            pass
+
+    @staticmethod
+    def _get_shared_version(course, my_settings):
+        try:
+            return caches[my_settings["shared_cache_alias"]].get(VERSION_KEY_PREFIX + course)
+        except Exception:
+            return None
+
+    def stats(self):
+        return {"courses": len(self._entries), "loads": self.loads, "hits": self.hits}
+
+
+# The registry shared by all blocks in this process
+course_settings_registry = CourseSettingsRegistry()
+
+
+if SignalHandler is not None:
+    @receiver(SignalHandler.course_published, dispatch_uid="webwork_course_settings_published")
+    def _handle_course_published(sender, course_key, **kwargs): # pylint: disable=unused-argument
+        course_settings_registry.invalidate(course_key)
+        course_settings_registry.bump_shared_version(course_key)
@@ -0,0 +1,202 @@
+"""
+Streaming export of the WeBWorK grades and submission data of a course.
+
+One row is exported for each student state of a WeBWorK problem (a
+StudentModule row): the course, the block, the student, best_student_score,
+student_attempts, ww_numCorrect, ww_numIncorrect,
+student_viewed_correct_answers, last_submission_time and the last
+submission_data_to_save (as JSON, in the original layout, whichever format it
+was stored in).
+
+The states are read in batches of "batch_size" rows, ordered by id and
+starting after the last id of the previous batch, so each batch is a short
+indexed query, and memory use does not depend on the size of the course. The
+rows are turned into CSV or JSON Lines text one at a time by generators, so
+the export can be streamed to a file or an HTTP response.
+
+Settings are read from the optional WEBWORK_GRADE_EXPORT dictionary in the
+Django settings, see DEFAULT_GRADE_EXPORT_SETTINGS.
+"""
+import csv
+import json
+import logging
+import time
+
+from django.conf import settings
+
+from .submission_data import decode_submission_data
+
+log = logging.getLogger(__name__)
+
+DEFAULT_GRADE_EXPORT_SETTINGS = {
+    "batch_size": 1000, # student states read from the database at a time
+    "report_every": 10000, # rows between progress reports
+}
+
+WEBWORK_BLOCK_TYPE = 'webwork'
+
+EXPORT_FORMATS = ("csv", "jsonl")
+
+EXPORT_COLUMNS = (
+    "course_id",
+    "block_id",
+    "user_id",
+    "username",
+    "best_student_score",
+    "student_attempts",
+    "ww_numCorrect",
+    "ww_numIncorrect",
+    "student_viewed_correct_answers",
+    "last_submission_time",
+    "submission_data",
+)
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+}
+
+
+def grade_export_settings(**overrides):
+    my_settings = dict(DEFAULT_GRADE_EXPORT_SETTINGS)
+    my_settings.update(getattr(settings, "WEBWORK_GRADE_EXPORT", {}) or {})
+    my_settings.update({key: value for key, value in overrides.items() if value is not None})
+    return my_settings
+
+
+class ExportProgress:
+    """
+    Counters of an export, reported through the report callback.
+    """
+    def __init__(self, report=None, every=10000):
+        self.report = report
+        self.every = every
+        self.started = time.monotonic()
+        self.batches = 0
+        self.rows = 0
+        self.skipped = 0
+
+    def add_row(self):
+        self.rows += 1
+        if self.report and self.rows % self.every == 0:
+            self.report(self)
+
+    def as_dict(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            "rows": self.rows,
+            "skipped": self.skipped,
+            "batches": self.batches,
+            "elapsed": round(elapsed, 1),
+            "rows_per_second": round(self.rows / elapsed, 1) if elapsed else 0.0,
+        }
+
+    def __str__(self):
+        return " ".join("{k}={v}".format(k=k, v=v) for k, v in self.as_dict().items())
+
+
+def student_state_batches(course_key, block_keys=None, batch_size=1000):
+    """
+    Yield lists of (id, student_id, username, module_state_key, state) of the
+    WeBWorK student states of the course, batch_size rows at a time.
+    """
+    from lms.djangoapps.courseware.models import StudentModule # pylint: disable=import-error
+    rows = StudentModule.objects.filter(course_id=course_key, module_type=WEBWORK_BLOCK_TYPE)
+    if block_keys:
+        rows = rows.filter(module_state_key__in=list(block_keys))
+    rows = rows.order_by('id').values_list('id', 'student_id', 'student__username', 'module_state_key', 'state')
+    last_id = 0
+    while True:
+        batch = list(rows.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        if len(batch) < batch_size:
+            return
+        last_id = batch[-1][0]
+
+
+def export_rows(course_key, block_keys=None, batch_size=None, progress=None):
+    """
+    Yield a dict with the EXPORT_COLUMNS for each WeBWorK student state of the course.
+    """
+    my_settings = grade_export_settings(batch_size=batch_size)
+    progress = progress or ExportProgress()
+    for batch in student_state_batches(course_key, block_keys, my_settings["batch_size"]):
+        progress.batches += 1
+        for _, student_id, username, block_key, state in batch:
+            try:
+                my_state = json.loads(state or "{}")
+            except ValueError:
+                progress.skipped += 1
+                continue
+            yield {
+                "course_id": str(course_key),
+                "block_id": str(block_key),
+                "user_id": student_id,
+                "username": username,
+                "best_student_score": my_state.get("best_student_score", 0.0),
+                "student_attempts": my_state.get("student_attempts", 0),
+                "ww_numCorrect": my_state.get("ww_numCorrect", 0),
+                "ww_numIncorrect": my_state.get("ww_numIncorrect", 0),
+                "student_viewed_correct_answers": my_state.get("student_viewed_correct_answers", False),
+                "last_submission_time": my_state.get("last_submission_time"),
+                "submission_data": decode_submission_data(my_state.get("submission_data_to_save") or {}),
+            }
+            progress.add_row()
+
+
+class _LineBuffer:
+    """
+    File-like object for csv.writer, returning each written line instead of keeping it.
+    """
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """
+    Yield the CSV text of rows (dicts with the EXPORT_COLUMNS), starting with the header line.
+    """
+    writer = csv.writer(_LineBuffer())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        row = dict(row, submission_data=json.dumps(row["submission_data"], separators=(",", ":")))
+        yield writer.writerow([row[column] for column in EXPORT_COLUMNS])
+
+
+def jsonl_lines(rows):
+    """
+    Yield one JSON line for each row.
+    """
+    for row in rows:
+        yield json.dumps(row, separators=(",", ":")) + "\n"
+
+
+def export_lines(export_format, course_key, block_keys=None, batch_size=None, progress=None):
+    """
+    Yield the lines of the export of the course (or of block_keys) in export_format.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError("Unknown export format: {f}".format(f=export_format))
+    rows = export_rows(course_key, block_keys, batch_size, progress)
+    return csv_lines(rows) if export_format == "csv" else jsonl_lines(rows)
+
+
+def export_stream(export_format, course_key, block_keys=None):
+    """
+    Yield the export as UTF-8 bytes, for a streamed HTTP response. The rows per
+    second are logged at the end.
+    """
+    my_settings = grade_export_settings()
+    progress = ExportProgress(report=lambda p: log.info("WeBWorK grade export of %s: %s", course_key, p),
+                              every=my_settings["report_every"])
+    for line in export_lines(export_format, course_key, block_keys, my_settings["batch_size"], progress):
+        yield line.encode("utf8")
+    log.info("WeBWorK grade export of %s done: %s", course_key, progress)
+
+
+def export_filename(export_format, course_key, block_key=None):
+    my_name = str(block_key.block_id) if block_key is not None else str(course_key)
+    return "webwork-grades-{name}.{ext}".format(
+        name="".join(char if char.isalnum() or char in "-_." else "_" for char in my_name), ext=export_format)
@@ -0,0 +1,224 @@
+"""
+Delta responses: send a patch against the problem HTML the browser already
+shows, instead of the whole renderedHTML.
+
+A browser using delta responses sends "renderedHash" with each submission:
+the hash of the page it shows, or "" before it has one. For those requests
+(and for the pages prerendered into student_view, whose JS uses them) the
+rendered page is stored (zlib compressed) under its hash, scoped to the block
+and the student, in a bounded in-process cache and in the shared Django
+cache, and the response carries the hash as "renderedHash". The shared cache
+also keeps the current hash of each scope, so a page which another process
+stored already is not written again. When the page with the hash sent by the
+browser is found the response carries
+"renderedPatch" instead of "renderedHTML", if the patch is smaller than
+"max_ratio" of the page:
+
+    {"base": <hash of the old page>, "baseLines": <lines in the old page>,
+     "lines": <lines in the new page>, "ops": [[start, end, [new lines...]], ...]}
+
+Each op replaces the lines start to end (exclusive, counted in the old page)
+by the new lines. Lines are split on "\\n" only, the same in Python and in JS.
+The JS code applies the ops from the last to the first, then replaces only the
+elements which changed in the page shown by the iframe, without reloading it
+(the whole page is reloaded when that is not possible, e.g. the head or the
+scripts changed). When it cannot apply the patch it gets the full page with
+the rendered_html handler.
+
+Settings are read from the optional WEBWORK_DELTA_RESPONSES dictionary in the
+Django settings, see DEFAULT_DELTA_RESPONSES_SETTINGS.
+"""
+import difflib
+import hashlib
+import json
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .cache_utils import BoundedTTLCache
+
+DEFAULT_DELTA_RESPONSES_SETTINGS = {
+    "enabled": True,
+    "max_ratio": 0.5, # a patch is only sent when smaller than this fraction of the page
+    "max_lines": 20000, # longer pages are always sent in full
+    "local_max_entries": 5000,
+    "local_max_bytes": 32 * 1024 * 1024, # total size of the compressed pages in the local tier
+    "local_ttl": 1800, # seconds
+    "shared_enabled": True,
+    "shared_cache_alias": "default", # a key of the Django CACHES setting
+    "shared_ttl": 3600, # seconds
+}
+
+CACHE_KEY_PREFIX = "webwork:page:"
+CURRENT_KEY_PREFIX = "webwork:page_current:"
+
+# The key of the hash sent by the browser in the submitted JSON
+BASE_HASH_FIELD = "renderedHash"
+
+
+def delta_responses_settings():
+    my_settings = dict(DEFAULT_DELTA_RESPONSES_SETTINGS)
+    my_settings.update(getattr(settings, "WEBWORK_DELTA_RESPONSES", {}) or {})
+    return my_settings
+
+
+def page_hash(html):
+    return hashlib.sha256(html.encode("utf8")).hexdigest()[:32]
+
+
+def make_patch(base_hash, old_html, new_html):
+    """
+    The patch turning old_html into new_html (see the module docstring).
+    """
+    my_old = old_html.split("\n")
+    my_new = new_html.split("\n")
+    my_matcher = difflib.SequenceMatcher(None, my_old, my_new, autojunk=False)
+    return {
+        "base": base_hash,
+        "baseLines": len(my_old),
+        "lines": len(my_new),
+        "ops": [[i1, i2, my_new[j1:j2]] for tag, i1, i2, j1, j2 in my_matcher.get_opcodes() if tag != "equal"],
+    }
+
+
+def apply_patch(old_html, patch):
+    """
+    new_html from old_html and a patch, or None if the patch does not fit. Mirrors the JS code.
+    """
+    my_lines = old_html.split("\n")
+    if len(my_lines) != patch["baseLines"]:
+        return None
+    for start, end, new_lines in reversed(patch["ops"]):
+        my_lines[start:end] = new_lines
+    if len(my_lines) != patch["lines"]:
+        return None
+    return "\n".join(my_lines)
+
+
+class RenderedPages:
+    """
+    The two-tier store of the pages sent to the browsers, keyed by (scope, hash).
+    """
+    def __init__(self):
+        self._local = None
+        self._local_settings = None
+
+    def _get_local(self, my_settings):
+        my_local_settings = (my_settings["local_max_entries"], my_settings["local_max_bytes"], my_settings["local_ttl"])
+        if self._local is None or self._local_settings != my_local_settings:
+            self._local = BoundedTTLCache(
+                max_entries=my_settings["local_max_entries"],
+                ttl=my_settings["local_ttl"],
+                max_bytes=my_settings["local_max_bytes"],
+                sizeof=len,
+            )
+            self._local_settings = my_local_settings
+        return self._local
+
+    @staticmethod
+    def _key(scope, my_hash):
+        return "{prefix}{scope}:{hash}".format(prefix=CACHE_KEY_PREFIX, scope=scope, hash=my_hash)
+
+    @staticmethod
+    def _current_key(scope):
+        return CURRENT_KEY_PREFIX + str(scope)
+
+    def remember(self, scope, html, my_settings=None):
+        """
+        Store html, and return its hash. Nothing is written when the page is
+        stored already: in this process, or (being the current page of the
+        scope) in the shared tier, from which get() reads it when needed.
+        """
+        my_settings = my_settings or delta_responses_settings()
+        my_hash = page_hash(html)
+        my_key = self._key(scope, my_hash)
+        my_local = self._get_local(my_settings)
+        if my_local.get(my_key) is not None:
+            return my_hash # Stored already (and the shared tier is content addressed)
+        my_cache = None
+        if my_settings["shared_enabled"]:
+            try:
+                my_cache = caches[my_settings["shared_cache_alias"]]
+                if my_cache.get(self._current_key(scope)) == my_hash:
+                    return my_hash
+            except Exception: # A broken shared cache only costs full responses
+                my_cache = None
+        data = zlib.compress(html.encode("utf8"), 6)
+        my_local.set(my_key, data)
+        if my_cache is not None:
+            try:
+                my_cache.set_many({my_key: data, self._current_key(scope): my_hash}, my_settings["shared_ttl"])
+            except Exception:
+                pass
+        return my_hash
+
+    def get(self, scope, my_hash, my_settings=None):
+        """
+        The stored page, or None.
+        """
+        my_settings = my_settings or delta_responses_settings()
+        my_key = self._key(scope, my_hash)
+        my_local = self._get_local(my_settings)
+        data = my_local.get(my_key)
+        if data is None and my_settings["shared_enabled"]:
+            try:
+                data = caches[my_settings["shared_cache_alias"]].get(my_key)
+            except Exception:
+                data = None
+            if data is not None:
+                my_local.set(my_key, data)
+        if data is None:
+            return None
+        try:
+            return zlib.decompress(data).decode("utf8")
+        except (zlib.error, UnicodeDecodeError):
+            my_local.delete(my_key)
+            return None
+
+    def note_page(self, scope, response):
+        """
+        Store the renderedHTML of a successful response, and add its renderedHash.
+        Returns the settings, or None when delta responses are disabled.
+        """
+        my_settings = delta_responses_settings()
+        my_html = response.get('renderedHTML')
+        if not my_settings["enabled"] or not response.get('success') or not my_html or my_html == 'Error':
+            return None
+        response['renderedHash'] = self.remember(scope, my_html, my_settings)
+        return my_settings
+
+    def delta_response(self, scope, response, base_hash, metrics):
+        """
+        Replace the renderedHTML of response by a renderedPatch against the page
+        with base_hash, when that page is known and the patch is small enough.
+        base_hash is None when the request does not use delta responses: the
+        page is then not stored either.
+        """
+        if not isinstance(base_hash, str):
+            return
+        my_settings = self.note_page(scope, response)
+        if my_settings is None or not base_hash:
+            return
+        my_html = response['renderedHTML']
+        if base_hash == response['renderedHash']:
+            my_patch = {"base": base_hash, "baseLines": my_html.count("\n") + 1,
+                        "lines": my_html.count("\n") + 1, "ops": []}
+        else:
+            my_old = self.get(scope, base_hash, my_settings)
+            if my_old is None or max(my_old.count("\n"), my_html.count("\n")) >= my_settings["max_lines"]:
+                return
+            my_patch = make_patch(base_hash, my_old, my_html)
+        my_patch_size = len(json.dumps(my_patch))
+        metrics.size("rendered_patch_bytes", my_patch_size)
+        if my_patch_size < my_settings["max_ratio"] * len(my_html):
+            response['renderedPatch'] = my_patch
+            del response['renderedHTML']
+
+    def clear_local(self):
+        if self._local is not None:
+            self._local.clear()
+
+
+# The store shared by all blocks in this process
+rendered_pages = RenderedPages()
@@ -0,0 +1,90 @@
+"""
+Caches used when creating the encrypted problemJWT for the Standalone renderer.
+
+Creating the token involves building a jwk.JWK from the (base64url encoded)
+shared secret and a full A256KW/A256CBC-HS512 encryption. The claims only depend
+on the seed, psvn, problem path and the protected STANDALONE_MOVE_INTO_JWT
+values, so the same serialized token can be reused for identical claims.
+
+  * JWK objects are cached per (server key, SHA-256 hash of the secret), so
+    changing the secret in the course settings will create a new key. Courses
+    may use different secrets for the same server, so a few keys are kept per
+    server (the oldest is dropped).
+  * Serialized tokens are kept in a bounded LRU/TTL cache whose key is the full
+    claims tuple together with the key cache key.
+"""
+import hashlib
+import threading
+
+import jwcrypto.common
+from jwcrypto import jwk, jwt
+
+from .cache_utils import BoundedTTLCache
+
+JWT_HEADER = {"alg": "A256KW", "enc": "A256CBC-HS512"}
+
+# Default bounds of the serialized token cache
+TOKEN_CACHE_MAX_ENTRIES = 10000
+TOKEN_CACHE_TTL = 3600 # seconds
+
+# Keys kept per server (one per secret in use for it)
+KEYS_PER_SERVER = 16
+
+
+def secret_hash(secret):
+    return hashlib.sha256(str(secret).encode("utf8")).hexdigest()
+
+
+class ProblemJWTFactory:
+    """
+    Create (and cache) encrypted problem JWTs.
+    """
+    def __init__(self, max_tokens=TOKEN_CACHE_MAX_ENTRIES, token_ttl=TOKEN_CACHE_TTL):
+        self._keys_lock = threading.Lock()
+        self._keys = {} # (server_id, secret hash) -> jwk.JWK
+        self.tokens = BoundedTTLCache(max_entries=max_tokens, ttl=token_ttl)
+
+    def get_key(self, server_id, secret):
+        """
+        Return the JWK for the secret of server_id, building it only once.
+        """
+        my_key_id = (str(server_id), secret_hash(secret))
+        my_key = self._keys.get(my_key_id)
+        if my_key is None:
+            # Create the base64_urlencoded format needed by jwcrypto
+            my_key_encoded = jwcrypto.common.base64url_encode(secret)
+            my_key = jwk.JWK(**{"k": my_key_encoded, "kty": "oct"})
+            with self._keys_lock:
+                # Drop the oldest keys of the same server (secrets which were changed)
+                my_same_server = [k for k in self._keys if k[0] == my_key_id[0] and k != my_key_id]
+                for old_key_id in my_same_server[:max(len(my_same_server) - KEYS_PER_SERVER + 1, 0)]:
+                    del self._keys[old_key_id]
+                self._keys[my_key_id] = my_key
+        return my_key, my_key_id
+
+    def make_token(self, server_id, secret, claims, use_cache=True):
+        """
+        Return the serialized encrypted token for claims.
+        Exceptions from jwcrypto are passed to the caller.
+        """
+        my_key, my_key_id = self.get_key(server_id, secret)
+        my_cache_key = (my_key_id, tuple(sorted((str(k), str(v)) for k, v in claims.items())))
+        if use_cache:
+            my_token = self.tokens.get(my_cache_key)
+            if my_token is not None:
+                return my_token
+        my_etoken = jwt.JWT(header=JWT_HEADER, claims=claims)
+        my_etoken.make_encrypted_token(my_key)
+        my_token = my_etoken.serialize()
+        if use_cache:
+            self.tokens.set(my_cache_key, my_token)
+        return my_token
+
+    def clear(self):
+        with self._keys_lock:
+            self._keys.clear()
+        self.tokens.clear()
+
+
+# The factory shared by all blocks in this process
+problem_jwt_factory = ProblemJWTFactory()
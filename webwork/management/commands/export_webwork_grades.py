@@ -0,0 +1,40 @@
+"""
+Management command to export the WeBWorK grades and submission data of a course.
+
+Example:
+    ./manage.py lms export_webwork_grades course-v1:Org+Course+Run --format jsonl --output grades.jsonl
+"""
+import sys
+
+from django.core.management.base import BaseCommand
+from opaque_keys.edx.keys import CourseKey, UsageKey # pylint: disable=import-error
+
+from webwork.grade_export import EXPORT_FORMATS, ExportProgress, export_lines, grade_export_settings
+
+
+class Command(BaseCommand):
+    help = "Stream the WeBWorK grades and last submission data of the students of a course as CSV or JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('course', help="Course key.")
+        parser.add_argument('--block', action='append', dest='blocks',
+                            help="Usage key of a WeBWorK problem (may be repeated). Defaults to all the problems.")
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', dest='export_format')
+        parser.add_argument('--output', help="File to write. Defaults to the standard output.")
+        parser.add_argument('--batch-size', type=int, help="Student states read from the database at a time.")
+
+    def handle(self, *args, **options):
+        course_key = CourseKey.from_string(options['course'])
+        block_keys = [UsageKey.from_string(block) for block in options['blocks'] or []]
+        my_settings = grade_export_settings(batch_size=options['batch_size'])
+        # Progress goes to stderr, so it never mixes with an export written to stdout
+        progress = ExportProgress(report=lambda p: self.stderr.write(str(p)), every=my_settings["report_every"])
+        lines = export_lines(options['export_format'], course_key, block_keys,
+                             my_settings["batch_size"], progress)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf8', newline='') as output:
+                output.writelines(lines)
+        else:
+            sys.stdout.writelines(lines)
+            sys.stdout.flush()
+        self.stderr.write(self.style.SUCCESS("Done: " + str(progress)))
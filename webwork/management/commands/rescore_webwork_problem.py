@@ -0,0 +1,53 @@
+"""
+Management command to rescore a WeBWorK problem by replaying the stored answers of the students.
+
+Example:
+    ./manage.py lms rescore_webwork_problem block-v1:Org+Course+Run+type@webwork+block@abc \\
+        --concurrency 32 --checkpoint /tmp/rescore-abc.json
+"""
+from django.core.management.base import BaseCommand, CommandError
+from opaque_keys.edx.keys import UsageKey # pylint: disable=import-error
+
+from webwork.rescoring import RescoreCheckpoint, rescore_block
+
+
+class Command(BaseCommand):
+    help = "Replay the stored answers of all the students of a WeBWorK problem, and publish the grades which changed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('block', help="Usage key of the WeBWorK problem.")
+        parser.add_argument('--only-if-higher', action='store_true', help="Never lower a grade.")
+        parser.add_argument('--concurrency', type=int, help="Number of worker threads.")
+        parser.add_argument('--per-server-concurrency', type=int,
+                            help="Maximal renderer calls in flight to the server of the problem.")
+        parser.add_argument('--rate', type=float, help="Maximal renderer calls per second (0 = no limit).")
+        parser.add_argument('--batch-size', type=int, help="Student states read from the database at a time.")
+        parser.add_argument('--checkpoint', help="File recording the progress. A run with the same file resumes.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Replay the answers and count the grades which would change, without saving them.")
+
+    def handle(self, *args, **options):
+        from xmodule.modulestore.django import modulestore # pylint: disable=import-error
+        usage_key = UsageKey.from_string(options['block'])
+        store = modulestore()
+        course = store.get_course(usage_key.course_key)
+        if course is None:
+            raise CommandError("Unknown course {key}".format(key=usage_key.course_key))
+        block = store.get_item(usage_key)
+        if block.category != 'webwork':
+            raise CommandError("{key} is not a WeBWorK problem".format(key=usage_key))
+        try:
+            progress = rescore_block(
+                course, block,
+                only_if_higher = options['only_if_higher'],
+                concurrency = options['concurrency'],
+                per_server_concurrency = options['per_server_concurrency'],
+                rate = options['rate'],
+                batch_size = options['batch_size'],
+                checkpoint = RescoreCheckpoint(options['checkpoint']),
+                dry_run = options['dry_run'],
+                report = lambda p: self.stdout.write(str(p)),
+            )
+        except ValueError as err: # A checkpoint of another problem
+            raise CommandError(str(err))
+        self.stdout.write(self.style.SUCCESS("Done: " + str(progress)))
@@ -0,0 +1,37 @@
+"""
+Management command to warm the WeBWorK rendered problem cache before deadlines.
+
+Example:
+    ./manage.py lms warm_webwork_render_cache --hours 12 --course course-v1:Org+Course+Run
+"""
+from django.core.management.base import BaseCommand
+from opaque_keys.edx.keys import CourseKey # pylint: disable=import-error
+
+from webwork.cache_warming import warm_upcoming_deadlines
+
+
+class Command(BaseCommand):
+    help = "Render into the cache the WeBWorK problems of the students, for problems due in the next hours."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, help="Warm problems due within this many hours.")
+        parser.add_argument('--course', action='append', dest='courses',
+                            help="Course key (may be repeated). Defaults to all the courses which did not end.")
+        parser.add_argument('--concurrency', type=int, help="Number of parallel renderer calls.")
+        parser.add_argument('--rate', type=float, help="Maximal renderer calls per second (0 = no limit).")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only count the requests which would be rendered.")
+
+    def handle(self, *args, **options):
+        course_keys = None
+        if options['courses']:
+            course_keys = [CourseKey.from_string(course) for course in options['courses']]
+        progress = warm_upcoming_deadlines(
+            course_keys = course_keys,
+            hours = options['hours'],
+            concurrency = options['concurrency'],
+            rate = options['rate'],
+            dry_run = options['dry_run'],
+            report = lambda p: self.stdout.write(str(p)),
+        )
+        self.stdout.write(self.style.SUCCESS("Done: " + str(progress)))
@@ -0,0 +1,427 @@
+"""
+Timing and size metrics of the handler calls and of the renderer calls.
+
+Each call of submit_webwork_iframed gets a MetricsRecorder, which adds up the
+time spent in each phase:
+
+    settings_reload, period, jwt, http, json_parse, result_from_json, save_publish_grade, delta,
+    single_flight_wait (waiting for an identical renderer call made by another request)
+
+and the sizes (renderer_response_bytes, handler_response_bytes - the JSON,
+handler_response_encoded_bytes - as sent, and with minification on
+rendered_html_bytes and rendered_html_minified_bytes, rendered_patch_bytes
+when a patch was computed, and the user state saves: user_state_writes,
+user_state_writes_avoided and user_state_fields_skipped). When the call
+ends, everything is sent to the configured sink with the labels of the call:
+action, submit_type, server (the ww_server_id, or "manual") and outcome
+("ok", "refused", "renderer_error" or "exception").
+
+Sinks:
+  * "log"        - one log line per call (logger "webwork.metrics")
+  * "statsd"     - UDP datagrams to a statsd (or DogStatsD, with "statsd_tags") server
+  * "prometheus" - aggregated in the process, and published every
+                   "prometheus_flush_interval" seconds to a cache shared by the
+                   processes, so the /webwork/metrics view (see views.py) serves
+                   the sum over all the LMS processes in the Prometheus text format
+  * the dotted path of a MetricsSink subclass.
+
+When no sink is configured (the default), start() returns a shared recorder
+whose methods do nothing, so the instrumentation costs a few attribute lookups.
+
+Settings are read once per process from the optional WEBWORK_METRICS dictionary
+in the Django settings, see DEFAULT_METRICS_SETTINGS.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+log = logging.getLogger(__name__)
+
+DEFAULT_METRICS_SETTINGS = {
+    "sink": None, # None, "log", "statsd", "prometheus" or the dotted path of a MetricsSink subclass
+    "prefix": "webwork",
+    "statsd_host": "127.0.0.1",
+    "statsd_port": 8125,
+    "statsd_tags": False, # send the labels as DogStatsD tags instead of in the metric names
+    "prometheus_token": None, # when set, "Authorization: Bearer <token>" also gives access (besides staff users)
+    "prometheus_allow_anonymous": False, # serve the metrics to anyone
+    "prometheus_cache_alias": "default", # a key of the Django CACHES setting, shared by the processes
+    "prometheus_flush_interval": 10, # seconds between the publications of the counts of a process
+    "prometheus_ttl": 3600, # seconds the counts of a process are kept after its last publication
+    "prometheus_max_processes": 1000,
+}
+
+PROMETHEUS_SLOT_KEY_PREFIX = "webwork:metrics:slot:"
+PROMETHEUS_COUNTS_KEY_PREFIX = "webwork:metrics:counts:"
+
+# Upper bounds (in seconds) of the Prometheus histogram buckets of the phase durations
+PROMETHEUS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LABEL_NAMES = ("action", "submit_type", "server", "outcome")
+
+
+def metrics_settings():
+    my_settings = dict(DEFAULT_METRICS_SETTINGS)
+    my_settings.update(getattr(settings, "WEBWORK_METRICS", {}) or {})
+    return my_settings
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class NullRecorder:
+    """
+    Recorder used when metrics are disabled. Every method does nothing.
+    """
+    enabled = False
+
+    def phase(self, name):
+        return _NULL_PHASE
+
+    def add_time(self, name, seconds):
+        pass
+
+    def size(self, name, value):
+        pass
+
+    def label(self, **labels):
+        pass
+
+    def finish(self, **labels):
+        pass
+
+
+NULL_RECORDER = NullRecorder()
+
+
+class _Phase:
+    __slots__ = ("recorder", "name", "started")
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.add_time(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class MetricsRecorder:
+    """
+    Collects the phases, sizes and labels of one call. Phases which happen more
+    than once (for example http, when a request was retried) are added up.
+    """
+    enabled = True
+
+    def __init__(self, sink, action):
+        self.sink = sink
+        self.labels = {"action": action, "submit_type": "", "server": "", "outcome": "ok"}
+        self.phases = {}
+        self.sizes = {}
+        self.started = time.perf_counter()
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def add_time(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def size(self, name, value):
+        self.sizes[name] = self.sizes.get(name, 0) + value
+
+    def label(self, **labels):
+        self.labels.update({key: str(value) for key, value in labels.items()})
+
+    def finish(self, **labels):
+        self.label(**labels)
+        try:
+            self.sink.record(self.labels, time.perf_counter() - self.started, self.phases, self.sizes)
+        except Exception: # Metrics must never break a handler
+            log.exception("Could not record WeBWorK metrics")
+
+
+class MetricsSink:
+    """
+    Base class of the sinks. record() is called once at the end of each call.
+    """
+    def __init__(self, my_settings):
+        self.settings = my_settings
+        self.prefix = my_settings["prefix"]
+
+    def record(self, labels, duration, phases, sizes):
+        raise NotImplementedError
+
+
+class LogSink(MetricsSink):
+    def record(self, labels, duration, phases, sizes):
+        my_parts = ["{k}={v}".format(k=key, v=labels[key] or "-") for key in LABEL_NAMES]
+        my_parts.append("total_ms={v:.1f}".format(v=duration * 1000))
+        my_parts.extend("{k}_ms={v:.1f}".format(k=key, v=value * 1000) for key, value in sorted(phases.items()))
+        my_parts.extend("{k}={v}".format(k=key, v=value) for key, value in sorted(sizes.items()))
+        log.info("%s %s", self.prefix, " ".join(my_parts))
+
+
+class StatsdSink(MetricsSink):
+    """
+    Sends the metrics of a call in one (or a few) UDP datagrams. Never blocks.
+    """
+    MAX_DATAGRAM = 1400
+
+    def __init__(self, my_settings):
+        super().__init__(my_settings)
+        self.address = (my_settings["statsd_host"], int(my_settings["statsd_port"]))
+        self.use_tags = bool(my_settings["statsd_tags"])
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    @staticmethod
+    def _clean(value):
+        return "".join(c if c.isalnum() or c in "-_" else "_" for c in str(value)) or "none"
+
+    def _line(self, name, value, kind, labels):
+        if self.use_tags:
+            return "{prefix}.{name}:{value}|{kind}|#{tags}".format(
+                prefix=self.prefix, name=name, value=value, kind=kind,
+                tags=",".join("{k}:{v}".format(k=key, v=self._clean(labels[key])) for key in LABEL_NAMES))
+        return "{prefix}.{labels}.{name}:{value}|{kind}".format(
+            prefix=self.prefix, name=name, value=value, kind=kind,
+            labels=".".join(self._clean(labels[key]) for key in LABEL_NAMES))
+
+    def record(self, labels, duration, phases, sizes):
+        my_lines = [self._line("requests", 1, "c", labels),
+                    self._line("duration", "{v:.3f}".format(v=duration * 1000), "ms", labels)]
+        my_lines.extend(self._line("phase." + name, "{v:.3f}".format(v=value * 1000), "ms", labels)
+                        for name, value in phases.items())
+        my_lines.extend(self._line(name, value, "h", labels) for name, value in sizes.items())
+        my_datagram = ""
+        for line in my_lines:
+            if my_datagram and len(my_datagram) + len(line) + 1 > self.MAX_DATAGRAM:
+                self._send(my_datagram)
+                my_datagram = ""
+            my_datagram = line if not my_datagram else my_datagram + "\n" + line
+        if my_datagram:
+            self._send(my_datagram)
+
+    def _send(self, datagram):
+        try:
+            self._socket.sendto(datagram.encode("utf8"), self.address)
+        except OSError:
+            pass # Dropped, like any UDP packet
+
+
+class PrometheusSink(MetricsSink):
+    """
+    Aggregates the metrics in the process, and publishes the counts to the
+    shared cache, where each process has a numbered slot (taken with
+    cache.add) holding the id of the process, and its counts under that id.
+    render_text() adds up the counts of all the processes.
+    """
+    def __init__(self, my_settings):
+        super().__init__(my_settings)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._id = uuid.uuid4().hex
+        self._slot = None
+        self._flushed_at = 0.0
+        self._requests = {} # labels -> count
+        self._durations = {} # (phase, labels) -> [bucket counts..., sum, count]
+        self._sizes = {} # (name, labels) -> [sum, count]
+
+    def _counts(self):
+        return {
+            "requests": dict(self._requests),
+            "durations": {key: list(entry) for key, entry in self._durations.items()},
+            "sizes": {key: list(entry) for key, entry in self._sizes.items()},
+        }
+
+    def _observe(self, key, seconds):
+        my_entry = self._durations.get(key)
+        if my_entry is None:
+            my_entry = self._durations[key] = [0] * len(PROMETHEUS_BUCKETS) + [0.0, 0]
+        for index, bound in enumerate(PROMETHEUS_BUCKETS):
+            if seconds <= bound:
+                my_entry[index] += 1
+        my_entry[-2] += seconds
+        my_entry[-1] += 1
+
+    def record(self, labels, duration, phases, sizes):
+        my_labels = tuple(labels[key] for key in LABEL_NAMES)
+        with self._lock:
+            if os.getpid() != self._pid: # Forked: the counts belong to the parent
+                self._reset()
+            self._requests[my_labels] = self._requests.get(my_labels, 0) + 1
+            self._observe(("total", my_labels), duration)
+            for name, value in phases.items():
+                self._observe((name, my_labels), value)
+            for name, value in sizes.items():
+                my_entry = self._sizes.setdefault((name, my_labels), [0, 0])
+                my_entry[0] += value
+                my_entry[1] += 1
+            my_counts = None
+            if time.monotonic() - self._flushed_at >= self.settings["prometheus_flush_interval"]:
+                self._flushed_at = time.monotonic()
+                my_counts = self._counts()
+        if my_counts is not None:
+            self._publish(my_counts)
+
+    def _cache(self):
+        return caches[self.settings["prometheus_cache_alias"]]
+
+    def _publish(self, my_counts):
+        """
+        Store the counts of this process in the shared cache, taking (or renewing) its slot.
+        """
+        my_ttl = self.settings["prometheus_ttl"]
+        try:
+            my_cache = self._cache()
+            if self._slot is None or my_cache.get(PROMETHEUS_SLOT_KEY_PREFIX + str(self._slot)) != self._id:
+                self._slot = None
+                for my_slot in range(self.settings["prometheus_max_processes"]):
+                    if my_cache.add(PROMETHEUS_SLOT_KEY_PREFIX + str(my_slot), self._id, my_ttl):
+                        self._slot = my_slot
+                        break
+                if self._slot is None:
+                    log.warning("No free WeBWorK metrics slot, raise prometheus_max_processes")
+                    return
+            else:
+                my_cache.set(PROMETHEUS_SLOT_KEY_PREFIX + str(self._slot), self._id, my_ttl)
+            my_cache.set(PROMETHEUS_COUNTS_KEY_PREFIX + self._id, my_counts, my_ttl)
+        except Exception: # The view then only shows the counts of the process it runs in
+            log.exception("Could not publish the WeBWorK metrics")
+
+    def collect(self):
+        """
+        The counts of all the processes which published theirs (this one included,
+        published first).
+        """
+        with self._lock:
+            my_counts = self._counts()
+            self._flushed_at = time.monotonic()
+        self._publish(my_counts)
+        try:
+            my_cache = self._cache()
+            my_ids = my_cache.get_many([PROMETHEUS_SLOT_KEY_PREFIX + str(my_slot)
+                                        for my_slot in range(self.settings["prometheus_max_processes"])])
+            my_ids = set(my_ids.values()) - {self._id}
+            my_others = my_cache.get_many([PROMETHEUS_COUNTS_KEY_PREFIX + my_id for my_id in my_ids])
+        except Exception:
+            log.exception("Could not read the WeBWorK metrics of the other processes")
+            my_others = {}
+        return [my_counts] + list(my_others.values())
+
+    @staticmethod
+    def _add_up(all_counts):
+        my_total = {"requests": {}, "durations": {}, "sizes": {}}
+        for my_counts in all_counts:
+            for my_labels, count in my_counts["requests"].items():
+                my_total["requests"][my_labels] = my_total["requests"].get(my_labels, 0) + count
+            for table in ("durations", "sizes"):
+                for key, entry in my_counts[table].items():
+                    my_sum = my_total[table].get(key)
+                    my_total[table][key] = list(entry) if my_sum is None else [a + b for a, b in zip(my_sum, entry)]
+        return my_total
+
+    @staticmethod
+    def _format_labels(my_labels, **extra):
+        my_pairs = list(zip(LABEL_NAMES, my_labels)) + list(extra.items())
+        return "{" + ",".join('{k}="{v}"'.format(
+            k=key, v=str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in my_pairs) + "}"
+
+    def render_text(self):
+        """
+        The metrics of all the LMS processes in the Prometheus text format.
+        """
+        my_total = self._add_up(self.collect())
+        my_lines = []
+        my_name = self.prefix + "_requests_total"
+        my_lines.append("# TYPE {n} counter".format(n=my_name))
+        for my_labels, count in sorted(my_total["requests"].items()):
+            my_lines.append("{n}{l} {v}".format(n=my_name, l=self._format_labels(my_labels), v=count))
+        my_name = self.prefix + "_phase_seconds"
+        my_lines.append("# TYPE {n} histogram".format(n=my_name))
+        for (phase, my_labels), entry in sorted(my_total["durations"].items()):
+            for index, bound in enumerate(PROMETHEUS_BUCKETS):
+                my_lines.append("{n}_bucket{l} {v}".format(
+                    n=my_name, l=self._format_labels(my_labels, phase=phase, le=bound), v=entry[index]))
+            my_lines.append("{n}_bucket{l} {v}".format(
+                n=my_name, l=self._format_labels(my_labels, phase=phase, le="+Inf"), v=entry[-1]))
+            my_lines.append("{n}_sum{l} {v}".format(n=my_name, l=self._format_labels(my_labels, phase=phase), v=entry[-2]))
+            my_lines.append("{n}_count{l} {v}".format(n=my_name, l=self._format_labels(my_labels, phase=phase), v=entry[-1]))
+        my_name = self.prefix + "_bytes"
+        my_lines.append("# TYPE {n} summary".format(n=my_name))
+        for (name, my_labels), entry in sorted(my_total["sizes"].items()):
+            my_lines.append("{n}_sum{l} {v}".format(n=my_name, l=self._format_labels(my_labels, size=name), v=entry[0]))
+            my_lines.append("{n}_count{l} {v}".format(n=my_name, l=self._format_labels(my_labels, size=name), v=entry[1]))
+        return "\n".join(my_lines) + "\n"
+
+
+SINKS = {
+    "log": LogSink,
+    "statsd": StatsdSink,
+    "prometheus": PrometheusSink,
+}
+
+
+class HandlerMetrics:
+    """
+    Creates the recorders. The sink is set up on first use.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._configured = False
+        self.sink = None
+
+    def configure(self, my_settings=None):
+        my_settings = my_settings or metrics_settings()
+        my_sink = my_settings["sink"]
+        if not my_sink:
+            self.sink = None
+        elif my_sink in SINKS:
+            self.sink = SINKS[my_sink](my_settings)
+        else:
+            from django.utils.module_loading import import_string
+            self.sink = import_string(my_sink)(my_settings)
+        self._configured = True
+
+    def start(self, action):
+        """
+        A recorder for one call of action, or NULL_RECORDER when disabled.
+        """
+        if not self._configured:
+            with self._lock:
+                if not self._configured:
+                    try:
+                        self.configure()
+                    except Exception: # A bad setting disables the metrics, but never breaks handlers
+                        log.exception("Could not set up the WeBWorK metrics sink")
+                        self.sink = None
+                        self._configured = True
+        if self.sink is None:
+            return NULL_RECORDER
+        return MetricsRecorder(self.sink, action)
+
+
+# The single instance shared by all blocks in this process
+handler_metrics = HandlerMetrics()
@@ -0,0 +1,37 @@
+from django.db import migrations, models
+import django.utils.timezone
+import opaque_keys.edx.django.models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeBWorKSubmission',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('course_key', opaque_keys.edx.django.models.CourseKeyField(max_length=255)),
+                ('usage_key', opaque_keys.edx.django.models.UsageKeyField(max_length=255)),
+                ('anonymous_user_id', models.CharField(max_length=64)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempt', models.PositiveIntegerField(help_text='student_attempts after the submission')),
+                ('raw_score', models.FloatField(help_text='Score reported by WeBWorK (0 to 1)')),
+                ('scaled_score', models.FloatField()),
+                ('counted', models.BooleanField(help_text='Whether the submission was graded for credit')),
+                ('data', models.TextField(help_text='JSON of the complete submission data (format 1 layout, nothing cut)')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='webworksubmission',
+            index=models.Index(fields=['course_key', 'usage_key', 'anonymous_user_id', 'created'], name='webwork_sub_block_user_time'),
+        ),
+        migrations.AddIndex(
+            model_name='webworksubmission',
+            index=models.Index(fields=['course_key', 'created'], name='webwork_sub_course_time'),
+        ),
+    ]
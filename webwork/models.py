@@ -0,0 +1,37 @@
+"""
+Database models of the webwork app.
+"""
+from django.db import models
+from django.utils import timezone
+from opaque_keys.edx.django.models import CourseKeyField, UsageKeyField # pylint: disable=import-error
+
+
+class WeBWorKSubmission(models.Model):
+    """
+    One graded submission to a WeBWorK problem. Rows are only ever added.
+
+    The user_state of the block only keeps the latest submission, so this log
+    keeps the history without making the state loaded on every view larger.
+    """
+    id = models.BigAutoField(primary_key=True)
+    course_key = CourseKeyField(max_length=255)
+    usage_key = UsageKeyField(max_length=255)
+    anonymous_user_id = models.CharField(max_length=64)
+    created = models.DateTimeField(default=timezone.now)
+    attempt = models.PositiveIntegerField(help_text="student_attempts after the submission")
+    raw_score = models.FloatField(help_text="Score reported by WeBWorK (0 to 1)")
+    scaled_score = models.FloatField()
+    counted = models.BooleanField(help_text="Whether the submission was graded for credit")
+    data = models.TextField(help_text="JSON of the complete submission data (format 1 layout, nothing cut)")
+
+    class Meta:
+        app_label = 'webwork'
+        indexes = [
+            models.Index(fields=['course_key', 'usage_key', 'anonymous_user_id', 'created'],
+                         name='webwork_sub_block_user_time'),
+            models.Index(fields=['course_key', 'created'], name='webwork_sub_course_time'),
+        ]
+
+    def __str__(self):
+        return "WeBWorKSubmission({usage}, {user}, {created})".format(
+            usage=self.usage_key, user=self.anonymous_user_id, created=self.created)
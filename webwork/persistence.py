@@ -0,0 +1,162 @@
+"""
+Dirty tracking of the per-student fields of the XBlock.
+
+XBlock marks a field as dirty whenever it is assigned (even with the value it
+already had), and the LMS then writes the StudentModule row when the block is
+saved. The block takes a snapshot of its per-student fields when a request
+starts, and save() only persists fields whose value really changed since then.
+
+The module keeps process-wide counters of the saves which were made and of
+those which were avoided (shown by the renderer_stats handler), and the block
+reports the writes of each handler call to the metrics.
+
+The tracking uses attributes of XBlock which are not part of its public API
+(_dirty_fields, _field_data_cache and _get_fields_to_save, as in XBlock 1.4,
+used by edx-platform Lilac). When they are missing, save() is the plain XBlock
+save(), and a warning is logged once.
+"""
+import copy
+import logging
+import threading
+
+from xblock.fields import Scope
+
+log = logging.getLogger(__name__)
+
+# Scopes whose fields are stored per student, and which are tracked
+TRACKED_SCOPES = (Scope.user_state, Scope.preferences)
+
+
+class UserStateWriteStats:
+    """
+    Thread safe counters of block saves.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.writes_avoided = 0
+        self.fields_skipped = 0
+
+    def record(self, wrote, fields_skipped=0):
+        with self._lock:
+            if wrote:
+                self.writes += 1
+            else:
+                self.writes_avoided += 1
+            self.fields_skipped += fields_skipped
+
+    def stats(self):
+        with self._lock:
+            return {
+                "writes": self.writes,
+                "writes_avoided": self.writes_avoided,
+                "fields_skipped": self.fields_skipped,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.writes = 0
+            self.writes_avoided = 0
+            self.fields_skipped = 0
+
+
+user_state_write_stats = UserStateWriteStats()
+
+# The XBlock attributes the dirty tracking relies on
+XBLOCK_INTERNALS = ("_dirty_fields", "_field_data_cache", "_get_fields_to_save")
+
+_unsupported_logged = False
+
+
+def tracking_supported(block):
+    """
+    Whether block has the XBlock internals used by the dirty tracking.
+    """
+    global _unsupported_logged # pylint: disable=global-statement
+    if all(hasattr(block, name) for name in XBLOCK_INTERNALS):
+        return True
+    if not _unsupported_logged:
+        _unsupported_logged = True
+        log.warning("This XBlock version lacks %s: the unchanged user state is saved as usual",
+                    ", ".join(XBLOCK_INTERNALS))
+    return False
+
+
+def tracked_fields(block):
+    return [field for field in block.fields.values() if field.scope in TRACKED_SCOPES]
+
+
+def snapshot_fields(block, fields):
+    """
+    JSON values of fields, as they would be written to the database.
+    The values are deep copies: to_json() returns the live Dict/List objects,
+    and a snapshot sharing them would follow in-place changes (such as
+    student_answer.clear()), so the field would look unchanged.
+    """
+    return {field.name: copy.deepcopy(field.to_json(field.read_from(block))) for field in fields}
+
+
+class DirtyTrackingMixin:
+    """
+    Mixin for an XBlock which skips saving per-student fields whose value did not change.
+
+    Call snapshot_user_state() at the start of each view/handler.
+    """
+    _user_state_snapshot = None
+    _user_state_writes = 0 # saves which wrote since the snapshot
+
+    def snapshot_user_state(self):
+        self._user_state_writes = 0
+        if tracking_supported(self):
+            self._user_state_snapshot = snapshot_fields(self, tracked_fields(self))
+
+    def _unchanged_dirty_fields(self):
+        """
+        The dirty fields whose JSON value equals the snapshot value.
+        """
+        snapshot = self._user_state_snapshot
+        if snapshot is None:
+            return []
+        unchanged = []
+        for field in list(self._dirty_fields):
+            if field.name not in snapshot or field.name not in self._field_data_cache:
+                continue
+            if field.to_json(self._field_data_cache[field.name]) == snapshot[field.name]:
+                unchanged.append(field)
+        return unchanged
+
+    def _drop_unchanged_dirty_fields(self):
+        """
+        Stop tracking dirty fields whose JSON value equals the snapshot value.
+        Returns the number of fields which were dropped.
+        """
+        unchanged = self._unchanged_dirty_fields()
+        for field in unchanged:
+            del self._dirty_fields[field]
+        return len(unchanged)
+
+    def user_state_write_counts(self):
+        """
+        (writes, writes avoided, fields skipped) since the snapshot, counting the
+        save which the runtime makes after the handler, for the metrics.
+        """
+        if self._user_state_snapshot is None or not tracking_supported(self):
+            return self._user_state_writes, 0, 0
+        unchanged = len(self._unchanged_dirty_fields())
+        changed = len(self._dirty_fields) - unchanged
+        return self._user_state_writes + (1 if changed else 0), 1 if unchanged and not changed else 0, unchanged
+
+    def save(self):
+        if not tracking_supported(self):
+            super().save()
+            return
+        skipped = self._drop_unchanged_dirty_fields()
+        fields_to_save = self._get_fields_to_save()
+        user_state_write_stats.record(bool(fields_to_save), skipped)
+        if fields_to_save:
+            self._user_state_writes += 1
+        super().save()
+        if fields_to_save and self._user_state_snapshot is not None:
+            # The saved values are now the persisted baseline
+            saved = [self.fields[name] for name in fields_to_save if name in self._user_state_snapshot]
+            self._user_state_snapshot.update(snapshot_fields(self, saved))
@@ -0,0 +1,120 @@
+"""
+Problem periods (before the deadline, lock-down, after the lock-down) and the
+caches used to sort requests into them cheaply.
+
+  * The grace period of a course is read from the grading policy, which requires
+    loading the course. It is cached per (course, shared version stamp of the
+    course settings, see course_settings.py). Publishing the course or changing
+    its grading policy, in any process (typically Studio), bumps the stamp, so
+    every LMS process loads the new grace period. In the process receiving the
+    signal the entries of the course are also dropped at once.
+  * The transition instants of a problem (lock begin = due + grace, lock end =
+    lock begin + lock-down period) are two additions, computed on each call.
+"""
+import datetime
+from enum import IntFlag, unique
+
+from django.dispatch import receiver
+
+from .cache_utils import BoundedTTLCache
+from .course_settings import course_settings_registry
+
+try:
+    from xmodule.modulestore.django import SignalHandler # pylint: disable=import-error
+except ImportError:
+    SignalHandler = None # Outside of edx-platform (e.g. in the unit tests)
+
+try:
+    from cms.djangoapps.contentstore.signals.signals import GRADING_POLICY_CHANGED # pylint: disable=import-error
+except ImportError:
+    GRADING_POLICY_CHANGED = None # We are not in Studio. Publishing the course also invalidates the cache.
+
+GRACE_PERIOD_CACHE_TTL = 300 # seconds
+
+
+@unique # decorator to enforce different integer values for each period
+class PPeriods(IntFlag):
+    UnKnown = 0
+    NoDue = 1 # some problem are due-dateless
+    PreDue = 2 # The problem due date is in the future
+    PostDue = 3
+    Locked =  4 # Problem locked for submissions/watch answers etc.
+    UnLocked = 5
+    PostDueLocked = PostDue * Locked
+    PostDueUnLocked = PostDue * UnLocked
+
+
+ZERO_GRACE = datetime.timedelta(hours=0, minutes=0, seconds=0)
+
+
+def grace_timedelta_from_policy(graceperiod):
+    """
+    Convert the grace_period of a grading policy into a timedelta.
+    """
+    if graceperiod is None:
+        return ZERO_GRACE
+    return datetime.timedelta(
+        hours = graceperiod['hours'],
+        minutes = graceperiod['minutes'],
+        seconds = graceperiod['seconds']
+        )
+
+
+class ProblemPeriodEngine:
+    """
+    Cache of the course grace periods, and the classification of a time
+    against the transition instants of a problem.
+    """
+    def __init__(self):
+        self.grace_periods = BoundedTTLCache(max_entries=1000, ttl=GRACE_PERIOD_CACHE_TTL)
+
+    def grace_period(self, course_id, loader, shared_version=None):
+        """
+        Grace period timedelta of course_id. loader() is called on a cache miss.
+        shared_version is the shared version stamp of the course settings seen
+        by the caller (CourseWebWorKSettings.shared_version).
+        """
+        my_key = (str(course_id), shared_version)
+        my_grace = self.grace_periods.get(my_key)
+        if my_grace is None:
+            my_grace = loader()
+            self.grace_periods.set(my_key, my_grace)
+        return my_grace
+
+    @staticmethod
+    def transitions(due, grace, lockdown_hours):
+        """
+        Return (lock_date_begin, lock_date_end) for a problem with a due date.
+        """
+        my_lock_begin = due + grace
+        return (my_lock_begin, my_lock_begin + datetime.timedelta(hours = lockdown_hours))
+
+    @staticmethod
+    def classify(now, lock_date_begin, lock_date_end):
+        if now < lock_date_begin:
+            return PPeriods.PreDue
+        if now < lock_date_end:
+            return PPeriods.PostDueLocked
+        return PPeriods.PostDueUnLocked
+
+    def invalidate_course(self, course_id):
+        my_course = str(course_id)
+        self.grace_periods.delete_matching(lambda key: key[0] == my_course)
+
+
+# The engine shared by all blocks in this process
+problem_period_engine = ProblemPeriodEngine()
+
+
+if SignalHandler is not None:
+    @receiver(SignalHandler.course_published, dispatch_uid="webwork_problem_periods_published")
+    def _handle_course_published(sender, course_key, **kwargs): # pylint: disable=unused-argument
+        problem_period_engine.invalidate_course(course_key)
+
+
+if GRADING_POLICY_CHANGED is not None:
+    @receiver(GRADING_POLICY_CHANGED, dispatch_uid="webwork_problem_periods_grading_policy")
+    def _handle_grading_policy_changed(sender, course_key=None, **kwargs): # pylint: disable=unused-argument
+        if course_key is not None:
+            problem_period_engine.invalidate_course(course_key)
+            course_settings_registry.bump_shared_version(course_key) # For the LMS processes
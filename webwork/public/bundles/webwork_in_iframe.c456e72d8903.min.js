@@ -0,0 +1,294 @@
+function WeBWorKXBlockIframed(runtime, element, initdata) {
+var handlerUrl = runtime.handlerUrl(element, 'submit_webwork_iframed');
+var renderedHtmlUrl = runtime.handlerUrl(element, 'rendered_html');
+let problemiframe = document.getElementById(initdata.rpID);
+let messageDiv = document.getElementById(initdata.messageDivID);
+let resultDiv = document.getElementById(initdata.resultDivID);
+var hideShowAnswers = false;
+var hidePreview = false;
+var hideSubmit = false;
+var currentHTML = null;
+var currentHash = null;
+function applyPatch(patch) {
+if (currentHTML === null || patch.base !== currentHash) {
+return null;
+}
+let lines = currentHTML.split("\n");
+if (lines.length !== patch.baseLines) {
+return null;
+}
+for (let i = patch.ops.length - 1; i >= 0; i--) {
+let op = patch.ops[i];
+lines.splice(op[0], op[1] - op[0], ...op[2]);
+}
+if (lines.length !== patch.lines) {
+return null;
+}
+return lines.join("\n");
+}
+function showPage(html, hash) {
+currentHTML = html;
+currentHash = hash || null;
+problemiframe.srcdoc = html;
+}
+function childSignature(node) {
+return Array.from(node.childNodes).map(
+child => child.nodeType === Node.ELEMENT_NODE ? "<" + child.tagName : child.nodeType + ":" + child.nodeValue
+).join("\u0000");
+}
+function sameAttributes(oldNode, newNode) {
+if (oldNode.attributes.length !== newNode.attributes.length) {
+return false;
+}
+return Array.from(oldNode.attributes).every(attr => newNode.getAttribute(attr.name) === attr.value);
+}
+function changedRegions(oldNode, newNode, liveNode, regions) {
+if (oldNode.isEqualNode(newNode)) {
+return true;
+}
+if (!liveNode || liveNode.tagName !== newNode.tagName) {
+return false;
+}
+let oldChildren = oldNode.children;
+let liveChildren = liveNode.children;
+let recurse = oldNode.tagName === newNode.tagName && sameAttributes(oldNode, newNode)
+&& childSignature(oldNode) === childSignature(newNode)
+&& liveChildren.length === oldChildren.length
+&& Array.from(liveChildren).every((child, i) => child.tagName === oldChildren[i].tagName);
+if (!recurse) {
+regions.push([liveNode, newNode]);
+return true;
+}
+for (let i = 0; i < oldChildren.length; i++) {
+if (!changedRegions(oldChildren[i], newNode.children[i], liveChildren[i], regions)) {
+return false;
+}
+}
+return true;
+}
+function patchLivePage(html) {
+let doc = problemiframe.contentDocument;
+if (currentHTML === null || !doc || doc.readyState !== 'complete' || !doc.body) {
+return false;
+}
+let parser = new DOMParser();
+let oldDoc = parser.parseFromString(currentHTML, "text/html");
+let newDoc = parser.parseFromString(html, "text/html");
+if (!oldDoc.head.isEqualNode(newDoc.head) || !sameAttributes(oldDoc.body, newDoc.body)) {
+return false;
+}
+let regions = [];
+if (!changedRegions(oldDoc.body, newDoc.body, doc.body, regions)) {
+return false;
+}
+let hasScripts = regions.some(([, newNode]) => Array.from(newNode.querySelectorAll("script")).concat(
+newNode.tagName === "SCRIPT" ? [newNode] : []).some(script => !/^math\//.test(script.type || "")));
+if (hasScripts || regions.some(([liveNode]) => liveNode === doc.body)) {
+return false;
+}
+let replaced = regions.map(([liveNode, newNode]) => {
+let node = doc.importNode(newNode, true);
+liveNode.replaceWith(node);
+return node;
+});
+let mathJax = problemiframe.contentWindow.MathJax;
+if (mathJax && replaced.length) {
+if (mathJax.typesetPromise) {
+mathJax.typesetPromise(replaced);
+} else if (mathJax.Hub) {
+replaced.forEach(node => mathJax.Hub.Queue(["Typeset", mathJax.Hub, node]));
+}
+}
+return true;
+}
+function updatePage(html, hash) {
+let patched = false;
+try {
+patched = patchLivePage(html);
+} catch (err) {
+patched = false;
+}
+if (patched) {
+currentHTML = html;
+currentHash = hash || null;
+} else {
+showPage(html, hash);
+}
+}
+function showFullPage(hash) {
+currentHTML = null;
+currentHash = null;
+$.ajax({
+type: "POST",
+url: renderedHtmlUrl,
+data: JSON.stringify({ "renderedHash": hash }),
+success: function(result) {
+if (result.success) {
+showPage(result.renderedHTML, result.renderedHash);
+} else {
+initialLoad();
+}
+},
+error: function() { initialLoad(); }
+});
+}
+function handleResponse(result) {
+messageDiv.innerHTML = "";
+resultDiv.innerHTML = "";
+if (result.success) {
+if (result.renderedPatch) {
+let html = null;
+try {
+html = applyPatch(result.renderedPatch);
+} catch (err) {
+html = null;
+}
+if (html === null) {
+showFullPage(result.renderedHash);
+} else if (html !== currentHTML) {
+updatePage(html, result.renderedHash);
+}
+} else {
+updatePage(result.renderedHTML, result.renderedHash);
+}
+if (result.scored) {
+resultDiv.innerHTML = result.score;
+}
+if (result.message) {
+messageDiv.innerHTML = result.message;
+}
+} else {
+if (result.scored) {
+resultDiv.innerHTML = result.score;
+}
+if (result.message) {
+messageDiv.innerHTML = result.message;
+}
+}
+hideShowAnswers = result.hideShowAnswers;
+hidePreview = result.hidePreview;
+hideSubmit = result.hideSubmit
+insertListener();
+hideButtons();
+}
+function hideButtons(result) {
+let problemForm = problemiframe.contentWindow.document.getElementById('problemMainForm')  // don't croak when the empty iframe is first loaded
+if (!problemForm) {
+/* console.log('hideButtons: could not find form! has a problem been rendered?'); */
+return;
+}
+/* console.log('hideButtons: enabling/disabling show answers'); */
+var my_buttons = problemiframe.contentWindow.document.getElementsByName("showCorrectAnswers") // name in standalone
+my_buttons.forEach(button => { button.disabled = hideShowAnswers; })
+my_buttons = problemiframe.contentWindow.document.getElementsByName("WWcorrectAns") // name in html2xml
+my_buttons.forEach(button => { button.disabled = hideShowAnswers; })
+/* console.log('hideButtons: enabling/disabling preview'); */
+my_buttons = problemiframe.contentWindow.document.getElementsByName("previewAnswers") // name in standalone
+my_buttons.forEach(button => { button.disabled = hidePreview; })
+my_buttons = problemiframe.contentWindow.document.getElementsByName("preview") // name in html2xml
+my_buttons.forEach(button => { button.disabled = hidePreview; })
+/* console.log('hideButtons: enabling/disabling submit'); */
+my_buttons = problemiframe.contentWindow.document.getElementsByName("submitAnswers") // name in standalone
+my_buttons.forEach(button => { button.disabled = hideSubmit; })
+my_buttons = problemiframe.contentWindow.document.getElementsByName("WWsubmit") // name in html2xml
+my_buttons.forEach(button => { button.disabled = hideSubmit; })
+}
+function activeButton() {
+let problemForm = problemiframe.contentWindow.document.getElementById('problemMainForm')
+if (!problemForm) {
+/* console.log('could not find form! has a problem been rendered?'); */
+return;
+}
+problemForm.querySelectorAll('.btn-primary').forEach(
+button => {
+button.addEventListener('click', () => {
+/* console.log('clicked: ', button); */
+})
+})
+}
+function insertListener() {
+let problemForm = problemiframe.contentWindow.document.getElementById('problemMainForm')  // don't croak when the empty iframe is first loaded
+if (!problemForm) {
+return;
+}
+if (problemForm.dataset.webworkListener) {
+return;
+}
+problemForm.dataset.webworkListener = "1";
+problemForm.addEventListener('submit', event => {
+event.preventDefault();
+let formData = new FormData(problemForm)
+let clickedButton = event.submitter;
+if (clickedButton == null) {
+console.log('Error could not determine which button was clicked');
+alert('Error could not determine which button was clicked');
+return 0;
+}
+formData.set(clickedButton.name, clickedButton.value);
+formData.set("submit_type", clickedButton.name);
+formData.set("renderedHash", currentHash !== null ? currentHash : "");
+const formDataEntries = formData.entries();
+let formJsonData = {};
+formData.forEach(
+( value, key ) => {
+if ( Object.prototype.hasOwnProperty.call( formJsonData, key ) ) {
+let current = formJsonData[ key ];
+if ( !Array.isArray( current ) ) {
+current = formJsonData[ key ] = [ current ];
+}
+current.push( value ); // Add the new value to the array.
+} else {
+formJsonData[ key ] = value;
+}
+}
+);
+$.ajax({
+type: "POST",
+url: handlerUrl,
+data: JSON.stringify(formJsonData),
+success: handleResponse,
+error: handleResponse
+});
+return 0;
+})
+}
+function initialLoad() {
+let formJsonData = { "submit_type": "initialLoad", "renderedHash": "" };
+$.ajax({
+type: "POST",
+url: handlerUrl,
+data: JSON.stringify(formJsonData),
+success: handleResponse,
+error: handleResponse
+});
+return 0;
+}
+problemiframe.addEventListener('load', () => {
+/* console.log('loaded...' + initdata.rpID); */
+activeButton();
+insertListener();
+hideButtons();
+})
+if (initdata.initialResponse) {
+/* The problem was rendered into the srcdoc by student_view, so only apply
+the messages and button settings of the initial load. */
+let result = initdata.initialResponse;
+if (result.renderedHash) {
+currentHTML = problemiframe.srcdoc;
+currentHash = result.renderedHash;
+}
+if (result.message) {
+messageDiv.innerHTML = result.message;
+}
+hideShowAnswers = result.hideShowAnswers;
+hidePreview = result.hidePreview;
+hideSubmit = result.hideSubmit;
+if (problemiframe.contentWindow.document.readyState === 'complete') {
+activeButton();
+insertListener();
+hideButtons();
+}
+} else {
+initialLoad();
+}
+}
@@ -0,0 +1,175 @@
+"""
+Two-tier cache of rendered problems used for "initialLoad" requests.
+
+The problem HTML returned by the renderer for an initial load is deterministic
+for a given (server, problem, seed, psvn, language, numCorrect, numIncorrect,
+hint/solution flags), so there is no need to ask the renderer again each time
+a student reloads the unit.
+
+  * The front tier is a bounded in-process LRU cache (per LMS worker process).
+  * The back tier uses the Django cache framework, so all the LMS workers share
+    entries. Values are stored as zlib compressed JSON.
+
+The cache key includes a fingerprint of the course "webwork_settings", so any
+change to those settings invalidates the cached renders of the course.
+
+Settings are read from the optional WEBWORK_RENDER_CACHE dictionary in the
+Django settings, see DEFAULT_RENDER_CACHE_SETTINGS for the supported keys.
+"""
+import hashlib
+import json
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .cache_utils import BoundedTTLCache
+
+DEFAULT_RENDER_CACHE_SETTINGS = {
+    "enabled": True,
+    "local_max_entries": 2000,
+    "local_max_bytes": 64 * 1024 * 1024, # size of the compressed values
+    "local_ttl": 300, # seconds
+    "shared_enabled": True,
+    "shared_cache_alias": "default",
+    "shared_ttl": 3600, # seconds
+    "compress_level": 6,
+}
+
+CACHE_KEY_PREFIX = "webwork:render:"
+
+# Only these fields of the renderer response are needed to display the initial load
+RESPONSE_FIELDS_TO_CACHE = ("renderedHTML",)
+
+
+def render_cache_settings():
+    my_settings = dict(DEFAULT_RENDER_CACHE_SETTINGS)
+    my_settings.update(getattr(settings, "WEBWORK_RENDER_CACHE", {}) or {})
+    return my_settings
+
+
+def settings_fingerprint(webwork_settings):
+    """
+    A short stable hash of the course webwork_settings (or any JSON-able data).
+    """
+    my_dump = json.dumps(webwork_settings, sort_keys=True, default=str)
+    return hashlib.sha256(my_dump.encode("utf8")).hexdigest()[:16]
+
+
+def make_render_key(course_id, fingerprint, server_key, params):
+    """
+    The cache key for a render request. params should be the complete request
+    parameters (problem, seed, psvn, language, counters, flags, ...) before any
+    credentials or JWT are added.
+    """
+    my_dump = json.dumps(
+        [str(server_key), {str(k): str(v) for k, v in params.items()}],
+        sort_keys=True)
+    return "{prefix}{course}:{fingerprint}:{digest}".format(
+        prefix=CACHE_KEY_PREFIX,
+        course=str(course_id),
+        fingerprint=fingerprint,
+        digest=hashlib.sha256(my_dump.encode("utf8")).hexdigest())
+
+
+def compress_response(response_json, level=6):
+    my_subset = {key: response_json[key] for key in RESPONSE_FIELDS_TO_CACHE if key in response_json}
+    return zlib.compress(json.dumps(my_subset).encode("utf8"), level)
+
+
+def decompress_response(data):
+    return json.loads(zlib.decompress(data).decode("utf8"))
+
+
+class RenderCache:
+    """
+    The two-tier rendered problem cache.
+    """
+    def __init__(self):
+        self._local = None
+        self._local_settings = None
+        self._fingerprints = {} # course_id -> last seen settings fingerprint
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    def _get_local(self, my_settings):
+        my_local_settings = (my_settings["local_max_entries"], my_settings["local_max_bytes"], my_settings["local_ttl"])
+        if self._local is None or self._local_settings != my_local_settings:
+            self._local = BoundedTTLCache(
+                max_entries=my_settings["local_max_entries"],
+                ttl=my_settings["local_ttl"],
+                max_bytes=my_settings["local_max_bytes"],
+                sizeof=len,
+            )
+            self._local_settings = my_local_settings
+        return self._local
+
+    def note_fingerprint(self, course_id, fingerprint):
+        """
+        Drop the local entries of a course when its webwork_settings changed.
+        Shared entries use the new fingerprint in their keys, so the old ones
+        are never read again and expire on their own.
+        """
+        my_course = str(course_id)
+        my_old = self._fingerprints.get(my_course)
+        self._fingerprints[my_course] = fingerprint
+        if my_old is not None and my_old != fingerprint and self._local is not None:
+            my_prefix = "{prefix}{course}:{fingerprint}:".format(
+                prefix=CACHE_KEY_PREFIX, course=my_course, fingerprint=my_old)
+            self._local.delete_matching(lambda key: key.startswith(my_prefix))
+
+    def get(self, key):
+        my_settings = render_cache_settings()
+        if not my_settings["enabled"]:
+            return None
+        my_local = self._get_local(my_settings)
+        data = my_local.get(key)
+        if data is None and my_settings["shared_enabled"]:
+            try:
+                data = caches[my_settings["shared_cache_alias"]].get(key)
+            except Exception: # A broken shared cache must never break problem loading
+                data = None
+            if data is None:
+                self.shared_misses += 1
+            else:
+                self.shared_hits += 1
+                my_local.set(key, data)
+        if data is None:
+            return None
+        try:
+            return decompress_response(data)
+        except (zlib.error, ValueError):
+            my_local.delete(key)
+            return None
+
+    def set(self, key, response_json, shared_ttl=None):
+        """
+        Store response_json. shared_ttl overrides the TTL of the shared tier
+        (used when warming the cache well before the entries are needed).
+        """
+        my_settings = render_cache_settings()
+        if not my_settings["enabled"]:
+            return
+        data = compress_response(response_json, my_settings["compress_level"])
+        self._get_local(my_settings).set(key, data)
+        if my_settings["shared_enabled"]:
+            if shared_ttl is None:
+                shared_ttl = my_settings["shared_ttl"]
+            try:
+                caches[my_settings["shared_cache_alias"]].set(key, data, shared_ttl)
+            except Exception:
+                pass
+
+    def clear_local(self):
+        if self._local is not None:
+            self._local.clear()
+        self._fingerprints.clear()
+
+    def stats(self):
+        my_stats = self._local.stats() if self._local is not None else {}
+        my_stats.update({"shared_hits": self.shared_hits, "shared_misses": self.shared_misses})
+        return my_stats
+
+
+# The cache shared by all blocks in this process
+render_cache = RenderCache()
@@ -0,0 +1,474 @@
+"""
+Building, sending and parsing the requests made to a WeBWorK renderer.
+
+A RenderRequest holds everything needed to make one call to a renderer: the
+server connection settings, the student dependent values (seed, psvn, WeBWorK
+attempt counters) and the request parameters. The XBlock builds one from its
+own state for each call, and bulk tools (such as the cache warmer) can build
+them from stored student state without binding a block to each student.
+"""
+import contextlib
+import time
+
+import requests
+
+from .jwt_cache import problem_jwt_factory
+from .render_cache import make_render_key, render_cache
+from .renderer_client import renderer_clients, pool_settings_from_server_settings
+from .renderer_pool import renderer_pools
+from .circuit_breaker import circuit_breakers
+from .adaptive_timeouts import adaptive_timeouts
+from .metrics import NULL_RECORDER
+from .single_flight import SingleFlightTimeout, single_flight
+from .tracing import KIND_CLIENT, tracer
+
+# The keys in STANDALONE_ADD_INTO_JWT and in STANDALONE_MOVE_INTO_JWT
+# are setting in the Standalone API which we do not want anyone to be able
+# to set (tamper with) using form parameters and a valid JWT they obtained
+# in some manner or another.
+# 1. The ones in STANDALONE_ADD_INTO_JWT are settings which are not used by
+#    this XBlock, so we will just add them into the JWT claims.
+# 2. The ones in STANDALONE_MOVE_INTO_JWT are expected to be set by the XBlock,
+#     so the code will add the desired values for each key from params, and
+#     fall back to using the fixed settings if no value was provided by params.
+STANDALONE_ADD_INTO_JWT = {
+    "problemSourceURL": "", # empty string is treated by Perl as false, so does not have an effect
+    "problemSource": ""     # on the renderer behavior but will prevent override outside JWT.
+}
+
+# Note for testing the JWT lockdown on changes:
+#   Commenting out the outputFormat line in STANDALONE_MOVE_INTO_JWT below,
+#   and also the line to tamper with that value in RenderRequest.post_data()
+#   will let such tampering occur and be observed. Uncommenting the line here
+#   will block the effect of that tampering.
+# That establishes that the tamper resistence mechanism in the XBlock and the
+# handling by the Standalone renderer are working as intended.
+
+STANDALONE_MOVE_INTO_JWT = { # values we use and want to protect from tampering outside the JWT
+                             # if someone obtains a valid JWT to use
+    "numCorrect": "",
+    "numIncorrect": "",
+    "format" : "json",
+    "outputFormat": "simple",
+    "permissionLevel": "0", # Student level permissions
+    "showSummary": "1",
+    "showComments": "0",
+    "showHints": "0", # Default to off
+    "showSolutions": "0", # Default to off
+    "includeTags": "0"
+}
+
+
+def server_key_for(server_api_url):
+    """
+    A key identifying the server in use, for the process-wide caches (circuit
+    breakers, adaptive timeouts, JWT keys). It is the resolved URL: a
+    ww_server_id is only a label in the settings of one course, and other
+    courses may use the same label for other renderers.
+    """
+    return "url:" + str(server_api_url)
+
+
+def add_student_params(params, server_type, language, num_correct, num_incorrect, allow_hints):
+    """
+    Add the block/student dependent settings to the request parameters.
+    Safe to call more than once on the same params.
+    """
+    params.update( { "language": str(language) } ) # Sets the desired translation language on the WW side
+
+    if server_type == 'standalone':
+        # Providing these parameters is only supported by the Standalone renderer at present
+        params.update( {
+            "numCorrect":   str(num_correct),
+            "numIncorrect": str(num_incorrect),
+        } )
+        if allow_hints:
+            params.update( { "showHints": "1" } )
+    return params
+
+
+class RenderRequest:
+    """
+    Everything needed to make one call to a renderer.
+
+    idempotent should be True only for requests which are safe to repeat
+    (initial loads, previews, show answers), which may then be retried on
+    another endpoint of the server.
+
+    metrics is the MetricsRecorder of the handler call making the request.
+
+    timeout is the ceiling of each attempt. deadline (a time.monotonic() value)
+    bounds the whole call, waiting for an identical call in flight included;
+    a request with a deadline is never retried.
+    """
+    def __init__(self, server_settings, auth_data, server_key, seed, psvn, problem, params,
+                 timeout, course_id=None, settings_fingerprint=None, idempotent=False, metrics=None,
+                 deadline=None):
+        self.server_settings = server_settings
+        self.server_type = server_settings.get("server_type")
+        self.server_api_url = server_settings.get("server_api_url")
+        self.auth_data = auth_data or {}
+        self.server_key = server_key
+        self.seed = seed
+        self.psvn = psvn
+        self.problem = problem
+        self.params = params
+        self.timeout = timeout
+        self.course_id = course_id
+        self.settings_fingerprint = settings_fingerprint
+        self.idempotent = idempotent
+        self.metrics = metrics or NULL_RECORDER
+        self.deadline = deadline
+
+    def remaining_time(self):
+        """
+        Seconds left before the deadline, or None without a deadline.
+        """
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def attempt_timeout(self):
+        """
+        Timeout of the next attempt: timeout, cut to the time left before the deadline.
+        """
+        my_remaining = self.remaining_time()
+        return self.timeout if my_remaining is None else min(self.timeout, my_remaining)
+
+    @property
+    def retries_allowed(self):
+        return self.idempotent and self.deadline is None
+
+    def time_budget(self):
+        """
+        Seconds the whole call may still take: the time left before the deadline,
+        or without one, the timeout of each attempt it may make.
+        """
+        my_remaining = self.remaining_time()
+        if my_remaining is not None:
+            return my_remaining
+        return self.timeout * self.endpoint_pool().max_attempts(self.retries_allowed)
+
+    @property
+    def pool_settings(self):
+        return pool_settings_from_server_settings(self.server_settings)
+
+    def endpoint_pool(self):
+        """
+        The EndpointPool of the server (server_api_url and any server_api_urls).
+        """
+        return renderer_pools.get_pool(self.server_settings)
+
+    def observe_latency(self, latency, timed_out=False):
+        """
+        Feed the latency of a call to the adaptive timeouts of the problem.
+        """
+        adaptive_timeouts.observe(self.server_key, self.problem, latency, timed_out)
+
+    def circuit_breaker(self):
+        """
+        The CircuitBreaker (and retry budget) of the server.
+        """
+        return circuit_breakers.get(self.server_key, self.server_settings)
+
+    def cache_key(self):
+        """
+        Key of the rendered problem cache for this request.
+        """
+        return make_render_key(
+            self.course_id,
+            self.settings_fingerprint,
+            self.server_key,
+            dict(self.params,
+                server_type=str(self.server_type),
+                server_api_url=str(self.server_api_url),
+                problemSeed=str(self.seed),
+                psvn=str(self.psvn),
+                sourceFilePath=str(self.problem)
+            ))
+
+    def problem_claims(self):
+        """
+        The claims of the problemJWT, or None if the JWT settings are missing.
+        """
+        my_aud = self.auth_data.get('aud',None)
+        if not my_aud:
+            return None
+
+        # Create dict of initial claims
+        my_claims = {
+            'aud' : str(my_aud),
+            'problemSeed': str(self.seed),
+            'psvn' : str(self.psvn),
+            'sourceFilePath' : str(self.problem)
+        }
+
+        # Add protected data to JWT so it cannot be tampered with if someone tried to call the API
+        # with a JWT they obtained which we generated, but with form data trying to override one
+        # or more of the protected settings.
+
+        # Forced values for options which we do not use, and do now want anyone to be able to add
+        my_claims.update( STANDALONE_ADD_INTO_JWT )
+
+        # Protect settings we expect to use and want to protect from tampering
+        for i in STANDALONE_MOVE_INTO_JWT.keys():
+            # use either the value params requested of the value from the defaults
+            my_claims.update( { i: self.params.get(i, STANDALONE_MOVE_INTO_JWT.get(i,"")) } )
+        return my_claims
+
+    def problem_jwt(self):
+        """
+        Create an encrypted problemJWT to send to the Standalone renderer.
+        """
+        my_key_raw = self.auth_data.get('problemJWTsecret',None)
+        my_claims = self.problem_claims()
+        if not my_key_raw or my_claims is None:
+            # Cannot get the data needed to make the JWT
+            return None
+        try:
+            # The JWK is built once per server/secret, and identical claims reuse
+            # the already encrypted token.
+            with self.metrics.phase("jwt"), tracer.span("webwork.jwt"):
+                return problem_jwt_factory.make_token( self.server_key, my_key_raw, my_claims )
+        except Exception:
+            return None
+
+    def post_data(self):
+        """
+        The form data to POST, or None if it cannot be created.
+        """
+        if self.server_type == 'standalone':
+            my_jwt = self.problem_jwt()
+            if not my_jwt:
+                return None
+            my_data = dict(self.params, problemJWT=str(my_jwt))
+            my_data.pop("auth_data", None)
+
+            # The commented out line below was used to test that a request
+            # cannot override value in JWT by modifying values which we protected
+            # by including them in the JWT.
+            # When the line below is uncommented, it should NOT have an
+            # effect on the renderered problems. However, if the line to include
+            # outputFormat inside the STANDALONE_MOVE_INTO_JWT is commented out, then
+            # it will have an effect and the "Show correct answers" button will
+            # not be displayed.
+
+            #my_data.update( { "outputFormat": "classic" } )
+
+            # End of section to test JWT settings being tamper resistent.
+
+            # standalone does not have course/user/password, and problemSeed, psvn and
+            # sourceFilePath are only sent inside the JWT.
+            return my_data
+        if self.server_type == 'html2xml':
+            return dict(
+                self.params,
+                courseID=self.auth_data.get('ww_course','error'),
+                userID=self.auth_data.get('ww_username','error'),
+                course_password=self.auth_data.get('ww_password','error'),
+                problemSeed=str(self.seed),
+                psvn=str(self.psvn),
+                sourceFilePath=str(self.problem)
+            )
+        return None
+
+
+def parse_renderer_response(my_res):
+    """
+    The JSON data of a renderer response, or None.
+    """
+    if my_res:
+        try:
+            return my_res.json()
+        except ValueError: # includes simplejson.errors.JSONDecodeError
+            return None
+    return None
+
+
+class RendererAttempt:
+    """
+    One attempt of a renderer call on an endpoint. Used as a context manager
+    around the HTTP POST, it records the "http" metrics phase and the client
+    span, and provides the trace propagation headers to send. Then either
+    replied() or failed() does the bookkeeping of the load balancer and of the
+    adaptive timeouts; only the first of them counts, so the callers may call
+    failed() on any unexpected exception.
+    """
+    def __init__(self, render_request, pool, endpoint, attempt, timeout):
+        self.render_request = render_request
+        self.pool = pool
+        self.endpoint = endpoint
+        self.attempt = attempt
+        self.timeout = timeout
+        self.headers = {}
+        self._stack = None
+        self._span = None
+        self._started = None
+        self._settled = False
+
+    def __enter__(self):
+        self._stack = contextlib.ExitStack()
+        self._stack.enter_context(self.render_request.metrics.phase("http"))
+        self._span = self._stack.enter_context(tracer.span(
+            "webwork.renderer.http", KIND_CLIENT, **{"http.url": self.endpoint.url, "webwork.attempt": self.attempt + 1}))
+        self.headers = tracer.propagation_headers() # W3C traceparent when traced
+        self._started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._stack.__exit__(*exc_info)
+
+    def replied(self, status_code):
+        """
+        Record a reply, and return whether it is usable (no HTTP 5xx status).
+        """
+        self._settled = True
+        my_latency = time.monotonic() - self._started
+        self._span.set_attribute("http.status_code", status_code)
+        # Replies with a 4xx status say nothing about the health of the endpoint
+        my_ok = status_code < 500
+        self.pool.release(self.endpoint, my_latency, ok=my_ok)
+        if my_ok:
+            self.render_request.observe_latency(my_latency)
+        return my_ok
+
+    def failed(self, timed_out=False):
+        """
+        Record an attempt which got no reply.
+        """
+        if self._settled:
+            return
+        self._settled = True
+        self.pool.release(self.endpoint, time.monotonic() - self._started, ok=False)
+        # A timeout cut by the deadline says nothing about the latency of the problem
+        if timed_out and self.timeout >= self.render_request.timeout:
+            self.render_request.observe_latency(self.render_request.timeout, timed_out=True)
+
+
+def endpoint_attempts(render_request, breaker):
+    """
+    Yield the RendererAttempts of a call: an endpoint picked by the load
+    balancer, then for idempotent requests without a deadline, one retry on
+    another endpoint (within the retry budget of breaker). The caller stops
+    iterating once it got a usable reply. Shared by send_render_request and
+    the asyncio client, which only differ in how they make the HTTP POST.
+    """
+    my_pool = render_request.endpoint_pool()
+    my_tried = []
+    for my_attempt in range(my_pool.max_attempts(render_request.retries_allowed)):
+        if my_attempt and not breaker.allow_retry():
+            return
+        my_timeout = render_request.attempt_timeout()
+        if my_timeout <= 0:
+            return
+        my_endpoint = my_pool.acquire(exclude=my_tried)
+        if my_endpoint is None:
+            return
+        my_tried.append(my_endpoint.url)
+        yield RendererAttempt(render_request, my_pool, my_endpoint, my_attempt, my_timeout)
+
+
+def post_to_endpoints(render_request, my_data, breaker):
+    """
+    POST my_data to an endpoint of the server, retrying idempotent requests once
+    on another endpoint (see endpoint_attempts).
+    Returns the response, or None when no endpoint gave a reply without an HTTP 5xx status.
+    """
+    for my_attempt in endpoint_attempts(render_request, breaker):
+        try:
+            with my_attempt:
+                my_res = renderer_clients.post(
+                    my_attempt.endpoint.url,
+                    data = my_data,
+                    timeout = my_attempt.timeout,
+                    pool_settings = render_request.pool_settings,
+                    headers = my_attempt.headers)
+                my_ok = my_attempt.replied(my_res.status_code)
+        except requests.exceptions.RequestException as err:
+            # At present we are not trying to provide any information on what
+            # sort of exception occurred.
+            # Details on what can be issued appear in
+            # https://docs.python-requests.org/en/latest/user/quickstart/#errors-and-exceptions
+            my_attempt.failed(timed_out=isinstance(err, requests.exceptions.Timeout))
+            continue
+        except BaseException:
+            # Release the endpoint before the error propagates
+            my_attempt.failed()
+            raise
+        if my_ok:
+            return my_res
+    return None
+
+
+def send_render_request(render_request):
+    """
+    Make the call to the renderer, and return the JSON data of the response or None.
+    When the server has several endpoints, one is picked by the load balancer, and
+    idempotent requests which failed are retried once on another endpoint.
+    While the circuit breaker of the server is open, None is returned at once.
+    """
+    # Both html2xml and Standalone are called using HTTP POST (for html2xml POST is more secure than GET)
+    # See https://requests.readthedocs.io/en/master/user/quickstart/#make-a-request
+    if not render_request.server_api_url:
+        return None
+    my_data = render_request.post_data()
+    if my_data is None:
+        return None
+    my_breaker = render_request.circuit_breaker()
+    my_ticket = my_breaker.acquire()
+    if my_ticket is None:
+        return None # Fail fast, the renderer is unhealthy
+    my_res = None
+    try:
+        my_res = post_to_endpoints(render_request, my_data, my_breaker)
+    finally:
+        my_breaker.record(my_ticket, ok=my_res is not None)
+    if my_res is None:
+        return None
+    render_request.metrics.size("renderer_response_bytes", len(my_res.content))
+    with render_request.metrics.phase("json_parse"), tracer.span("webwork.json_parse"):
+        return parse_renderer_response(my_res)
+
+
+def is_rendered(response_json):
+    return isinstance(response_json, dict) and 'renderedHTML' in response_json
+
+
+def coalesced_render_request(render_request, call=None):
+    """
+    send_render_request (or call()) for render_request, sharing the result of an
+    identical idempotent request already in flight (see single_flight.py).
+    Requests which are not idempotent are always sent.
+    A request whose time budget ran out while waiting gets None, like a call
+    which timed out: it does not call the renderer which is already too slow.
+    """
+    call = call or (lambda: send_render_request(render_request))
+    if not render_request.idempotent:
+        return call()
+    try:
+        return single_flight.do(render_request.cache_key(), call, render_request.time_budget(),
+                                metrics=render_request.metrics)
+    except SingleFlightTimeout:
+        tracer.annotate(**{"webwork.single_flight": "timeout"})
+        return None
+
+
+def render_with_cache(render_request, shared_ttl=None):
+    """
+    send_render_request for requests whose result only depends on the request
+    (initial loads), using the two-tier rendered problem cache.
+    """
+    my_key = render_request.cache_key()
+    response_json = render_cache.get(my_key)
+    if response_json is not None:
+        tracer.annotate(**{"webwork.render_cache": "hit"})
+        return response_json
+    tracer.annotate(**{"webwork.render_cache": "miss"})
+
+    def render_and_store():
+        my_response_json = send_render_request(render_request)
+        if is_rendered(my_response_json):
+            render_cache.set(my_key, my_response_json, shared_ttl=shared_ttl)
+        return my_response_json
+
+    return coalesced_render_request(render_request, render_and_store)
@@ -0,0 +1,121 @@
+"""
+Process-wide registry of pooled HTTP sessions used to contact WeBWorK renderers.
+
+Each configured "server_api_url" (with its pool settings) gets a single
+requests.Session with its own connection pool, so consecutive handler calls in the same LMS process reuse
+open (keep-alive) TCP/TLS connections to the renderer instead of making a new
+handshake on every initialLoad / submit / preview / show answers request.
+
+The pool settings can be tuned per server in the "server_settings" entry of the
+"webwork_settings" in the "Other course settings" using an optional
+"connection_pool" object. See doc/course-level-settings.md.
+"""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Defaults used for any pool setting which was not provided for a server.
+#   pool_connections - number of distinct host pools cached by the adapter
+#                      (a server_api_url normally targets a single host)
+#   pool_maxsize     - maximal number of connections kept open to the server
+#   pool_block       - when True, pool_maxsize is also a hard limit on the number
+#                      of concurrent connections to the server, and additional
+#                      requests wait for a free connection
+#   keep_alive       - when False, each request asks the server to close the
+#                      connection (old behavior, mainly useful for debugging)
+DEFAULT_POOL_SETTINGS = {
+    "pool_connections": 1,
+    "pool_maxsize": 10,
+    "pool_block": False,
+    "keep_alive": True,
+}
+
+
+def pool_settings_from_server_settings(server_settings):
+    """
+    Merge the optional "connection_pool" object of a server settings dictionary
+    with the defaults, and coerce the values to the expected types.
+    """
+    my_pool_settings = dict(DEFAULT_POOL_SETTINGS)
+    provided = (server_settings or {}).get("connection_pool", {})
+    if isinstance(provided, dict):
+        for key in DEFAULT_POOL_SETTINGS:
+            if key in provided:
+                my_pool_settings[key] = provided[key]
+    try:
+        my_pool_settings["pool_connections"] = max(int(my_pool_settings["pool_connections"]), 1)
+        my_pool_settings["pool_maxsize"] = max(int(my_pool_settings["pool_maxsize"]), 1)
+    except (TypeError, ValueError):
+        my_pool_settings["pool_connections"] = DEFAULT_POOL_SETTINGS["pool_connections"]
+        my_pool_settings["pool_maxsize"] = DEFAULT_POOL_SETTINGS["pool_maxsize"]
+    my_pool_settings["pool_block"] = bool(my_pool_settings["pool_block"])
+    my_pool_settings["keep_alive"] = bool(my_pool_settings["keep_alive"])
+    return my_pool_settings
+
+
+class RendererClientRegistry:
+    """
+    Thread safe registry holding one pooled requests.Session per
+    (server_api_url, pool settings).
+
+    Courses which use the same URL with different pool settings each get their
+    own session, so they never replace (and close) the session of the other.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {} # (server_api_url, pool settings tuple) -> requests.Session
+
+    @staticmethod
+    def _make_session(pool_settings):
+        my_session = requests.Session()
+        my_adapter = HTTPAdapter(
+            pool_connections=pool_settings["pool_connections"],
+            pool_maxsize=pool_settings["pool_maxsize"],
+            pool_block=pool_settings["pool_block"],
+            max_retries=0, # Retries are not safe for graded submissions
+        )
+        my_session.mount("http://", my_adapter)
+        my_session.mount("https://", my_adapter)
+        if not pool_settings["keep_alive"]:
+            my_session.headers["Connection"] = "close"
+        return my_session
+
+    def get_session(self, server_api_url, pool_settings=None):
+        """
+        Return the shared session for server_api_url and pool_settings, creating it when needed.
+        """
+        if pool_settings is None:
+            pool_settings = dict(DEFAULT_POOL_SETTINGS)
+        my_key = (server_api_url, tuple(sorted(pool_settings.items())))
+        with self._lock:
+            my_session = self._sessions.get(my_key)
+            if my_session is None:
+                my_session = self._sessions[my_key] = self._make_session(pool_settings)
+        return my_session
+
+    def post(self, server_api_url, data, timeout, pool_settings=None, **kwargs):
+        """
+        POST to the renderer using the pooled session for server_api_url.
+        Raises requests.exceptions.RequestException just like requests.post().
+        """
+        return self.get_session(server_api_url, pool_settings).post(
+            server_api_url, data=data, timeout=timeout, **kwargs)
+
+    def close(self, server_api_url=None):
+        """
+        Close and forget the sessions of one URL (or all of them if no URL is given).
+        """
+        with self._lock:
+            my_keys = [key for key in self._sessions if server_api_url is None or key[0] == server_api_url]
+            to_close = [self._sessions.pop(key) for key in my_keys]
+        for my_session in to_close:
+            my_session.close()
+
+    def server_urls(self):
+        with self._lock:
+            return sorted({key[0] for key in self._sessions})
+
+
+# The single registry shared by all blocks in this process
+renderer_clients = RendererClientRegistry()
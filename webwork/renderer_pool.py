@@ -0,0 +1,252 @@
+"""
+Load balancing between several instances of the same renderer.
+
+A "server_settings" entry of the course "webwork_settings" may list several
+equivalent endpoints in an optional "server_api_urls" array (for example several
+Standalone renderer instances). Each call picks one of them:
+
+  * "least_outstanding" - the endpoint with the fewest requests in flight from
+    this process (ties are broken randomly, so processes do not all start with
+    the same endpoint).
+  * "ewma" - the endpoint with the lowest exponentially weighted moving average
+    latency, multiplied by (requests in flight + 1).
+
+An endpoint which fails (connection error, timeout or HTTP 5xx) several times in
+a row is ejected for a while, and is then tried again. Requests which are safe to
+repeat (initial loads, previews, show answers) are retried once on a different
+endpoint. Submissions are never retried.
+
+The health data is kept per endpoint URL in each LMS process, so an endpoint
+listed by several servers / courses shares its state. See
+doc/course-level-settings.md for the "load_balancing" settings.
+"""
+import logging
+import math
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Defaults used for any load balancing setting which was not provided for a server.
+#   strategy            - "least_outstanding" or "ewma"
+#   failures_to_eject   - consecutive failures after which an endpoint is ejected
+#   eject_seconds       - how long an ejected endpoint is skipped
+#   max_ejected_percent - never eject more than this percentage of the endpoints
+#   ewma_decay_seconds  - time constant of the latency moving average
+#   retry_idempotent    - retry requests which are safe to repeat on another endpoint
+DEFAULT_LOAD_BALANCING_SETTINGS = {
+    "strategy": "least_outstanding",
+    "failures_to_eject": 3,
+    "eject_seconds": 30,
+    "max_ejected_percent": 50,
+    "ewma_decay_seconds": 10,
+    "retry_idempotent": True,
+}
+
+STRATEGIES = ("least_outstanding", "ewma")
+
+
+def endpoint_urls_from_server_settings(server_settings):
+    """
+    The endpoint URLs of a server: "server_api_urls" when provided, otherwise the
+    single "server_api_url". Empty and repeated entries are dropped.
+    """
+    server_settings = server_settings or {}
+    urls = server_settings.get("server_api_urls")
+    if not isinstance(urls, (list, tuple)) or not urls:
+        urls = [server_settings.get("server_api_url")]
+    my_urls = []
+    for url in urls:
+        if url and str(url) not in my_urls:
+            my_urls.append(str(url))
+    return my_urls
+
+
+def load_balancing_settings_from_server_settings(server_settings):
+    """
+    Merge the optional "load_balancing" object of a server settings dictionary
+    with the defaults, and coerce the values to the expected types.
+    """
+    my_settings = dict(DEFAULT_LOAD_BALANCING_SETTINGS)
+    provided = (server_settings or {}).get("load_balancing", {})
+    if isinstance(provided, dict):
+        for key in DEFAULT_LOAD_BALANCING_SETTINGS:
+            if key in provided:
+                my_settings[key] = provided[key]
+    if my_settings["strategy"] not in STRATEGIES:
+        my_settings["strategy"] = DEFAULT_LOAD_BALANCING_SETTINGS["strategy"]
+    for key, cast, minimum in (
+            ("failures_to_eject", int, 1),
+            ("eject_seconds", float, 0.0),
+            ("max_ejected_percent", float, 0.0),
+            ("ewma_decay_seconds", float, 0.1)):
+        try:
+            my_settings[key] = max(cast(my_settings[key]), minimum)
+        except (TypeError, ValueError):
+            my_settings[key] = DEFAULT_LOAD_BALANCING_SETTINGS[key]
+    my_settings["retry_idempotent"] = bool(my_settings["retry_idempotent"])
+    return my_settings
+
+
+class Endpoint:
+    """
+    Counters and health of one renderer endpoint (in this process).
+    Only modified while holding the lock of the registry.
+    """
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.ewma = None # seconds
+        self.last_latency = None
+        self._ewma_updated = None
+
+    def is_ejected(self, now):
+        return self.ejected_until > now
+
+    def score(self, strategy):
+        if strategy == "ewma":
+            # Endpoints without a measurement yet score 0, so they get tried
+            return (self.ewma or 0.0) * (self.outstanding + 1)
+        return self.outstanding
+
+    def observe_latency(self, latency, now, decay_seconds):
+        self.last_latency = latency
+        if self.ewma is None:
+            self.ewma = latency
+        else:
+            weight = math.exp(-max(now - self._ewma_updated, 0.0) / decay_seconds)
+            self.ewma = self.ewma * weight + latency * (1.0 - weight)
+        self._ewma_updated = now
+
+    def as_dict(self, now):
+        return {
+            "url": self.url,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "ejections": self.ejections,
+            "ejected": self.is_ejected(now),
+            "ejected_for": round(max(self.ejected_until - now, 0.0), 1),
+            "ewma_ms": round(self.ewma * 1000, 1) if self.ewma is not None else None,
+            "last_latency_ms": round(self.last_latency * 1000, 1) if self.last_latency is not None else None,
+        }
+
+
+class EndpointPool:
+    """
+    The endpoints of one server, with the load balancing settings of the server.
+    Cheap to create - the state lives in the Endpoint objects of the registry.
+    """
+    def __init__(self, registry, endpoints, lb_settings):
+        self.registry = registry
+        self.endpoints = endpoints
+        self.settings = lb_settings
+
+    @property
+    def urls(self):
+        return [endpoint.url for endpoint in self.endpoints]
+
+    def max_attempts(self, idempotent):
+        if idempotent and self.settings["retry_idempotent"]:
+            return min(len(self.endpoints), 2)
+        return 1
+
+    def acquire(self, exclude=()):
+        """
+        Pick an endpoint not in exclude (a collection of URLs) and count the
+        request as in flight. Returns None when no endpoint is left.
+        """
+        return self.registry.acquire(self, exclude)
+
+    def release(self, endpoint, latency, ok):
+        """
+        Record the end of a request made to endpoint.
+        ok is False for connection errors, timeouts and HTTP 5xx replies.
+        """
+        self.registry.release(self, endpoint, latency, ok)
+
+
+class RendererPoolRegistry:
+    """
+    Thread safe registry of the Endpoint objects of this process, keyed by URL.
+    """
+    def __init__(self, clock=time.monotonic):
+        self._lock = threading.Lock()
+        self._endpoints = {} # url -> Endpoint
+        self._clock = clock
+
+    def get_pool(self, server_settings):
+        """
+        The EndpointPool for a server settings dictionary.
+        """
+        my_urls = endpoint_urls_from_server_settings(server_settings)
+        with self._lock:
+            endpoints = []
+            for url in my_urls:
+                endpoint = self._endpoints.get(url)
+                if endpoint is None:
+                    endpoint = self._endpoints[url] = Endpoint(url)
+                endpoints.append(endpoint)
+        return EndpointPool(self, endpoints, load_balancing_settings_from_server_settings(server_settings))
+
+    def acquire(self, pool, exclude=()):
+        with self._lock:
+            now = self._clock()
+            candidates = [endpoint for endpoint in pool.endpoints if endpoint.url not in exclude]
+            if not candidates:
+                return None
+            healthy = [endpoint for endpoint in candidates if not endpoint.is_ejected(now)]
+            if healthy:
+                strategy = pool.settings["strategy"]
+                best = min(endpoint.score(strategy) for endpoint in healthy)
+                chosen = random.choice([endpoint for endpoint in healthy if endpoint.score(strategy) == best])
+            else:
+                # All the remaining endpoints are ejected: use the one which returns first
+                chosen = min(candidates, key=lambda endpoint: endpoint.ejected_until)
+            chosen.outstanding += 1
+            chosen.requests += 1
+            return chosen
+
+    def release(self, pool, endpoint, latency, ok):
+        my_settings = pool.settings
+        with self._lock:
+            now = self._clock()
+            endpoint.outstanding = max(endpoint.outstanding - 1, 0)
+            endpoint.observe_latency(latency, now, my_settings["ewma_decay_seconds"])
+            if ok:
+                endpoint.consecutive_failures = 0
+                return
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures < my_settings["failures_to_eject"] or endpoint.is_ejected(now):
+                return
+            ejected = sum(1 for other in pool.endpoints if other.is_ejected(now))
+            if (ejected + 1) * 100 > my_settings["max_ejected_percent"] * len(pool.endpoints):
+                return # Keep enough endpoints in rotation
+            endpoint.ejected_until = now + my_settings["eject_seconds"]
+            endpoint.ejections += 1
+            endpoint.consecutive_failures = 0
+        log.warning("WeBWorK renderer endpoint %s ejected for %s seconds", endpoint.url, my_settings["eject_seconds"])
+
+    def stats(self):
+        """
+        Per endpoint counters, for monitoring.
+        """
+        with self._lock:
+            now = self._clock()
+            return [endpoint.as_dict(now) for endpoint in self._endpoints.values()]
+
+    def clear(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+# The single registry shared by all blocks in this process
+renderer_pools = RendererPoolRegistry()
@@ -0,0 +1,414 @@
+"""
+Rescoring WeBWorK problems by replaying the stored answers through the renderer.
+
+When a problem file is fixed on the renderer, the stored answers of each
+student are submitted again, with the seed, psvn, numCorrect and numIncorrect
+they were first submitted with, and the score is recalculated from the
+replies. The new score is the best score of the replayed submissions, the
+same rule used when the student submits.
+
+The answers replayed for a student are those of the counted submissions in
+the submission log (see submission_log.py), when the log holds all of them
+(as many as student_attempts) with their complete answers. Otherwise the
+history is partial: the best score may come from a submission which cannot be
+replayed, so the student is only rescored when grades can only be raised
+(only_if_higher), from the replayable logged submissions or the last
+submission kept in submission_data_to_save. Answers which may have been cut
+by older versions of the compact format are never replayed.
+
+A single student is rescored by WeBWorKXBlock.rescore() (the edX "rescore"
+instructor action). A whole problem is rescored by rescore_block() (the
+rescore_webwork_problem management command):
+
+  * The student states are read in batches of "batch_size", ordered by id.
+  * The renderer calls of a batch run in a pool of "concurrency" threads, with
+    at most "per_server_concurrency" calls in flight to each server from this
+    process, and at most "rate" calls per second.
+  * The grades which changed are then saved and published from the calling
+    thread. A state which changed since it was read (the student submitted in
+    the meantime) is counted as a conflict and left unchanged.
+  * After each batch the id of its last state and the counters are written to
+    the checkpoint file, so an interrupted run resumes after the last batch
+    which was done.
+
+Settings are read from the optional WEBWORK_RESCORING dictionary in the
+Django settings, see DEFAULT_RESCORING_SETTINGS.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .cache_warming import RateLimiter
+from .course_settings import course_settings_registry
+from .render_requests import RenderRequest, add_student_params, send_render_request
+from .submission_data import decode_submission_data, may_be_cut
+from .submission_log import counted_submissions
+
+DEFAULT_RESCORING_SETTINGS = {
+    "concurrency": 16, # worker threads
+    "per_server_concurrency": 8, # renderer calls in flight to one server
+    "rate": 0.0, # maximal renderer calls per second (0 = no limit)
+    "batch_size": 500, # student states read from the database at a time
+    "score_tolerance": 1e-6, # smaller score differences are not a change
+}
+
+
+def rescoring_settings(**overrides):
+    my_settings = dict(DEFAULT_RESCORING_SETTINGS)
+    my_settings.update(getattr(settings, "WEBWORK_RESCORING", {}) or {})
+    my_settings.update({key: value for key, value in overrides.items() if value is not None})
+    return my_settings
+
+
+class ServerSlots:
+    """
+    Process-wide limit of the rescoring calls in flight to each server.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def get(self, server_key, limit):
+        with self._lock:
+            my_key = (server_key, int(limit))
+            if my_key not in self._semaphores:
+                self._semaphores[my_key] = threading.BoundedSemaphore(max(int(limit), 1))
+            return self._semaphores[my_key]
+
+
+# The limits shared by all the rescoring runs in this process
+server_slots = ServerSlots()
+
+
+class ReplayContext:
+    """
+    The block dependent values needed to replay submissions, read once from a
+    block whose course settings are loaded.
+    """
+    def __init__(self, block, course_id):
+        block.set_current_server_settings()
+        self.server_settings = dict(block.current_server_settings)
+        self.server_type = self.server_settings.get("server_type")
+        self.auth_data = block.get_current_auth_data()
+        self.server_key = block.get_current_server_key()
+        self.settings_fingerprint = block.main_settings_fingerprint
+        self.problem = block.problem
+        self.language = block.ww_language
+        self.allow_hints = block.allow_ww_hints
+        self.timeout = max(block.webwork_request_timeout, 0.5)
+        self.course_id = course_id
+        self.max_score = float(block.get_max_score())
+
+    @classmethod
+    def for_unbound_block(cls, course, block):
+        """
+        The context of a block loaded from the modulestore (not bound to a student).
+        """
+        # Resolve the server settings using the block code, with the registry entry of the course
+        block._course_settings_entry = course_settings_registry.get( # pylint: disable=protected-access
+            course.id, lambda: course.other_course_settings.get('webwork_settings', {}))
+        return cls(block, course.id)
+
+    def check_parameters(self):
+        from .webwork import STANDALONE_RESPONSE_PARAMETERS_CHECK, HTML2XML_RESPONSE_PARAMETERS_CHECK
+        if self.server_type == 'standalone':
+            return STANDALONE_RESPONSE_PARAMETERS_CHECK
+        if self.server_type == 'html2xml':
+            return HTML2XML_RESPONSE_PARAMETERS_CHECK
+        return None
+
+    def render_request(self, submission_data):
+        """
+        The RenderRequest replaying submission_data (in the format 1 layout), or
+        None when it does not hold a replayable submission.
+        """
+        my_check = self.check_parameters()
+        my_provided = submission_data.get("provided_settings") or {}
+        my_answers = submission_data.get("answers_processed")
+        if my_check is None or not my_answers or "problemSeed" not in my_provided or "psvn" not in my_provided:
+            return None
+        # The same parameters as the original submission (see process_submission)
+        params = dict(my_answers)
+        params.update(my_check)
+        add_student_params(
+            params, self.server_type, self.language,
+            my_provided.get("numCorrect", 0), my_provided.get("numIncorrect", 0), self.allow_hints)
+        return RenderRequest(
+            server_settings = self.server_settings,
+            auth_data = self.auth_data,
+            server_key = self.server_key,
+            seed = my_provided["problemSeed"],
+            psvn = my_provided["psvn"],
+            problem = self.problem,
+            params = params,
+            timeout = self.timeout,
+            course_id = self.course_id,
+            settings_fingerprint = self.settings_fingerprint,
+        )
+
+
+def replay_key(submission_data):
+    """
+    Submissions with the same key get the same score, and are only replayed once.
+    """
+    my_provided = submission_data.get("provided_settings") or {}
+    return json.dumps([
+        submission_data.get("answers_processed"),
+        [str(my_provided.get(key)) for key in ("problemSeed", "psvn", "numCorrect", "numIncorrect")],
+    ], sort_keys=True)
+
+
+def distinct_submissions(submissions):
+    my_seen = {}
+    for my_data in submissions:
+        my_seen.setdefault(replay_key(my_data), my_data)
+    return list(my_seen.values())
+
+
+def replay_best_score(context, submissions, per_server_concurrency=None, limiter=None):
+    """
+    The best scaled score of the replayed submissions (decoded submission data),
+    or None when there is nothing to replay or a replay failed.
+    """
+    my_requests = [context.render_request(my_data) for my_data in distinct_submissions(submissions)]
+    my_requests = [my_request for my_request in my_requests if my_request is not None]
+    if not my_requests:
+        return None
+    my_slots = server_slots.get(
+        context.server_key, per_server_concurrency or rescoring_settings()["per_server_concurrency"])
+    my_best = 0.0
+    for my_request in my_requests:
+        if limiter is not None:
+            limiter.wait()
+        with my_slots:
+            response_json = send_render_request(my_request)
+        try:
+            my_raw = float(response_json["problem_result"]["score"])
+        except (TypeError, KeyError, ValueError):
+            return None # Keep the current grade rather than a partial result
+        my_best = max(my_best, my_raw * context.max_score)
+    return my_best
+
+
+def is_replayable(submission_data):
+    """
+    Whether submission_data holds answers which can be sent again as they were submitted.
+    """
+    my_answers = submission_data.get("answers_processed") if isinstance(submission_data, dict) else None
+    return bool(my_answers) and not any(may_be_cut(value) for value in my_answers.values())
+
+
+def replay_history(logged, state, only_if_higher):
+    """
+    The submissions to replay for a student, given the counted logged
+    submissions and the student state (see the module docstring). [] when
+    nothing may be replayed.
+    """
+    my_attempts = int(state.get("student_attempts", 0) or 0)
+    if logged and len(logged) >= my_attempts and all(is_replayable(my_data) for my_data in logged):
+        return logged
+    if not only_if_higher:
+        return [] # A partial history must never lower a grade
+    return [my_data for my_data in (logged or stored_submission(state)) if is_replayable(my_data)]
+
+
+def stored_submission(state):
+    """
+    [the decoded last submission of a student state], or [] when there is none.
+    """
+    my_data = decode_submission_data(state.get("submission_data_to_save") or {})
+    return [my_data] if isinstance(my_data, dict) and my_data.get("answers_processed") else []
+
+
+def score_changed(old_score, new_score, only_if_higher, tolerance):
+    if only_if_higher:
+        return new_score > old_score + tolerance
+    return abs(new_score - old_score) > tolerance
+
+
+class RescoreProgress:
+    """
+    Counters of a rescoring run, reported through the report callback.
+    """
+    FIELDS = ("students", "replayed", "unchanged", "changed", "nothing_to_replay", "failed", "conflicts")
+
+    def __init__(self, report=None, counts=None):
+        self._lock = threading.Lock()
+        self.report = report
+        self.started = time.monotonic()
+        self.last_id = 0
+        for field in self.FIELDS:
+            setattr(self, field, int((counts or {}).get(field, 0)))
+
+    def add(self, field, count=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + count)
+
+    def counts(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def as_dict(self):
+        elapsed = time.monotonic() - self.started
+        return dict(
+            self.counts(),
+            last_id=self.last_id,
+            elapsed=round(elapsed, 1),
+            per_second=round(self.replayed / elapsed, 2) if elapsed else 0.0)
+
+    def __str__(self):
+        return " ".join("{k}={v}".format(k=k, v=v) for k, v in self.as_dict().items())
+
+
+class RescoreCheckpoint:
+    """
+    JSON file with the progress of the rescoring of one block.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, usage_key):
+        """
+        The saved {"last_id", "counts"}, or None. A checkpoint of another block is an error.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding="utf8") as checkpoint_file:
+            my_data = json.load(checkpoint_file)
+        if my_data.get("usage_key") != str(usage_key):
+            raise ValueError("The checkpoint {p} is for {k}".format(p=self.path, k=my_data.get("usage_key")))
+        return my_data
+
+    def save(self, usage_key, progress):
+        if not self.path:
+            return
+        my_temp = self.path + ".tmp"
+        with open(my_temp, "w", encoding="utf8") as checkpoint_file:
+            json.dump({"usage_key": str(usage_key), "last_id": progress.last_id, "counts": progress.counts()},
+                      checkpoint_file)
+        os.replace(my_temp, self.path) # Never leaves a partly written checkpoint
+
+
+def student_state_batches(course_key, usage_key, batch_size, after_id=0):
+    """
+    Yield lists of (id, student_id, state) of the student states of a block with
+    an id above after_id, batch_size rows at a time.
+    """
+    from lms.djangoapps.courseware.models import StudentModule # pylint: disable=import-error
+    rows = StudentModule.objects.filter(
+        course_id=course_key, module_state_key=usage_key,
+    ).order_by('id').values_list('id', 'student_id', 'state')
+    while True:
+        batch = list(rows.filter(id__gt=after_id)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        if len(batch) < batch_size:
+            return
+        after_id = batch[-1][0]
+
+
+def anonymous_ids_by_user(course_key, user_ids):
+    """
+    {anonymous user id: user id} of the users, for this course.
+    """
+    from common.djangoapps.student.models import AnonymousUserId # pylint: disable=import-error
+    return {anonymous_id: user_id for user_id, anonymous_id in AnonymousUserId.objects.filter(
+        user_id__in=list(user_ids), course_id=course_key).values_list('user_id', 'anonymous_user_id')}
+
+
+def save_and_publish(block, module_id, old_state, new_score, max_score, user, only_if_higher):
+    """
+    Save the new best_student_score of a student state and publish the grade.
+    Returns False, changing nothing, when the state changed since it was read.
+    """
+    from lms.djangoapps.courseware.models import StudentModule # pylint: disable=import-error
+    from lms.djangoapps.grades.api import signals as grades_signals # pylint: disable=import-error
+    my_state = json.loads(old_state)
+    my_state["best_student_score"] = new_score
+    if not StudentModule.objects.filter(id=module_id, state=old_state).update(state=json.dumps(my_state)):
+        return False
+    # What the runtime does with the grade event of a block (handle_grade_event)
+    grades_signals.SCORE_PUBLISHED.send(
+        sender=None,
+        block=block,
+        user=user,
+        raw_earned=new_score,
+        raw_possible=max_score,
+        only_if_higher=only_if_higher,
+        score_deleted=False,
+        grader_response=None,
+    )
+    return True
+
+
+def rescore_block(course, block, only_if_higher=False, concurrency=None, per_server_concurrency=None,
+                  rate=None, batch_size=None, checkpoint=None, dry_run=False, report=None):
+    """
+    Rescore all the students of block (loaded from the modulestore). checkpoint
+    is a RescoreCheckpoint, the run resumes from it when it was saved before.
+    Returns the final RescoreProgress.
+    """
+    from django.contrib.auth import get_user_model
+    my_settings = rescoring_settings(
+        concurrency=concurrency, per_server_concurrency=per_server_concurrency, rate=rate, batch_size=batch_size)
+    checkpoint = checkpoint or RescoreCheckpoint(None)
+    my_saved = checkpoint.load(block.location)
+    progress = RescoreProgress(report=report, counts=my_saved and my_saved.get("counts"))
+    progress.last_id = my_saved["last_id"] if my_saved else 0
+    context = ReplayContext.for_unbound_block(course, block)
+    limiter = RateLimiter(my_settings["rate"])
+
+    def replay_student(item):
+        my_submissions, old_score = item
+        if not my_submissions:
+            progress.add("nothing_to_replay")
+            return None
+        new_score = replay_best_score(context, my_submissions, my_settings["per_server_concurrency"], limiter)
+        progress.add("replayed" if new_score is not None else "failed")
+        return new_score
+
+    with ThreadPoolExecutor(max_workers=max(int(my_settings["concurrency"]), 1)) as executor:
+        for batch in student_state_batches(course.id, block.location, my_settings["batch_size"], progress.last_id):
+            my_states = {}
+            for module_id, student_id, state in batch:
+                try:
+                    my_states[module_id] = (student_id, state, json.loads(state or "{}"))
+                except ValueError:
+                    continue
+            my_anonymous_ids = anonymous_ids_by_user(course.id, [item[0] for item in my_states.values()])
+            my_logged = {}
+            for anonymous_id, submissions in counted_submissions(course.id, block.location, my_anonymous_ids).items():
+                my_logged.setdefault(my_anonymous_ids[anonymous_id], []).extend(submissions)
+            my_items = [(replay_history(my_logged.get(student_id), state, only_if_higher),
+                         float(state.get("best_student_score", 0.0)))
+                        for student_id, _, state in my_states.values()]
+            progress.add("students", len(my_items))
+            my_new_scores = list(executor.map(replay_student, my_items))
+
+            my_changed = [(module_id, new_score) for module_id, (_, old_score), new_score
+                          in zip(my_states, my_items, my_new_scores)
+                          if new_score is not None and score_changed(
+                              old_score, new_score, only_if_higher, my_settings["score_tolerance"])]
+            progress.add("unchanged", sum(1 for new_score in my_new_scores if new_score is not None) - len(my_changed))
+            if my_changed and not dry_run:
+                my_users = get_user_model().objects.in_bulk([my_states[module_id][0] for module_id, _ in my_changed])
+                for module_id, new_score in my_changed:
+                    student_id, old_state, _ = my_states[module_id]
+                    if student_id not in my_users:
+                        progress.add("failed")
+                    elif save_and_publish(block, module_id, old_state, new_score, context.max_score,
+                                          my_users[student_id], only_if_higher):
+                        progress.add("changed")
+                    else:
+                        progress.add("conflicts")
+            elif dry_run:
+                progress.add("changed", len(my_changed))
+            progress.last_id = batch[-1][0]
+            checkpoint.save(block.location, progress)
+            if report:
+                report(progress)
+    return progress
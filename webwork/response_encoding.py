@@ -0,0 +1,149 @@
+"""
+Smaller handler responses: minification of the rendered problem HTML, and
+compression of the JSON returned by the handlers.
+
+Minification (off by default) removes HTML comments, except conditional
+comments, and collapses runs of whitespace in the text between tags. A run
+containing a newline becomes a single newline, and any other run becomes a
+single space, so TeX comments ("%" up to the end of the line) keep their
+meaning. The content of <pre>, <textarea>, <script> and <style> elements is
+never changed, and neither are the tags themselves (so attribute values keep
+their exact whitespace).
+
+Compression uses the best encoding accepted by the browser (Accept-Encoding)
+among "encodings", in order of preference. "br" is only used when the brotli
+package is installed. Bodies shorter than "min_bytes" are sent as they are.
+
+Settings are read from the optional WEBWORK_HANDLER_RESPONSES dictionary in the
+Django settings, see DEFAULT_HANDLER_RESPONSES_SETTINGS.
+"""
+import gzip
+import json
+import re
+
+from django.conf import settings
+from webob.response import Response
+
+try:
+    import brotli # pylint: disable=import-error
+except ImportError:
+    brotli = None # "br" is then never offered
+
+DEFAULT_HANDLER_RESPONSES_SETTINGS = {
+    "minify_html": False,
+    "compress": True,
+    "encodings": ["br", "gzip"], # in order of preference
+    "min_bytes": 1400, # about one packet
+    "gzip_level": 6,
+    "brotli_quality": 5,
+}
+
+# Elements whose content is kept exactly, comments, and tags
+_HTML_TOKEN_RE = re.compile(
+    r"<(pre|textarea|script|style)\b[^>]*>.*?</\1\s*>"
+    r"|<!--.*?-->"
+    r"""|<[A-Za-z/!?](?:[^>"']|"[^"]*"|'[^']*')*>""",
+    re.IGNORECASE | re.DOTALL)
+# HTML whitespace only: a non-breaking space is content
+_HTML_WHITESPACE_RE = re.compile(r"[ \t\r\n\f]+")
+
+
+def handler_responses_settings():
+    my_settings = dict(DEFAULT_HANDLER_RESPONSES_SETTINGS)
+    my_settings.update(getattr(settings, "WEBWORK_HANDLER_RESPONSES", {}) or {})
+    return my_settings
+
+
+def _collapse_whitespace(text):
+    return _HTML_WHITESPACE_RE.sub(lambda m: "\n" if "\n" in m.group(0) else " ", text)
+
+
+def minify_html(html):
+    """
+    html without comments and with collapsed whitespace (see the module docstring).
+    """
+    my_parts = []
+    my_position = 0
+    for my_match in _HTML_TOKEN_RE.finditer(html):
+        my_parts.append(_collapse_whitespace(html[my_position:my_match.start()]))
+        my_token = my_match.group(0)
+        if not my_token.startswith("<!--") or my_token.startswith("<!--[if"):
+            my_parts.append(my_token)
+        my_position = my_match.end()
+    my_parts.append(_collapse_whitespace(html[my_position:]))
+    return "".join(my_parts)
+
+
+def parse_accept_encoding(header):
+    """
+    {coding: q} from an Accept-Encoding header. Codings with q=0 are refused.
+    """
+    my_codings = {}
+    for my_item in (header or "").split(","):
+        my_name, _, my_params = my_item.strip().partition(";")
+        my_name = my_name.strip().lower()
+        if not my_name:
+            continue
+        my_q = 1.0
+        for my_param in my_params.split(";"):
+            my_key, _, my_value = my_param.strip().partition("=")
+            if my_key.strip().lower() == "q":
+                try:
+                    my_q = float(my_value)
+                except ValueError:
+                    my_q = 0.0
+        my_codings[my_name] = my_q
+    return my_codings
+
+
+def available_encodings(my_settings):
+    return [name for name in my_settings["encodings"]
+            if name == "gzip" or (name == "br" and brotli is not None)]
+
+
+def choose_encoding(header, my_settings):
+    """
+    The encoding to use for a request with the Accept-Encoding header, or None.
+    """
+    my_accepted = parse_accept_encoding(header)
+    my_best = None
+    my_best_q = 0.0
+    for my_name in available_encodings(my_settings):
+        my_q = my_accepted.get(my_name, my_accepted.get("*", 0.0))
+        if my_q > my_best_q: # Ties keep the preferred (earlier) encoding
+            my_best, my_best_q = my_name, my_q
+    return my_best
+
+
+def encode_body(body, encoding, my_settings):
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=my_settings["gzip_level"])
+    if encoding == "br":
+        return brotli.compress(body, quality=my_settings["brotli_quality"])
+    return body
+
+
+def json_response(request, data, metrics):
+    """
+    A webob JSON response with data, compressed when the request accepts it.
+    Records the handler_response_bytes (JSON) and handler_response_encoded_bytes
+    (sent) sizes in metrics.
+    """
+    my_settings = handler_responses_settings()
+    my_body = json.dumps(data).encode("utf8")
+    metrics.size("handler_response_bytes", len(my_body))
+    my_encoding = None
+    if my_settings["compress"] and len(my_body) >= my_settings["min_bytes"]:
+        my_encoding = choose_encoding(request.headers.get("Accept-Encoding"), my_settings)
+    my_response = Response(
+        body = encode_body(my_body, my_encoding, my_settings),
+        content_type = "application/json",
+        charset = "utf-8",
+        status = 200,
+    )
+    if my_settings["compress"]:
+        my_response.headers["Vary"] = "Accept-Encoding"
+    if my_encoding:
+        my_response.headers["Content-Encoding"] = my_encoding
+    metrics.size("handler_response_encoded_bytes", len(my_response.body))
+    return my_response
@@ -0,0 +1,198 @@
+"""
+Single-flight coalescing of identical renderer calls.
+
+When a class opens the same unit at once, or a student loads a page twice,
+identical requests which are safe to repeat (initial loads, previews, show
+answers) reach the renderer at the same moment. Requests with the same key
+(the render cache key: server, problem, seed, psvn and all the parameters)
+are coalesced: the first one (the leader) calls the renderer, and the others
+wait for it and get the same result.
+
+In a process the waiting callers share the leader's result directly. With
+"shared" on, processes also coordinate through the Django cache: the leader
+takes a lock (cache.add), and stores its result for "result_ttl" seconds.
+Callers in other processes which find the lock taken poll for the result
+every "poll_interval" seconds. When the lock is released without a result
+they take it again (one of them becomes the leader), so a failed leader does
+not send all the waiting callers to the renderer at once. A broken shared
+cache only disables the coordination between processes.
+
+A caller never waits longer than the time budget it gives: it then gets a
+SingleFlightTimeout, and does not make the call itself, since the renderer
+which is already too slow for the leader would only get more load.
+
+Settings are read from the optional WEBWORK_SINGLE_FLIGHT dictionary in the
+Django settings, see DEFAULT_SINGLE_FLIGHT_SETTINGS.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULT_SINGLE_FLIGHT_SETTINGS = {
+    "enabled": True,
+    "shared": False, # also coalesce the calls of different processes
+    "shared_cache_alias": "default", # a key of the Django CACHES setting
+    "lock_ttl": 30, # seconds, an upper bound of the time of one renderer call
+    "result_ttl": 10, # seconds the leader's result is kept for the other processes
+    "poll_interval": 0.05, # seconds
+}
+
+LOCK_KEY_PREFIX = "webwork:sf:lock:"
+RESULT_KEY_PREFIX = "webwork:sf:result:"
+
+
+class SingleFlightTimeout(Exception):
+    """
+    The identical call in flight did not finish within the time budget of a waiting caller.
+    """
+
+
+def single_flight_settings():
+    my_settings = dict(DEFAULT_SINGLE_FLIGHT_SETTINGS)
+    my_settings.update(getattr(settings, "WEBWORK_SINGLE_FLIGHT", {}) or {})
+    return my_settings
+
+
+class _Flight:
+    """
+    A call in progress in this process.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time, and gives its result to the
+    callers which asked for the same key while it ran.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._counts = {"leaders": 0, "followers": 0, "shared_followers": 0, "shared_retakes": 0, "timeouts": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def do(self, key, call, timeout, metrics=None, my_settings=None):
+        """
+        The result of call(), or of the identical call in flight. A caller which
+        waited timeout seconds (its remaining time budget) gets a SingleFlightTimeout.
+        """
+        my_settings = my_settings or single_flight_settings()
+        if not my_settings["enabled"]:
+            return call()
+        with self._lock:
+            my_flight = self._flights.get(key)
+            is_leader = my_flight is None
+            if is_leader:
+                my_flight = self._flights[key] = _Flight()
+                self._counts["leaders"] += 1
+            else:
+                self._counts["followers"] += 1
+        if not is_leader:
+            if metrics is not None:
+                with metrics.phase("single_flight_wait"):
+                    my_finished = my_flight.done.wait(timeout)
+            else:
+                my_finished = my_flight.done.wait(timeout)
+            if not my_finished:
+                self._count("timeouts")
+                raise SingleFlightTimeout(key)
+            if my_flight.error is not None:
+                raise my_flight.error
+            return my_flight.result
+        try:
+            if my_settings["shared"]:
+                my_flight.result = self._shared_call(key, call, timeout, metrics, my_settings)
+            else:
+                my_flight.result = call()
+            return my_flight.result
+        except Exception as err:
+            my_flight.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            my_flight.done.set()
+
+    def _shared_call(self, key, call, timeout, metrics, my_settings):
+        """
+        call(), unless another process makes the same call: then its result.
+        """
+        my_lock_key = LOCK_KEY_PREFIX + key
+        my_result_key = RESULT_KEY_PREFIX + key
+        my_token = uuid.uuid4().hex
+        my_deadline = time.monotonic() + timeout
+        try:
+            my_cache = caches[my_settings["shared_cache_alias"]]
+            is_leader = my_cache.add(my_lock_key, my_token, my_settings["lock_ttl"])
+        except Exception: # A broken shared cache only costs the coordination
+            return call()
+        if not is_leader:
+            self._count("shared_followers")
+        while not is_leader:
+            if metrics is not None:
+                with metrics.phase("single_flight_wait"):
+                    my_stored = self._wait_for_result(my_cache, my_lock_key, my_result_key, my_deadline, my_settings)
+            else:
+                my_stored = self._wait_for_result(my_cache, my_lock_key, my_result_key, my_deadline, my_settings)
+            if my_stored is not None:
+                return my_stored["r"]
+            if time.monotonic() >= my_deadline:
+                self._count("timeouts")
+                raise SingleFlightTimeout(key)
+            # Released without a result: the first caller to take the lock again makes the call
+            try:
+                is_leader = my_cache.add(my_lock_key, my_token, my_settings["lock_ttl"])
+            except Exception:
+                is_leader = True
+            if is_leader:
+                self._count("shared_retakes")
+        try:
+            my_result = call()
+            try:
+                my_cache.set(my_result_key, {"r": my_result}, my_settings["result_ttl"])
+            except Exception:
+                pass
+            return my_result
+        finally:
+            try:
+                if my_cache.get(my_lock_key) == my_token:
+                    my_cache.delete(my_lock_key)
+            except Exception:
+                pass
+
+    @staticmethod
+    def _wait_for_result(my_cache, my_lock_key, my_result_key, my_deadline, my_settings):
+        """
+        The stored {"r": result} of the leader in another process, or None when
+        its lock was released without a result or the deadline passed.
+        """
+        try:
+            while True:
+                my_stored = my_cache.get(my_result_key)
+                if my_stored is not None:
+                    return my_stored
+                if my_cache.get(my_lock_key) is None:
+                    # Released between the two reads, or without storing a result
+                    return my_cache.get(my_result_key)
+                if time.monotonic() >= my_deadline:
+                    return None
+                time.sleep(min(my_settings["poll_interval"], max(my_deadline - time.monotonic(), 0.0)))
+        except Exception:
+            return None
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, in_flight=len(self._flights))
+
+
+# The coalescing layer shared by all blocks in this process
+single_flight = SingleFlight()
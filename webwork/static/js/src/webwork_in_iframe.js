@@ -3,6 +3,7 @@
 function WeBWorKXBlockIframed(runtime, element, initdata) {
 
     var handlerUrl = runtime.handlerUrl(element, 'submit_webwork_iframed');
+    var renderedHtmlUrl = runtime.handlerUrl(element, 'rendered_html');
 
     /*
       console.log("I was sent rpID ", initdata.rpID);
@@ -21,12 +22,172 @@ function WeBWorKXBlockIframed(runtime, element, initdata) {
     var hidePreview = false;
     var hideSubmit = false;
 
+    /* The page shown in the iframe and its hash, so the handler can send a
+       patch (renderedPatch) instead of the whole page. */
+    var currentHTML = null;
+    var currentHash = null;
+
+    function applyPatch(patch) {
+        /* Returns the patched page, or null when the patch does not fit the current page */
+        if (currentHTML === null || patch.base !== currentHash) {
+            return null;
+        }
+        let lines = currentHTML.split("\n");
+        if (lines.length !== patch.baseLines) {
+            return null;
+        }
+        for (let i = patch.ops.length - 1; i >= 0; i--) {
+            let op = patch.ops[i];
+            lines.splice(op[0], op[1] - op[0], ...op[2]);
+        }
+        if (lines.length !== patch.lines) {
+            return null;
+        }
+        return lines.join("\n");
+    }
+
+    function showPage(html, hash) {
+        currentHTML = html;
+        currentHash = hash || null;
+        problemiframe.srcdoc = html;
+    }
+
+    function childSignature(node) {
+        /* The tags of the child elements and the other child nodes, which must match to compare the children one by one */
+        return Array.from(node.childNodes).map(
+            child => child.nodeType === Node.ELEMENT_NODE ? "<" + child.tagName : child.nodeType + ":" + child.nodeValue
+        ).join("\u0000");
+    }
+
+    function sameAttributes(oldNode, newNode) {
+        if (oldNode.attributes.length !== newNode.attributes.length) {
+            return false;
+        }
+        return Array.from(oldNode.attributes).every(attr => newNode.getAttribute(attr.name) === attr.value);
+    }
+
+    function changedRegions(oldNode, newNode, liveNode, regions) {
+        /* Add to regions the [live element, new element] pairs to replace, walking the old and
+           the new page together. Returns false when the live page does not match the old one. */
+        if (oldNode.isEqualNode(newNode)) {
+            return true;
+        }
+        if (!liveNode || liveNode.tagName !== newNode.tagName) {
+            return false;
+        }
+        let oldChildren = oldNode.children;
+        let liveChildren = liveNode.children;
+        let recurse = oldNode.tagName === newNode.tagName && sameAttributes(oldNode, newNode)
+            && childSignature(oldNode) === childSignature(newNode)
+            && liveChildren.length === oldChildren.length
+            && Array.from(liveChildren).every((child, i) => child.tagName === oldChildren[i].tagName);
+        if (!recurse) {
+            regions.push([liveNode, newNode]);
+            return true;
+        }
+        for (let i = 0; i < oldChildren.length; i++) {
+            if (!changedRegions(oldChildren[i], newNode.children[i], liveChildren[i], regions)) {
+                return false;
+            }
+        }
+        return true;
+    }
+
+    function patchLivePage(html) {
+        /* Turn the page shown in the iframe into html by replacing only the elements which
+           changed, without reloading the iframe. Returns false when that is not possible
+           (the caller then replaces the whole page). */
+        let doc = problemiframe.contentDocument;
+        if (currentHTML === null || !doc || doc.readyState !== 'complete' || !doc.body) {
+            return false;
+        }
+        let parser = new DOMParser();
+        let oldDoc = parser.parseFromString(currentHTML, "text/html");
+        let newDoc = parser.parseFromString(html, "text/html");
+        if (!oldDoc.head.isEqualNode(newDoc.head) || !sameAttributes(oldDoc.body, newDoc.body)) {
+            return false;
+        }
+        let regions = [];
+        if (!changedRegions(oldDoc.body, newDoc.body, doc.body, regions)) {
+            return false;
+        }
+        // Scripts in the new elements would not run (math is typeset again below)
+        let hasScripts = regions.some(([, newNode]) => Array.from(newNode.querySelectorAll("script")).concat(
+            newNode.tagName === "SCRIPT" ? [newNode] : []).some(script => !/^math\//.test(script.type || "")));
+        if (hasScripts || regions.some(([liveNode]) => liveNode === doc.body)) {
+            return false;
+        }
+        let replaced = regions.map(([liveNode, newNode]) => {
+            let node = doc.importNode(newNode, true);
+            liveNode.replaceWith(node);
+            return node;
+        });
+        let mathJax = problemiframe.contentWindow.MathJax;
+        if (mathJax && replaced.length) {
+            if (mathJax.typesetPromise) {
+                mathJax.typesetPromise(replaced);
+            } else if (mathJax.Hub) {
+                replaced.forEach(node => mathJax.Hub.Queue(["Typeset", mathJax.Hub, node]));
+            }
+        }
+        return true;
+    }
+
+    function updatePage(html, hash) {
+        /* Show html: patch the live page, or reload the iframe when that fails */
+        let patched = false;
+        try {
+            patched = patchLivePage(html);
+        } catch (err) {
+            patched = false;
+        }
+        if (patched) {
+            currentHTML = html;
+            currentHash = hash || null;
+        } else {
+            showPage(html, hash);
+        }
+    }
+
+    function showFullPage(hash) {
+        /* Fallback when a patch could not be applied: get the page the patch would have built */
+        currentHTML = null;
+        currentHash = null;
+        $.ajax({
+            type: "POST",
+            url: renderedHtmlUrl,
+            data: JSON.stringify({ "renderedHash": hash }),
+            success: function(result) {
+                if (result.success) {
+                    showPage(result.renderedHTML, result.renderedHash);
+                } else {
+                    initialLoad();
+                }
+            },
+            error: function() { initialLoad(); }
+        });
+    }
+
     function handleResponse(result) {
         messageDiv.innerHTML = "";
         resultDiv.innerHTML = "";
 
         if (result.success) {
-            problemiframe.srcdoc = result.renderedHTML;
+            if (result.renderedPatch) {
+                let html = null;
+                try {
+                    html = applyPatch(result.renderedPatch);
+                } catch (err) {
+                    html = null;
+                }
+                if (html === null) {
+                    showFullPage(result.renderedHash);
+                } else if (html !== currentHTML) {
+                    updatePage(html, result.renderedHash);
+                }
+            } else {
+                updatePage(result.renderedHTML, result.renderedHash);
+            }
 
             if (result.scored) {
                 resultDiv.innerHTML = result.score;
@@ -103,6 +264,11 @@ function WeBWorKXBlockIframed(runtime, element, initdata) {
             /* console.log('could not find form! has a problem been rendered?'); */
             return;
         }
+        if (problemForm.dataset.webworkListener) {
+            // Already added (the page was not replaced, as the patch changed nothing)
+            return;
+        }
+        problemForm.dataset.webworkListener = "1";
         problemForm.addEventListener('submit', event => {
             event.preventDefault();
 
@@ -116,6 +282,8 @@ function WeBWorKXBlockIframed(runtime, element, initdata) {
             }
             formData.set(clickedButton.name, clickedButton.value);
             formData.set("submit_type", clickedButton.name);
+            // Always sent (empty before the first page), so the handler knows we use patches
+            formData.set("renderedHash", currentHash !== null ? currentHash : "");
 
             /* Convert it to JSON: Next few lines of code based on https://ilikekillnerds.com/2017/09/convert-formdata-json-object/ */
             const formDataEntries = formData.entries();
@@ -155,7 +323,8 @@ function WeBWorKXBlockIframed(runtime, element, initdata) {
     }
 
     function initialLoad() {
-        let formJsonData = { "submit_type": "initialLoad" };
+        // An empty renderedHash asks the handler to store the page, so the next submission can get a patch
+        let formJsonData = { "submit_type": "initialLoad", "renderedHash": "" };
         $.ajax({
             type: "POST",
             url: handlerUrl,
@@ -177,5 +346,28 @@ function WeBWorKXBlockIframed(runtime, element, initdata) {
         insertListener();
         hideButtons();
     })
-    initialLoad();
+
+    if (initdata.initialResponse) {
+        /* The problem was rendered into the srcdoc by student_view, so only apply
+           the messages and button settings of the initial load. */
+        let result = initdata.initialResponse;
+        if (result.renderedHash) {
+            currentHTML = problemiframe.srcdoc;
+            currentHash = result.renderedHash;
+        }
+        if (result.message) {
+            messageDiv.innerHTML = result.message;
+        }
+        hideShowAnswers = result.hideShowAnswers;
+        hidePreview = result.hidePreview;
+        hideSubmit = result.hideSubmit;
+        if (problemiframe.contentWindow.document.readyState === 'complete') {
+            // The iframe document was loaded before the load listener was added
+            activeButton();
+            insertListener();
+            hideButtons();
+        }
+    } else {
+        initialLoad();
+    }
 }
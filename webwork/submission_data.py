@@ -0,0 +1,216 @@
+"""
+Compact, versioned encoding of the submission_data_to_save user state field.
+
+The data built by _result_from_json (format 1, no "v" key) repeats the
+answers and the problem settings, stores every answer result as a dict with
+long key names, and keeps timestamps as strings. Format 2 stores the same
+information in a much smaller dict:
+
+    {
+      "v": 2,
+      "t": 1714557600,                  # last_submission_time (unix time)
+      "n": 3,                           # num_attempts
+      "p": [seed, psvn, path, numCorrect, numIncorrect],   # provided_settings
+      "f": {...},                       # submission_settings_processed, with null for
+                                        # the values equal to those of provided_settings
+      "s": [raw score, scaled score],
+      "r": {...},                       # problem_result
+      "a": {name: [values in ANSWER_FIELDS_V2 order, trailing nulls dropped]},
+      "x": {name: answer},              # answers_processed, only those which differ
+                                        # from the original_student_ans of "a"
+    }
+
+The show correct answers record is {"v": 2, "act": "show_answers", "t": ...}.
+
+Strings generated by the renderer (the answer results other than
+original_student_ans, and problem_result) longer than "max_string_bytes"
+(UTF-8) are cut, and end with "...". The answers of the student
+(original_student_ans and "x") and the settings are never cut.
+With "compress", the JSON of the format 2 dict is zlib compressed and stored as
+{"v": 2, "z": "<base64>"} when that is smaller.
+
+decode_submission_data() returns the format 1 layout for both formats, so code
+reading the field does not depend on the stored format. Format 2 does not keep
+empty answer fields, sub-second times, or the end of cut strings.
+
+Settings are read from the optional WEBWORK_SUBMISSION_DATA dictionary in the
+Django settings, see DEFAULT_SUBMISSION_DATA_SETTINGS.
+"""
+import base64
+import datetime
+import json
+import zlib
+
+from django.conf import settings
+
+DEFAULT_SUBMISSION_DATA_SETTINGS = {
+    "format": 2, # 1 keeps writing the original layout
+    "max_string_bytes": 256,
+    "compress": False,
+    "compress_min_bytes": 512, # smaller data is never compressed
+}
+
+FORMAT_VERSION = 2
+
+# The order of the answer fields in format 2 - never change it, add new fields at the end
+ANSWER_FIELDS_V2 = (
+    "ans_label",
+    "ans_message",
+    "ans_name",
+    "cmp_class",
+    "correct_value",
+    "error_message",
+    "original_student_ans",
+    "score",
+    "student_formula",
+    "student_value",
+    "type",
+)
+
+PROVIDED_SETTINGS_V2 = ("problemSeed", "psvn", "sourceFilePath", "numCorrect", "numIncorrect")
+
+SHOW_ANSWERS_ACTION = "show correct answers - called for the first time when permitted"
+
+TRUNCATED_MARK = "..."
+
+
+def submission_data_settings():
+    my_settings = dict(DEFAULT_SUBMISSION_DATA_SETTINGS)
+    my_settings.update(getattr(settings, "WEBWORK_SUBMISSION_DATA", {}) or {})
+    return my_settings
+
+
+def _cut(value, max_bytes):
+    if not isinstance(value, str) or len(value) * 4 <= max_bytes:
+        return value
+    my_bytes = value.encode("utf8")
+    if len(my_bytes) <= max_bytes:
+        return value
+    return my_bytes[:max_bytes - len(TRUNCATED_MARK)].decode("utf8", "ignore") + TRUNCATED_MARK
+
+
+def may_be_cut(value, max_bytes=None):
+    """
+    Whether value may be a string cut by _cut() (data stored before the answers
+    were kept whole): it ends with the mark and has about the cut length.
+    """
+    if not isinstance(value, str) or not value.endswith(TRUNCATED_MARK):
+        return False
+    max_bytes = max_bytes or submission_data_settings()["max_string_bytes"]
+    # Up to 3 bytes of a multibyte character may have been dropped before the mark
+    return len(value.encode("utf8")) >= max_bytes - 3
+
+
+def _cut_all(value, max_bytes):
+    if isinstance(value, dict):
+        return {key: _cut_all(item, max_bytes) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_cut_all(item, max_bytes) for item in value]
+    return _cut(value, max_bytes)
+
+
+def _timestamp(value):
+    """
+    Unix time of a str(datetime) value, or the value itself when it cannot be parsed.
+    """
+    try:
+        return int(datetime.datetime.fromisoformat(str(value)).timestamp())
+    except ValueError:
+        return value
+
+
+def _time_string(value):
+    if isinstance(value, int):
+        return str(datetime.datetime.fromtimestamp(value, datetime.timezone.utc))
+    return value
+
+
+def _compact(data, max_bytes):
+    if data.get("action") == SHOW_ANSWERS_ACTION:
+        return {"v": FORMAT_VERSION, "act": "show_answers", "t": _timestamp(data.get("last_submission_time"))}
+    if "current_submission_ww_raw_score" not in data:
+        return None # Not written by _result_from_json, kept as it is
+    my_provided = data.get("provided_settings", {})
+    my_results = data.get("answer_results_data", {})
+    my_answers = {}
+    for name, result in my_results.items():
+        my_values = [None if result.get(field) in (None, "") else result.get(field) for field in ANSWER_FIELDS_V2]
+        my_values = [item if field == "original_student_ans" else _cut_all(item, max_bytes)
+                     for field, item in zip(ANSWER_FIELDS_V2, my_values)]
+        if my_values[2] == name:
+            my_values[2] = None # ans_name is the key
+        while my_values and my_values[-1] is None:
+            my_values.pop()
+        my_answers[name] = my_values
+    my_compact = {
+        "v": FORMAT_VERSION,
+        "t": _timestamp(data.get("last_submission_time")),
+        "n": data.get("num_attempts"),
+        "p": [my_provided.get(key) for key in PROVIDED_SETTINGS_V2],
+        "s": [data.get("current_submission_ww_raw_score"), data.get("current_submission_scaled_score")],
+        "r": _cut_all(data.get("problem_result", {}), max_bytes),
+        "a": my_answers,
+    }
+    my_form = {key: None if str(my_provided.get(key)) == str(value) else value
+               for key, value in data.get("submission_settings_processed", {}).items()}
+    if my_form:
+        my_compact["f"] = my_form
+    # The answers which "a" does not give back (an empty original_student_ans is not kept)
+    my_extra = {name: value for name, value in data.get("answers_processed", {}).items()
+                if value == "" or my_results.get(name, {}).get("original_student_ans") != value}
+    if my_extra:
+        my_compact["x"] = my_extra
+    return my_compact
+
+
+def encode_submission_data(data, my_settings=None):
+    """
+    The value to store in submission_data_to_save for data (in format 1).
+    """
+    my_settings = my_settings or submission_data_settings()
+    if not data or my_settings["format"] != FORMAT_VERSION:
+        return data
+    my_compact = _compact(data, my_settings["max_string_bytes"])
+    if my_compact is None:
+        return data
+    if my_settings["compress"]:
+        my_json = json.dumps(my_compact, separators=(",", ":")).encode("utf8")
+        if len(my_json) >= my_settings["compress_min_bytes"]:
+            my_packed = base64.b64encode(zlib.compress(my_json, 9)).decode("ascii")
+            if len(my_packed) + 16 < len(my_json):
+                return {"v": FORMAT_VERSION, "z": my_packed}
+    return my_compact
+
+
+def decode_submission_data(value):
+    """
+    The format 1 layout of a stored submission_data_to_save value (either format).
+    """
+    if not isinstance(value, dict) or value.get("v") != FORMAT_VERSION:
+        return value
+    if "z" in value:
+        value = json.loads(zlib.decompress(base64.b64decode(value["z"])).decode("utf8"))
+    if value.get("act") == "show_answers":
+        return {"action": SHOW_ANSWERS_ACTION, "last_submission_time": _time_string(value.get("t"))}
+    my_provided = {key: item for key, item in zip(PROVIDED_SETTINGS_V2, value.get("p", [])) if item is not None}
+    my_results = {}
+    for name, values in value.get("a", {}).items():
+        my_result = {field: item for field, item in zip(ANSWER_FIELDS_V2, values) if item is not None}
+        my_result.setdefault("ans_name", name)
+        my_results[name] = my_result
+    my_answers = {name: result["original_student_ans"] for name, result in my_results.items()
+                  if "original_student_ans" in result}
+    my_answers.update(value.get("x", {}))
+    my_form = {key: my_provided.get(key) if item is None else item for key, item in value.get("f", {}).items()}
+    my_raw, my_scaled = (value.get("s") or [0.0, 0.0])[:2]
+    return {
+        "provided_settings": my_provided,
+        "submission_settings_processed": my_form,
+        "answers_processed": my_answers,
+        "problem_result": value.get("r", {}),
+        "answer_results_data": my_results,
+        "num_attempts": value.get("n"),
+        "last_submission_time": _time_string(value.get("t")),
+        "current_submission_ww_raw_score": my_raw,
+        "current_submission_scaled_score": my_scaled,
+    }
@@ -0,0 +1,116 @@
+"""
+Append-only log of the graded submissions (the WeBWorKSubmission model).
+
+submit_webwork_iframed adds one row for each graded submission, with a single
+INSERT. The INSERT runs in a savepoint, so a failure (for example when the
+migrations of the webwork app were not run yet) is logged and never breaks the
+submission or the transaction of the request.
+
+Staff read the log of a block page by page, newest first. Pages use the id of
+the last row of the previous page ("before"), so reading a page costs the same
+however deep in the history it is.
+
+Settings are read from the optional WEBWORK_SUBMISSION_LOG dictionary in the
+Django settings, see DEFAULT_SUBMISSION_LOG_SETTINGS.
+"""
+import json
+import logging
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SUBMISSION_LOG_SETTINGS = {
+    "enabled": True,
+    "page_size": 50,
+    "max_page_size": 500,
+}
+
+
+def submission_log_settings():
+    my_settings = dict(DEFAULT_SUBMISSION_LOG_SETTINGS)
+    my_settings.update(getattr(settings, "WEBWORK_SUBMISSION_LOG", {}) or {})
+    return my_settings
+
+
+def log_submission(course_key, usage_key, anonymous_user_id, attempt, raw_score, scaled_score, counted, data):
+    """
+    Add a row for a graded submission. Returns False when it was not added.
+    """
+    if not submission_log_settings()["enabled"]:
+        return False
+    # Models can only be imported once the Django apps are loaded
+    from django.db import transaction
+    from .models import WeBWorKSubmission
+    try:
+        with transaction.atomic():
+            WeBWorKSubmission.objects.create(
+                course_key = course_key,
+                usage_key = usage_key,
+                anonymous_user_id = anonymous_user_id or "",
+                attempt = attempt,
+                raw_score = raw_score,
+                scaled_score = scaled_score,
+                counted = counted,
+                data = json.dumps(data, separators=(",", ":")),
+            )
+    except Exception: # The log must never break a submission
+        log.exception("Could not log the WeBWorK submission of %s to %s", anonymous_user_id, usage_key)
+        return False
+    return True
+
+
+def submission_as_dict(row):
+    from .submission_data import decode_submission_data
+    try:
+        my_data = decode_submission_data(json.loads(row.data))
+    except ValueError:
+        my_data = None
+    return {
+        "id": row.id,
+        "anonymous_user_id": row.anonymous_user_id,
+        "created": row.created.isoformat(),
+        "attempt": row.attempt,
+        "raw_score": row.raw_score,
+        "scaled_score": row.scaled_score,
+        "counted": row.counted,
+        "data": my_data,
+    }
+
+
+def read_submissions(course_key, usage_key, anonymous_user_id=None, before=None, page_size=None):
+    """
+    A page of the submissions to a block (of one student, when anonymous_user_id
+    is given), newest first, and the "before" value of the next page (None on
+    the last page).
+    """
+    from .models import WeBWorKSubmission
+    my_settings = submission_log_settings()
+    my_page_size = min(max(int(page_size or my_settings["page_size"]), 1), my_settings["max_page_size"])
+    my_rows = WeBWorKSubmission.objects.filter(course_key=course_key, usage_key=usage_key)
+    if anonymous_user_id:
+        my_rows = my_rows.filter(anonymous_user_id=anonymous_user_id)
+    if before:
+        my_rows = my_rows.filter(id__lt=int(before))
+    my_rows = list(my_rows.order_by('-id')[:my_page_size + 1])
+    my_next = my_rows[my_page_size - 1].id if len(my_rows) > my_page_size else None
+    return [submission_as_dict(row) for row in my_rows[:my_page_size]], my_next
+
+
+def counted_submissions(course_key, usage_key, anonymous_user_ids):
+    """
+    {anonymous user id: [data of the counted submissions]} for the students of a
+    block, the data decoded to the format 1 layout.
+    """
+    from .models import WeBWorKSubmission
+    from .submission_data import decode_submission_data
+    my_found = {}
+    rows = WeBWorKSubmission.objects.filter(
+        course_key=course_key, usage_key=usage_key, counted=True, anonymous_user_id__in=list(anonymous_user_ids),
+    ).values_list('anonymous_user_id', 'data')
+    for anonymous_user_id, data in rows.iterator():
+        try:
+            my_found.setdefault(anonymous_user_id, []).append(decode_submission_data(json.loads(data)))
+        except ValueError:
+            continue
+    return my_found
@@ -0,0 +1,21 @@
+"""
+Celery tasks of the WeBWorK XBlock.
+"""
+import logging
+
+from celery import shared_task # pylint: disable=import-error
+
+from .cache_warming import warm_upcoming_deadlines
+
+log = logging.getLogger(__name__)
+
+
+@shared_task(name='webwork.tasks.warm_render_cache', ignore_result=True)
+def warm_render_cache(hours=None, concurrency=None, rate=None):
+    """
+    Periodic task: warm the render cache for the problems due in the next hours.
+    """
+    progress = warm_upcoming_deadlines(
+        hours=hours, concurrency=concurrency, rate=rate,
+        report=lambda p: log.info("WeBWorK render cache warming: %s", p))
+    return progress.as_dict()
@@ -0,0 +1,349 @@
+"""
+Optional tracing of the handler calls, down to the calls made to the renderer.
+
+A sampled call of submit_webwork_iframed or student_view opens a root span,
+and the phases below it (settings reload, period computation, renderer calls,
+JWT minting, HTTP call, JSON parse, grading and save) open child spans. Each
+renderer POST carries a W3C "traceparent" header, so a renderer which logs it
+can be correlated with the LMS call:
+
+    traceparent: 00-<32 hex trace id>-<16 hex span id>-01
+
+When the handler call itself came with a valid "traceparent" header (from a
+proxy or the browser), the trace continues it, and its sampled flag decides
+whether the call is traced. Otherwise "sample_ratio" of the calls are traced.
+
+Finished spans are queued, and written by a background thread to a JSON lines
+file ("file" exporter) or posted to an OpenTelemetry collector using OTLP/HTTP
+with the JSON encoding ("otlp" exporter). When the queue is full spans are
+dropped, so a slow exporter never delays the handlers.
+
+Tracing is off unless an "exporter" is configured: incoming traceparent
+headers are then ignored, and nothing is written. With tracing off, or
+sampling off, a call costs one context variable lookup per phase.
+
+Settings are read once per process from the optional WEBWORK_TRACING
+dictionary in the Django settings, see DEFAULT_TRACING_SETTINGS.
+"""
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+
+import requests
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TRACING_SETTINGS = {
+    "sample_ratio": 0.0, # fraction of the calls without an incoming traceparent which are traced
+    "respect_incoming": True, # continue the trace of an incoming traceparent header (only with an exporter)
+    "exporter": None, # None (tracing off), "file" or "otlp"
+    "file_path": "/tmp/webwork-spans.jsonl",
+    "otlp_endpoint": "http://127.0.0.1:4318/v1/traces",
+    "otlp_headers": {},
+    "otlp_timeout": 5.0, # seconds
+    "service_name": "edx-lms-webwork",
+    "max_queue": 2048, # spans waiting to be exported
+    "batch_size": 256,
+    "flush_interval": 2.0, # seconds
+}
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+_current_span = contextvars.ContextVar("webwork_current_span", default=None)
+
+
+def tracing_settings():
+    my_settings = dict(DEFAULT_TRACING_SETTINGS)
+    my_settings.update(getattr(settings, "WEBWORK_TRACING", {}) or {})
+    return my_settings
+
+
+def parse_traceparent(header):
+    """
+    (trace_id, parent_span_id, sampled) from a W3C traceparent header, or None.
+    """
+    my_match = TRACEPARENT_RE.match((header or "").strip().lower())
+    if my_match is None or my_match.group(1) == "0" * 32 or my_match.group(2) == "0" * 16:
+        return None
+    return my_match.group(1), my_match.group(2), bool(int(my_match.group(3), 16) & 1)
+
+
+def _random_id(nbytes):
+    return "{:0{width}x}".format(random.getrandbits(nbytes * 8) or 1, width=nbytes * 2)
+
+
+class _NullSpan:
+    """
+    Returned when the call is not traced. Every method does nothing.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    One traced operation. Use as a context manager: entering makes it the
+    current span, leaving ends it and hands it to the exporter.
+    """
+    __slots__ = ("tracer", "trace_id", "span_id", "parent_id", "name", "kind",
+                 "attributes", "start_ns", "end_ns", "error", "_token")
+
+    def __init__(self, tracer, name, trace_id, parent_id=None, kind=KIND_INTERNAL, attributes=None):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = _random_id(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = None
+        self.end_ns = None
+        self.error = None
+        self._token = None
+
+    @property
+    def traceparent(self):
+        return "00-{trace}-{span}-01".format(trace=self.trace_id, span=self.span_id)
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end_ns = time.time_ns()
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.error = "{name}: {err}".format(name=exc_type.__name__, err=exc_value)
+        self.tracer.finished(self)
+        return False
+
+    def as_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class SpanExporter:
+    """
+    Base class of the exporters. export() is called from the background thread.
+    """
+    def __init__(self, my_settings):
+        self.settings = my_settings
+
+    def export(self, spans):
+        raise NotImplementedError
+
+
+class FileSpanExporter(SpanExporter):
+    def export(self, spans):
+        with open(self.settings["file_path"], "a") as my_file:
+            for span in spans:
+                my_file.write(json.dumps(span.as_dict(), default=str) + "\n")
+
+
+class OTLPSpanExporter(SpanExporter):
+    """
+    OTLP/HTTP exporter using the JSON encoding (no protobuf dependency).
+    """
+    def otlp_payload(self, spans):
+        return {"resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": self.settings["service_name"]}},
+                {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "webwork"},
+                "spans": [{
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    "parentSpanId": span.parent_id or "",
+                    "name": span.name,
+                    "kind": span.kind,
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": [{"key": key, "value": _otlp_value(value)}
+                                   for key, value in span.attributes.items()],
+                    "status": ({"code": 2, "message": span.error} if span.error else {"code": 0}),
+                } for span in spans],
+            }],
+        }]}
+
+    def export(self, spans):
+        my_headers = {"Content-Type": "application/json"}
+        my_headers.update(self.settings["otlp_headers"] or {})
+        requests.post(
+            self.settings["otlp_endpoint"],
+            data=json.dumps(self.otlp_payload(spans)),
+            headers=my_headers,
+            timeout=self.settings["otlp_timeout"])
+
+
+EXPORTERS = {
+    "file": FileSpanExporter,
+    "otlp": OTLPSpanExporter,
+}
+
+
+class Tracer:
+    """
+    Creates the spans, and exports the finished ones in a background thread.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._configured = False
+        self.settings = dict(DEFAULT_TRACING_SETTINGS)
+        self.exporter = None
+        self._queue = None
+        self._thread = None
+        self.dropped = 0
+
+    def configure(self, my_settings=None):
+        my_settings = my_settings or tracing_settings()
+        self.settings = my_settings
+        # Tracing is off unless an exporter is configured, whatever the incoming headers say
+        self.exporter = EXPORTERS[my_settings["exporter"]](my_settings) if my_settings["exporter"] else None
+        self._queue = queue.Queue(maxsize=int(my_settings["max_queue"]))
+        self._configured = True
+
+    def _ensure_configured(self):
+        if self._configured:
+            return
+        with self._lock:
+            if self._configured:
+                return
+            try:
+                self.configure()
+            except Exception: # A bad setting disables tracing, but never breaks handlers
+                log.exception("Could not set up WeBWorK tracing")
+                self.settings = dict(DEFAULT_TRACING_SETTINGS)
+                self.exporter = None
+                self._configured = True
+
+    def start_trace(self, name, traceparent=None, attributes=None):
+        """
+        The root span of a handler call (a context manager), or a null span
+        when the call is not sampled.
+        """
+        self._ensure_configured()
+        if self.exporter is None:
+            return _NULL_SPAN
+        my_incoming = parse_traceparent(traceparent) if self.settings["respect_incoming"] else None
+        if my_incoming is not None:
+            trace_id, parent_id, sampled = my_incoming
+            if not sampled:
+                return _NULL_SPAN
+            return Span(self, name, trace_id, parent_id, KIND_SERVER, attributes)
+        my_ratio = self.settings["sample_ratio"]
+        if not my_ratio or random.random() >= my_ratio:
+            return _NULL_SPAN
+        return Span(self, name, _random_id(16), None, KIND_SERVER, attributes)
+
+    def span(self, name, kind=KIND_INTERNAL, **attributes):
+        """
+        A child span of the current span, or a null span when the call is not traced.
+        """
+        my_parent = _current_span.get()
+        if my_parent is None:
+            return _NULL_SPAN
+        return Span(self, name, my_parent.trace_id, my_parent.span_id, kind, attributes)
+
+    @staticmethod
+    def current_span():
+        return _current_span.get()
+
+    @staticmethod
+    def annotate(**attributes):
+        """
+        Add attributes to the current span, if any.
+        """
+        my_span = _current_span.get()
+        if my_span is not None:
+            my_span.attributes.update(attributes)
+
+    @staticmethod
+    def propagation_headers():
+        """
+        The headers to add to an outgoing request, so it joins the current trace.
+        """
+        my_span = _current_span.get()
+        if my_span is None:
+            return {}
+        return {"traceparent": my_span.traceparent}
+
+    def finished(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._export_loop, name="webwork-span-exporter", daemon=True)
+                    self._thread.start()
+
+    def _export_loop(self):
+        while True:
+            my_batch = [self._queue.get()]
+            my_deadline = time.monotonic() + self.settings["flush_interval"]
+            while len(my_batch) < self.settings["batch_size"]:
+                my_left = my_deadline - time.monotonic()
+                if my_left <= 0:
+                    break
+                try:
+                    my_batch.append(self._queue.get(timeout=my_left))
+                except queue.Empty:
+                    break
+            try:
+                self.exporter.export(my_batch)
+            except Exception: # Keep exporting later spans
+                log.warning("Could not export %d WeBWorK trace spans", len(my_batch), exc_info=True)
+
+
+# The single tracer shared by all blocks in this process
+tracer = Tracer()
@@ -0,0 +1,13 @@
+"""
+URLs of the webwork app, added to the LMS by the plugin configuration in apps.py.
+"""
+from django.conf import settings
+from django.conf.urls import url
+
+from . import views
+
+urlpatterns = [
+    url(r'^metrics$', views.prometheus_metrics, name='prometheus_metrics'),
+    url(r'^bundles/(?P<name>[\w.-]+)$', views.bundle, name='bundle'),
+    url(r'^courses/{}/grades$'.format(settings.COURSE_ID_PATTERN), views.grade_export, name='grade_export'),
+]
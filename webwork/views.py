@@ -0,0 +1,82 @@
+"""
+Django views of the webwork app.
+"""
+import hmac
+
+from django.contrib.auth.decorators import login_required
+from django.http import (
+    HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotFound, StreamingHttpResponse,
+)
+from opaque_keys import InvalidKeyError # pylint: disable=import-error
+from opaque_keys.edx.keys import CourseKey # pylint: disable=import-error
+
+from .assets import BUNDLE_CACHE_CONTROL, BUNDLE_FILES, load_resource
+from .grade_export import CONTENT_TYPES, EXPORT_FORMATS, export_filename, export_stream
+from .metrics import PrometheusSink, handler_metrics, metrics_settings
+
+
+def _may_read_metrics(request, my_settings):
+    if my_settings["prometheus_allow_anonymous"]:
+        return True
+    my_token = my_settings["prometheus_token"]
+    if my_token and hmac.compare_digest(request.META.get("HTTP_AUTHORIZATION", ""), "Bearer " + str(my_token)):
+        return True
+    my_user = getattr(request, "user", None)
+    return bool(my_user is not None and my_user.is_authenticated and my_user.is_staff)
+
+
+def prometheus_metrics(request):
+    """
+    The metrics of all the LMS processes in the Prometheus text format, when
+    the "prometheus" sink is configured in WEBWORK_METRICS. Only for staff
+    users, or scrapes sending the prometheus_token as a bearer token, unless
+    prometheus_allow_anonymous is set.
+    """
+    handler_metrics.start("metrics") # Sets up the sink on first use
+    if not isinstance(handler_metrics.sink, PrometheusSink):
+        return HttpResponseNotFound()
+    if not _may_read_metrics(request, metrics_settings()):
+        return HttpResponseForbidden()
+    return HttpResponse(handler_metrics.sink.render_text(), content_type="text/plain; version=0.0.4")
+
+
+@login_required
+def grade_export(request, course_id):
+    """
+    Course staff only: stream the WeBWorK grades and last submission data of
+    all the students of the course, as CSV (the default) or JSON Lines
+    (?format=jsonl).
+    """
+    from lms.djangoapps.courseware.access import has_access # pylint: disable=import-error
+    try:
+        course_key = CourseKey.from_string(course_id)
+    except InvalidKeyError:
+        return HttpResponseNotFound()
+    if not has_access(request.user, 'staff', course_key):
+        return HttpResponseForbidden()
+    export_format = request.GET.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest("Unknown format.")
+    response = StreamingHttpResponse(export_stream(export_format, course_key), content_type=CONTENT_TYPES[export_format])
+    response["Content-Disposition"] = 'attachment; filename="{name}"'.format(name=export_filename(export_format, course_key))
+    return response
+
+
+BUNDLE_CONTENT_TYPES = {
+    ".js": "application/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+}
+
+
+def bundle(request, name):
+    """
+    A file listed in the bundle manifest. The file names change with the
+    content, so the files are cached for a year without revalidation.
+    """
+    my_path = BUNDLE_FILES.get(name)
+    my_content_type = BUNDLE_CONTENT_TYPES.get("." + name.rsplit(".", 1)[-1])
+    if my_path is None or my_content_type is None:
+        return HttpResponseNotFound()
+    response = HttpResponse(load_resource(my_path), content_type=my_content_type)
+    response["Cache-Control"] = BUNDLE_CACHE_CONTROL
+    return response
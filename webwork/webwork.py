@@ -35,8 +35,9 @@ using either
 """
 import json
 import random
+import time
+from html import escape as escape_html
 import datetime
-import requests # Ease the contact with webwork server via HTTP/1.1
 import pkg_resources # Used here to return resource name as a string
 import six
 import pytz # python timezone
@@ -62,21 +63,80 @@ from django.utils.translation import ugettext_lazy as _ # pylint: disable=import
 from xblock.fields import String, Scope, Integer, List, Dict, Float, Boolean, DateTime, UNIQUE_ID
 from xmodule.fields import Date
 from xblock.validation import ValidationMessage
+from xblock.exceptions import JsonHandlerError
 from web_fragments.fragment import Fragment
-from webob.response import Response # Uses WSGI format(Web Server Gateway Interface) over HTTP to contact webwork
 from xblockutils.studio_editable import StudioEditableXBlockMixin
 from xblock.scorable import ScorableXBlockMixin, Score
 from xblock.completable import XBlockCompletionMode
 from cms.djangoapps.models.settings.course_grading import CourseGradingModel
-from enum import IntFlag, unique
 from xmodule.util.duedate import get_extended_due_date
 
 # The recommended manner to format datetime for display in Studio and LMS is to use:
 from common.djangoapps.util.date_utils import get_default_time_display
 
-# Need to support making an encrypted JWT for use by the Standalone renderer
-from jwcrypto import jwt, jwk
-import jwcrypto.common
+# Building/sending the requests to the renderer. The encrypted problemJWT for the
+# Standalone renderer is made (and cached) there.
+from .render_requests import (
+    STANDALONE_ADD_INTO_JWT, STANDALONE_MOVE_INTO_JWT,
+    RenderRequest, add_student_params, coalesced_render_request, render_with_cache, server_key_for
+)
+
+# Cache of rendered problems for initial loads
+from .render_cache import render_cache
+
+# Coalescing of identical renderer calls in flight
+from .single_flight import single_flight
+
+# Registry of the course-wide webwork_settings
+from .course_settings import course_settings_registry
+
+# Skip saving per-student fields whose values did not change
+from .persistence import DirtyTrackingMixin, user_state_write_stats
+
+# Static assets, loaded once per process
+from .assets import STUDENT_VIEW_HTML, STUDIO_VIEW_JS, add_student_view_assets
+
+# Problem periods, and the cached grace periods / transition instants used to compute them
+from .problem_periods import PPeriods, problem_period_engine, grace_timedelta_from_policy
+
+# Pooled keep-alive HTTP sessions shared by all blocks in the process
+from .renderer_client import pool_settings_from_server_settings
+
+# Per endpoint load balancing / health data of the renderers
+from .renderer_pool import renderer_pools
+
+# Per server circuit breakers, protecting the LMS workers from unhealthy renderers
+from .circuit_breaker import circuit_breakers
+
+# Request timeouts learned from the observed latency of each problem
+from .adaptive_timeouts import adaptive_timeouts
+
+# Timing of the handler phases, sent to the configured metrics sink
+from .metrics import NULL_RECORDER, handler_metrics
+
+# Optional tracing spans, propagated to the renderer with a W3C traceparent header
+from .tracing import tracer
+
+# Minified problem HTML and compressed handler responses
+from .response_encoding import handler_responses_settings, json_response, minify_html
+
+# Patches against the problem page the browser already shows
+from .html_delta import BASE_HASH_FIELD, rendered_pages
+
+# Compact encoding of submission_data_to_save
+from .submission_data import encode_submission_data
+
+# Append-only history of the graded submissions
+from .submission_log import counted_submissions, log_submission, read_submissions
+
+# Streaming grade export
+from webob.response import Response
+from .grade_export import CONTENT_TYPES, EXPORT_FORMATS, export_filename, export_stream
+
+# Rescoring by replaying the stored answers
+from .rescoring import (
+    ReplayContext, replay_best_score, replay_history, rescoring_settings, score_changed,
+)
 
 # Next line needed only if we decide to use the submissions API
 #from .sub_api import SubmittingXBlockMixin, sub_api
@@ -256,42 +316,8 @@ STANDALONE_RESPONSE_PARAMETERS_SHOWCORRECT = dict(STANDALONE_RESPONSE_PARAMETERS
     "showCorrectAnswers": "Show Correct Answers"
 })
 
-# The keys in STANDALONE_ADD_INTO_JWT and in STANDALONE_MOVE_INTO_JWT
-# are setting in the Standalone API which we do not want anyone to be able
-# to set (tamper with) using form parameters and a valid JWT they obtained
-# in some manner or another.
-# 1. The ones in STANDALONE_ADD_INTO_JWT are settings which are not used by
-#    this XBlock, so we will just add them into the JWT claims.
-# 2. The ones in STANDALONE_MOVE_INTO_JWT are expected to be set by the XBlock,
-#     so the code will add the desired values for each key from params, and
-#     fall back to using the fixed settings if no value was provided by params.
-STANDALONE_ADD_INTO_JWT = {
-    "problemSourceURL": "", # empty string is treated by Perl as false, so does not have an effect
-    "problemSource": ""     # on the renderer behavior but will prevent override outside JWT.
-}
-
-# Note for testing the JWT lockdown on changes:
-#   Commenting out the outputFormat line in STANDALONE_MOVE_INTO_JWT below,
-#   and also the line to tamper with that value in request_webwork_standalone
-#   will let such tampering occur and be observed. Uncommenting the line here
-#   will block the effect of that tampering.
-# That establishes that the tamper resistence mechanism in the XBlock and the
-# handling by the Standalone renderer are working as intended.
-
-STANDALONE_MOVE_INTO_JWT = { # values we use and want to protect from tampering outside the JWT
-                             # if someone obtains a valid JWT to use
-    "numCorrect": "",
-    "numIncorrect": "",
-    "format" : "json",
-    "outputFormat": "simple",
-    "permissionLevel": "0", # Student level permissions
-    "showSummary": "1",
-    "showComments": "0",
-    "showHints": "0", # Default to off
-    "showSolutions": "0", # Default to off
-    "includeTags": "0"
-}
-
+# STANDALONE_ADD_INTO_JWT and STANDALONE_MOVE_INTO_JWT (the settings which are protected
+# from tampering by placing them inside the problemJWT) are defined in render_requests.py
 
 # =========================================================================================
 
@@ -335,17 +361,6 @@ HTML2XML_FORM_SETTINGS_TO_SAVE = [
 class WeBWorKXBlockError(RuntimeError):
     pass
 
-@unique # decorator to enforce different integer values for each period
-class PPeriods(IntFlag):
-    UnKnown = 0 
-    NoDue = 1 # some problem are due-dateless
-    PreDue = 2 # The problem due date is in the future
-    PostDue = 3
-    Locked =  4 # Problem locked for submissions/watch answers etc.
-    UnLocked = 5
-    PostDueLocked = PostDue * Locked 
-    PostDueUnLocked = PostDue * UnLocked
-        
 class WWProblemPeriod:
     """ Neatly define getter and setter of problem periods """
     def __init__(self, period=PPeriods.UnKnown):
@@ -368,7 +383,7 @@ class WWProblemPeriod:
 @XBlock.needs("user")
 @XBlock.needs('i18n')
 class WeBWorKXBlock(
-    ScorableXBlockMixin, XBlock, StudioEditableXBlockMixin,
+    DirtyTrackingMixin, ScorableXBlockMixin, XBlock, StudioEditableXBlockMixin,
     #SubmittingXBlockMixin,  # Needed if using the the submissions API
     ):
     """
@@ -398,49 +413,37 @@ class WeBWorKXBlock(
 
     @property
     def grace_timedelta(self): #plays both as getter and setter
+        # The grading policy is cached per course (and shared version stamp), as reading it loads the course.
+        self._grace_timedelta = problem_period_engine.grace_period(
+            self.runtime.course_id, self._fetch_grace_timedelta, self.course_settings_entry.shared_version)
+        return self._grace_timedelta
+
+    def _fetch_grace_timedelta(self):
         try:
-            graceperiod = CourseGradingModel.fetch(self.course.id).grace_period
+            graceperiod = CourseGradingModel.fetch(self.runtime.course_id).grace_period
         except AttributeError:
             graceperiod = None
-
-        if graceperiod is not None:
-            self._grace_timedelta = datetime.timedelta(
-                hours = graceperiod['hours'],
-                minutes = graceperiod['minutes'],
-                seconds = graceperiod['seconds']
-                )
-        else:
-            self._grace_timedelta = datetime.timedelta(
-                hours=0, minutes=0, seconds=0
-                )
-
-        return self._grace_timedelta
+        return grace_timedelta_from_policy(graceperiod)
 
     def set_problem_period(self):
         Now = datetime.datetime.now(datetime.timezone.utc)
         self.set_due_date()
         DueDate = self.due
-        GraceDuration = self.grace_timedelta
-        LockDuration = datetime.timedelta(hours = self.post_deadline_lockdown)
-        if DueDate is not None and GraceDuration is not None:
-            self.lock_date_begin = DueDate + GraceDuration
-            self.lock_date_end = self.lock_date_begin + LockDuration
+        if DueDate is not None:
+            GraceDuration = self.grace_timedelta
+            self.lock_date_begin, self.lock_date_end = problem_period_engine.transitions(
+                DueDate, GraceDuration, self.post_deadline_lockdown)
 
             # The formatting in the next line should be locale dependent, so we use
             # get_default_time_display()
             self.formatted_lock_date_end = get_default_time_display(self.lock_date_end)
 
-            if Now < self.lock_date_begin:
-                self.problem_period = PPeriods.PreDue
-            elif Now < self.lock_date_end:
-                self.problem_period = PPeriods.PostDueLocked
-            else:
-                self.problem_period = PPeriods.PostDueUnLocked
-        elif DueDate is None:
+            self.problem_period = problem_period_engine.classify(Now, self.lock_date_begin, self.lock_date_end)
+        else:
             self.problem_period = PPeriods.NoDue
             self.lock_date_end = None
             self.formatted_lock_date_end = None
-        
+
     def clear_problem_period(self):
         del self._problem_period
 
@@ -505,30 +508,50 @@ class WeBWorKXBlock(
     show_in_read_only_mode = True # Allows staff to view the problem in read only mode when masquerading as a user.
     # See https://github.com/edx/edx-platform/blob/master/lms/djangoapps/courseware/masquerade.py
 
-    main_settings = None
-    def reload_main_setting(self):
-        self.main_settings = self.course.other_course_settings.get('webwork_settings', {})
+    # The parsed course-wide settings are kept per course in a process-level registry,
+    # so the course descriptor is only loaded from the modulestore when they are stale.
+    # Each block instance keeps a reference to the entry it is using.
+    _course_settings_entry = None
+    def reload_main_setting(self, force=False):
+        self._course_settings_entry = course_settings_registry.get(
+            self.runtime.course_id,
+            lambda: self.course.other_course_settings.get('webwork_settings', {}),
+            force = force)
+        # Used to invalidate cached renders when the course settings change
+        render_cache.note_fingerprint(self.runtime.course_id, self._course_settings_entry.fingerprint)
+
+    @property
+    def course_settings_entry(self):
+        if self._course_settings_entry is None:
+            self.reload_main_setting()
+        return self._course_settings_entry
+
+    @property
+    def main_settings(self):
+        return self.course_settings_entry.webwork_settings
+
+    @property
+    def main_settings_fingerprint(self):
+        return self.course_settings_entry.fingerprint
 
     def get_default_server(self):
-        if self.main_settings == None:
-             self.reload_main_setting()
-        return self.main_settings.get('course_defaults',{}).get('default_server')
+        return self.course_settings_entry.course_defaults.get('default_server')
 
     def get_psvn_shift(self):
-        if self.main_settings == None:
-             self.reload_main_setting()
-        return int(self.main_settings.get('course_defaults',{}).get('psvn_shift',0))
+        return int(self.course_settings_entry.course_defaults.get('psvn_shift',0))
 
     # Current server connection related settings.
-    # Make it an XBlock field to try to make sure it remains fixed per XBlock instance,
-    # and does not cross between instances. Without doing this, and trying it as a
-    # "plain" variable in the class - errors occurred as the value would sometimes be
-    # from the "wrong" XBlock instance, which led to loading errors.
-    current_server_settings = Dict(
-       display_name = _("Current server settings for this block"),
-       scope = Scope.user_state, # Scope.settings did not work - cannot be set by LMS
-       help= ("This is the current server settings for this block."),
-    )
+    # This used to be a Scope.user_state field, as a "plain" dictionary in the class
+    # was shared by all the instances, which led to loading errors. It is derived data,
+    # so it is now kept in a dictionary created per XBlock instance, which is never
+    # persisted (and does not trigger a write of the user_state).
+    _current_server_settings = None
+
+    @property
+    def current_server_settings(self):
+        if self._current_server_settings is None:
+            self._current_server_settings = {}
+        return self._current_server_settings
 
     def clear_current_server_settings(self):
         self.current_server_settings.clear()
@@ -537,9 +560,9 @@ class WeBWorKXBlock(
         self.clear_current_server_settings()
         if self.settings_type == 1:
             # Use the course-wide settings for the relevant ww_server_id
-            self.current_server_settings.update(self.main_settings.get('server_settings',{}).get(self.ww_server_id, {}))
-            # Keep auth_data outside the current_server_settings field (which gets into the DB records of user_state/submissions).
-            self.current_server_settings.pop("auth_data", None)
+            # The registry keeps auth_data outside these settings, so it can never be copied
+            # into data which gets into the DB records of user_state/submissions.
+            self.current_server_settings.update(self.course_settings_entry.get_server_settings(self.ww_server_id))
         elif self.settings_type == 2:
             # Use the locally set values from the specific XBlock instance
             self.current_server_settings.update({  # Need str() on the first 2 to force into a final string form, and not __proxy__
@@ -555,16 +578,29 @@ class WeBWorKXBlock(
         #logger.info("At end of set_current_server_settings for {UID} and see server_type as {ST}".format(UID=self.unique_id, ST = myST ))
 
     # The auth_data should be retrieved for use when a request is being made and
-    # is not included in the current_server_settings, so it does not get logged to
+    # is not included in the current_server_settings, so it can never get logged to
     # the database as part of the user_state of the XBlock.
     def get_current_auth_data(self):
         if self.settings_type == 1:
             # Use the course-wide settings for the relevant ww_server_id
-            return self.main_settings.get('server_settings',{}).get(self.ww_server_id, {}).get('auth_data',{})
+            return self.course_settings_entry.get_auth_data(self.ww_server_id)
         elif self.settings_type == 2:
             # Use the locally set values from the specific XBlock instance
             return self.auth_data
 
+    def get_current_server_key(self):
+        """
+        A key identifying the server in use, for the process-wide caches.
+        """
+        return server_key_for(self.current_server_settings.get("server_api_url"))
+
+    def get_current_pool_settings(self):
+        """
+        Connection pool settings for the session used to contact the current server.
+        Only the course-wide server settings can override the defaults.
+        """
+        return pool_settings_from_server_settings(self.current_server_settings)
+
     def set_ww_server_id_options(self):
         """
         Set the list of course-wide ww_server_id options to display, pulled from the
@@ -574,7 +610,7 @@ class WeBWorKXBlock(
         my_default_server = self.get_default_server()
         if my_default_server:
             options_to_offer.append(my_default_server)
-        server_list = self.main_settings.get('server_settings',{}).keys()
+        server_list = self.course_settings_entry.server_settings.keys()
         if server_list:
             for sid in server_list:
                 if sid != my_default_server:
@@ -601,6 +637,7 @@ class WeBWorKXBlock(
         'allow_show_answers', 'allow_ww_hints', 'allow_ww_solutions_with_correct_answers',
         'problem_banner_text', 'display_name',
         'webwork_request_timeout',
+        'inline_prerender', 'inline_prerender_budget',
         'post_deadline_lockdown',
         'custom_parameters',
         'iframe_min_height', 'iframe_max_height', 'iframe_min_width'
@@ -808,11 +845,31 @@ class WeBWorKXBlock(
         display_name=_("Timeout [in seconds] for Webwork Server Requests"),
         help=_(
             "Maximal number of seconds to wait for response from the webwork server. <br/>" +
+            "A shorter timeout is used once the usual response time of the problem is known. <br/>" +
             "Don't change unless you are dealing with heavy duty problem."
         ),
         default=5.0,
         scope=Scope.settings
     )
+    inline_prerender = Boolean(
+        display_name=_("Render the problem inside the page"),
+        help=_(
+            "Render the problem (or take it from the cache) when the unit page is built, instead of " +
+            "loading it by an additional request from the browser. If the problem is not ready within " +
+            "the time budget, it is loaded by the browser as usual."
+        ),
+        default=False,
+        scope=Scope.settings
+    )
+
+    inline_prerender_budget = Float(
+        display_name=_("Time budget [in seconds] for rendering the problem inside the page"),
+        help=_(
+            "Maximal number of seconds to wait for the webwork server when rendering the problem inside the page."
+        ),
+        default=1.0,
+        scope=Scope.settings
+    )
     # ----------- Internal student fields -----------
     student_answer = Dict(
         default = None,
@@ -995,6 +1052,10 @@ class WeBWorKXBlock(
             validation.add(ValidationMessage(ValidationMessage.ERROR, str(
                 _("webwork_request_timeout must be at least 0.5 (seconds).")
             )))
+        if data.inline_prerender_budget < 0.1:
+            validation.add(ValidationMessage(ValidationMessage.ERROR, str(
+                _("inline_prerender_budget must be at least 0.1 (seconds).")
+            )))
         if data.weight < 0:
             validation.add(ValidationMessage(ValidationMessage.ERROR, str(
                 _("weight must be non-negative. A weight of 0 essentially removes the score on this problem from the section grade calculation.")
@@ -1031,7 +1092,12 @@ class WeBWorKXBlock(
         elif myST == 'standalone':
             fixed_state = raw_state
         else:
-            fixed_state = 'Error'
+            return 'Error'
+
+        if handler_responses_settings()["minify_html"]:
+            self._metrics.size("rendered_html_bytes", len(fixed_state))
+            fixed_state = minify_html(fixed_state)
+            self._metrics.size("rendered_html_minified_bytes", len(fixed_state))
 
         return fixed_state
 
@@ -1143,160 +1209,100 @@ class WeBWorKXBlock(
         for key in EARLY_FORM_CLEANUP:
             request.pop(key, None)
 
-    def request_webwork_html2xml(self, params):
-        # html2xml can use HTTP GET or POST. POST is more secure
-        # See https://requests.readthedocs.io/en/master/user/quickstart/#make-a-request
-        my_timeout = max(self.webwork_request_timeout,0.5)
-        my_url = self.current_server_settings.get("server_api_url")
-        my_auth_data = self.get_current_auth_data()
-        my_res = None
-        if my_url:
-            try:
-                my_res = requests.post(my_url, data=dict(
-                        params,
-                        courseID=my_auth_data.get('ww_course','error'),
-                        userID=my_auth_data.get('ww_username','error'),
-                        course_password=my_auth_data.get('ww_password','error'),
-                        problemSeed=str(self.seed),
-                        psvn=str(self.get_psvn()),
-                        sourceFilePath=str(self.problem)
-                    ),
-                    timeout = my_timeout)
-            except requests.exceptions.RequestException:
-                # At present we are not trying to provide any information on what
-                # sort of exception occurred.
-                # Details on what can be issued appear in
-                # https://docs.python-requests.org/en/latest/user/quickstart/#errors-and-exceptions
-                my_res = None
-        if my_res:
-            try:
-                return my_res.json()
-            except ValueError: # includes simplejson.errors.JSONDecodeError
-                return None
-        return None
+    # Set temporarily to bound the renderer calls in time (inline prerender), see RenderRequest
+    _request_deadline = None
 
-    def make_problemJWT_for_standalone(self, params):
+    # MetricsRecorder of the handler call in progress
+    _metrics = NULL_RECORDER
+
+    def get_request_timeout(self):
         """
-        Create an encrypted problemJWT to send to the Standalone renderer.
+        Timeout (in seconds) for the current request to the renderer.
+        Learned from the observed latency of the problem on the current server,
+        with webwork_request_timeout as the ceiling.
         """
+        return adaptive_timeouts.timeout_for(
+            self.get_current_server_key(), self.problem, max(self.webwork_request_timeout,0.5))
 
-        # Get the key/aud data needed to create the JWT for this server
-        my_auth_data = self.get_current_auth_data()
-        my_key_raw = my_auth_data.get('problemJWTsecret',None)
-        my_aud = my_auth_data.get('aud',None)
-
-        if not my_aud or not my_key_raw:
-            # Cannot get the data needed to make the JWT
-            #logger.info( "Failed to get JWT setup data" )
-            return None
-
-        # Create dict of initial claims
-        my_claims = {
-            'aud' : str(my_aud),
-            'problemSeed': str(self.seed),
-            'psvn' : str(self.get_psvn()),
-            'sourceFilePath' : str(self.problem)
-        }
-
-        # Add protected data to JWT so it cannot be tampered with if someone tried to call the API
-        # with a JWT they obtained which we generated, but with form data trying to override one
-        # or more of the protected settings.
-
-        # Forced values for options which we do not use, and do now want anyone to be able to add
-        my_claims.update( STANDALONE_ADD_INTO_JWT )
-
-        # Protect settings we expect to use and want to protect from tampering
-        for i in STANDALONE_MOVE_INTO_JWT.keys():
-            # use either the value params requested of the value from the defaults
-            my_claims.update( { i: params.get(i, STANDALONE_MOVE_INTO_JWT.get(i,"")) } )
-
-        #logger.info("Claims for JWT are {claims}".format(claims=json.dumps(my_claims)))
-
-        try:
-            # Create the base64_urlencoded format needed by jwcrypto
-            my_key_encoded = jwcrypto.common.base64url_encode( my_key_raw )
+    def make_render_request(self, params, idempotent=False):
+        """
+        The RenderRequest for a call to the current server with params.
+        idempotent requests may be retried on another endpoint of the server.
+        """
+        return RenderRequest(
+            server_settings = self.current_server_settings,
+            auth_data = self.get_current_auth_data(),
+            server_key = self.get_current_server_key(),
+            seed = self.seed,
+            psvn = self.get_psvn(),
+            problem = self.problem,
+            params = params,
+            timeout = self.get_request_timeout(),
+            course_id = self.runtime.course_id,
+            settings_fingerprint = self.main_settings_fingerprint,
+            idempotent = idempotent,
+            metrics = self._metrics,
+            deadline = self._request_deadline
+        )
 
-            my_k_dict = {"k": my_key_encoded, "kty": "oct"}
-            my_key = jwk.JWK(**my_k_dict)
+    def request_webwork_html2xml(self, params, idempotent=False):
+        return coalesced_render_request(self.make_render_request(params, idempotent))
 
-            # Make the encrypted token
-            my_etoken = jwt.JWT(header={"alg": "A256KW", "enc": "A256CBC-HS512"}, claims= my_claims )
-            my_etoken.make_encrypted_token(my_key)
-            return my_etoken.serialize()
-        except Exception:
-            return None
+    def make_problemJWT_for_standalone(self, params):
+        """
+        Create an encrypted problemJWT to send to the Standalone renderer.
+        """
+        return self.make_render_request(params).problem_jwt()
 
-    def request_webwork_standalone(self, params):
+    def request_webwork_standalone(self, params, idempotent=False):
         # Standalone uses HTTP POST
-        # See https://requests.readthedocs.io/en/master/user/quickstart/#make-a-request
         # and outputFormat set to "simple" and format set to "json".
         # Check by examining form parameters from standalone renderer editor UI on "render" call.
-        my_timeout = max(self.webwork_request_timeout,0.5)
-        my_url = self.current_server_settings.get("server_api_url")
-        my_res = None
-
-        my_jwt = self.make_problemJWT_for_standalone( params )
-        if my_jwt:
-            ##logger.info( my_jwt )
-            params.update( { "problemJWT": str(my_jwt) } )
-            params.pop("auth_data", None)
-
-            # The commented out line below was used to test that a request
-            # cannot override value in JWT by modifying values which we protected
-            # by including them in the JWT.
-            # When the line below is uncommented, it should NOT have an
-            # effect on the renderered problems. However, if the line to include
-            # outputFormat inside the STANDALONE_MOVE_INTO_JWT is commented out, then
-            # it will have an effect and the "Show correct answers" button will
-            # not be displayed.
-
-            #params.update( { "outputFormat": "classic" } )
-
-            # End of section to test JWT settings being tamper resistent.
-        else:
-            #logger.info( 'error making JWT.' )
-            return None
+        return coalesced_render_request(self.make_render_request(params, idempotent))
 
-        if my_url:
-            try:
-                my_res = requests.post(my_url,
-                    data=dict(params,
-                        # standalone does not have course/user/password
-                        # The following fields are not in the JWT and should only be there
-                        #problemSeed=str(self.seed),
-                        #psvn=str(self.get_psvn()),
-                        #sourceFilePath=str(self.problem)
-                    ),
-                    timeout = my_timeout)
-            except requests.exceptions.RequestException:
-                # At present we are not trying to provide any information on what
-                # sort of exception occurred.
-                # Details on what can be issued appear in
-                # https://docs.python-requests.org/en/latest/user/quickstart/#errors-and-exceptions
-                my_res = None
-        if my_res:
-            try:
-                return my_res.json()
-            except ValueError: # includes simplejson.errors.JSONDecodeError
-                return None
-        return None
-            
-    def request_webwork(self, params):
-        params.update( { "language": str(self.ww_language) } ) # Sets the desired translation language on the WW side
+    def prepare_webwork_params(self, params):
+        """
+        Add the block/student dependent settings to the request parameters.
+        Safe to call more than once on the same params.
+        """
+        return add_student_params(
+            params,
+            self.current_server_settings.get("server_type"),
+            self.ww_language,
+            self.ww_numCorrect,
+            self.ww_numIncorrect,
+            self.allow_ww_hints)
+
+    def request_webwork(self, params, idempotent=False):
+        """
+        Call the current server. Set idempotent only for requests which are safe
+        to repeat (preview, show answers), never for submissions.
+        """
+        self.prepare_webwork_params(params)
 
-        if self.current_server_settings.get("server_type") == 'standalone':
-            # Providing these parameters is only supported by the Standalone renderer at present
-            params.update( {
-                "numCorrect":   str(self.ww_numCorrect),
-                "numIncorrect": str(self.ww_numIncorrect),
-            } )
-            if self.allow_ww_hints:
-                params.update( { "showHints": "1" } )
+        with tracer.span("webwork.request_webwork", **{"webwork.server_type": str(self.current_server_settings.get("server_type"))}):
+            if self.current_server_settings.get("server_type") == 'standalone':
+                return self.request_webwork_standalone(params, idempotent)
 
-            return self.request_webwork_standalone(params)
+            if self.current_server_settings.get("server_type") == 'html2xml':
+                return self.request_webwork_html2xml(params, idempotent)
 
-        if self.current_server_settings.get("server_type") == 'html2xml':
-            return self.request_webwork_html2xml(params)
+    def get_render_cache_key(self, params):
+        """
+        Key of the rendered problem cache for the (already prepared) params.
+        """
+        return self.make_render_request(params).cache_key()
+
+    def request_webwork_cached(self, params):
+        """
+        request_webwork for requests whose result only depends on the request
+        parameters (initialLoad), using the two-tier rendered problem cache.
+        """
+        self.prepare_webwork_params(params)
+        if self.current_server_settings.get("server_type") not in ('standalone', 'html2xml'):
+            return None
+        with tracer.span("webwork.request_webwork_cached"):
+            return render_with_cache(self.make_render_request(params, idempotent=True))
 
     # ----------- Grading related code -----------
     """
@@ -1339,13 +1345,49 @@ class WeBWorKXBlock(
         This method should not modify the state of the XBlock.
         Returns:
             Score(raw_earned=float, raw_possible=float)
-        Since we do not allow "rescoring" it returns the currently saved score
+        The stored answers of the student are replayed through the renderer (see
+        rescoring.py). When nothing can be replayed it returns the currently saved score.
         """
-        return Score(float(self.best_student_score), float(self.get_max_score()))
+        return self._replayed_score(only_if_higher=False)
+
+    def _replayed_score(self, only_if_higher):
+        """
+        calculate_score(), also replaying a partial history when only_if_higher.
+        """
+        self.reload_main_setting()
+        my_anonymous_id = getattr(self.runtime, 'anonymous_student_id', None)
+        my_submissions = []
+        if my_anonymous_id:
+            my_submissions = counted_submissions(
+                self.runtime.course_id, self.scope_ids.usage_id, [my_anonymous_id]).get(my_anonymous_id, [])
+        my_submissions = replay_history(my_submissions, {
+            'student_attempts': self.student_attempts,
+            'submission_data_to_save': self.submission_data_to_save,
+        }, only_if_higher)
+        my_score = replay_best_score(ReplayContext(self, self.runtime.course_id), my_submissions)
+        if my_score is None:
+            return self.get_score()
+        return Score(my_score, float(self.get_max_score()))
 
     def allows_rescore(self):
-        # This XBlock does not allow rescoring of submitted answers.
-        return False
+        # Submitted answers are rescored by replaying them through the renderer.
+        return True
+
+    def rescore(self, only_if_higher):
+        """
+        Calculate a new score, and save and publish it only when it changed.
+        """
+        if not self.has_submitted_answer():
+            raise ValueError(self.runtime.service(self, "i18n").ugettext(
+                "Cannot rescore unanswered problem: {location}").format(location=self.location))
+        my_score = self._replayed_score(only_if_higher)
+        if not score_changed(float(self.best_student_score), my_score.raw_earned, only_if_higher,
+                             rescoring_settings()["score_tolerance"]):
+            return
+        self.set_score(my_score)
+        # Saved first, so the published grade comes with the current state (see process_submission)
+        self.save()
+        self._publish_grade(my_score, only_if_higher)
 
     def get_max_score(self):
         """
@@ -1389,20 +1431,39 @@ class WeBWorKXBlock(
 
         #logger.info("Starting student view for {UID}".format(UID=self.unique_id))
 
-        # Get updated main course settings from main course "Other course settings"
-        # Do this now, as we may need updated main connection settings
-        # translation.activate('he') FIXME remove after debug i18n-try1 branch
-        self.reload_main_setting()
-        # and then
-        self.set_current_server_settings()
+        # Only per-student values which really change in this view will be saved
+        self.snapshot_user_state()
 
-        if not self.seed:
-            self.seed = random.randint(1,2**31-1)
+        # The trace covers the work done before the fragment is built
+        with tracer.start_trace("webwork.student_view"):
+            tracer.annotate(**{"webwork.block": str(self.scope_ids.usage_id), "webwork.problem": str(self.problem)})
 
-        loading1 = "Your problem should load soon."
-        loading2 = "Please wait."
-        loadingHtml = "<html><body>{loading1}<br>{loading2}</body></html>"
-        mysrcdoc = loadingHtml.format(loading1 = loading1, loading2 = loading2)
+            # Get updated main course settings from main course "Other course settings"
+            # Do this now, as we may need updated main connection settings
+            # translation.activate('he') FIXME remove after debug i18n-try1 branch
+            with tracer.span("webwork.settings_reload"):
+                self.reload_main_setting()
+                # and then
+                self.set_current_server_settings()
+
+            if not self.seed:
+                self.seed = random.randint(1,2**31-1)
+
+            initial_response = None
+            if self.inline_prerender:
+                with tracer.span("webwork.prerender"):
+                    initial_response = self.prerender_initial_load()
+
+        if initial_response:
+            # The rendered problem goes directly into the srcdoc attribute,
+            # and later submissions can get patches against it.
+            rendered_pages.note_page(self.rendered_pages_scope(), initial_response)
+            mysrcdoc = escape_html(initial_response.pop('renderedHTML'), quote=True)
+        else:
+            loading1 = "Your problem should load soon."
+            loading2 = "Please wait."
+            loadingHtml = "<html><body>{loading1}<br>{loading2}</body></html>"
+            mysrcdoc = loadingHtml.format(loading1 = loading1, loading2 = loading2)
 
         debug_data = ""
         # This is sample code to generate some debug info to display under the problem
@@ -1427,13 +1488,11 @@ class WeBWorKXBlock(
            ', minWidth: '  + str(self.iframe_min_width)  + \
            '}, "#' + iframe_id + '")\n //]]></script>'
 
-        html = self.resource_string("static/html/webwork_in_iframe.html")
+        html = STUDENT_VIEW_HTML
 
         messageDiv_id = 'edx_message-' + self.unique_id;
         resultDiv_id  = 'edx_webwork_result-' + self.unique_id;
 
-        js1  = self.resource_string("static/js/src/webwork_in_iframe.js")
-
         frag = Fragment( html.format(
             self = self,
             srcdoc = mysrcdoc,
@@ -1442,10 +1501,9 @@ class WeBWorKXBlock(
             debug_data = debug_data
         ))
 
-        frag.add_javascript_url('https://cdnjs.cloudflare.com/ajax/libs/iframe-resizer/4.2.9/iframeResizer.js')
-
-        frag.add_css(self.resource_string("static/css/webwork.css"))
-        frag.add_javascript( js1 )
+        # The JS/CSS bundles (and iframeResizer) are served by URL, so a unit with many
+        # problems loads them only once.
+        add_student_view_assets(frag, self)
 
         my_settings = {
           'unique_id' : self.unique_id,
@@ -1453,6 +1511,9 @@ class WeBWorKXBlock(
           'messageDivID' : messageDiv_id,
           'resultDivID' : resultDiv_id
         }
+        if initial_response:
+            # Tells the JS code not to make the initialLoad call
+            my_settings['initialResponse'] = initial_response
 
         frag.initialize_js('WeBWorKXBlockIframed', my_settings)
 
@@ -1537,9 +1598,106 @@ class WeBWorKXBlock(
                     new_score = str(new_score), max_score = str(self.get_max_score()), old_best = str(self.best_student_score)
                     )
 
+    def process_initial_load(self, request, response, request_parameters):
+        """
+        Render the problem for an initial load, and fill in the response.
+        Used by submit_webwork_iframed and by the inline prerender of student_view.
+        The problem period must already be set.
+        """
+        request.update(request_parameters)
+        webwork_response = self.request_webwork_cached(request)
+        response['renderedHTML'] = self._problem_from_json(webwork_response)
+
+        # Prepare message to provide when the problem is locked / post-deadline
+        if self.problem_period is PPeriods.PostDueLocked:
+            part1 = self.runtime.service(self, "i18n").ugettext("Sorry, you cannot submit answers now.")
+            if self.formatted_lock_date_end:
+                part2 = "<br>" + self.runtime.service(self, "i18n").ugettext(
+                    "Additional use of the problem is not permitted until {unlock_datetime}").format(
+                        unlock_datetime = self.formatted_lock_date_end
+                        ) + "<br>"
+            else:
+                part2 = "<br>"
+        elif self.problem_period is PPeriods.PostDueUnLocked:
+            part1 = self.runtime.service(self, "i18n").ugettext("This problem is after the deadline, so additional submissions are not for credit. You will get feedback on your answers.")
+            part2 = "<br>"
+        else:
+            part1 = ""
+            part2 = ""
+        if response['renderedHTML'] == 'Error':
+            response['success'] = False
+            response['message'] = self.runtime.service(self, "i18n").ugettext("An error occurred. Please try again later, and if the problem occurs again, please report the issue to the support staff.")
+        else:
+            response['success'] = True
+            response['message'] = part1 + part2 + self.create_current_score_message()
+        return response
+
+    def prerender_initial_load(self):
+        """
+        Try to render the problem while building student_view, within the
+        inline_prerender_budget time budget: a deadline bounds the renderer call,
+        waiting for an identical call in flight included, and it is not retried.
+        Returns the initial load response, or None when the problem could not be
+        rendered in time, in which case the browser will make the usual initialLoad call.
+        """
+        if self.current_server_settings.get("server_type") == 'standalone':
+            request_parameters = STANDALONE_REQUEST_PARAMETERS
+        elif self.current_server_settings.get("server_type") == 'html2xml':
+            request_parameters = HTML2XML_REQUEST_PARAMETERS
+        else:
+            return None
+        response = {
+            'success': False,
+            'message': '',
+            'score': '',
+            'scored': False
+        }
+        self._request_deadline = time.monotonic() + max(self.inline_prerender_budget, 0.1)
+        try:
+            self.set_problem_period()
+            response.update( self.period_button_settings() )
+            self.process_initial_load({}, response, request_parameters)
+        except Exception: # Never break the page - the deferred AJAX path still works
+            return None
+        finally:
+            self._request_deadline = None
+        if not response['success']:
+            return None
+        return response
+
     # ----------- Handler for standalone -----------
     @XBlock.handler
     def submit_webwork_iframed(self, request_original, suffix=''):
+        """
+        Handle the student's submission, recording the metrics of the call.
+        """
+        self._metrics = handler_metrics.start("submit_webwork_iframed")
+        try:
+            with tracer.start_trace("webwork.submit_webwork_iframed",
+                                    traceparent=request_original.headers.get("traceparent")):
+                tracer.annotate(**{"webwork.block": str(self.scope_ids.usage_id), "webwork.problem": str(self.problem)})
+                return self.process_submission(request_original)
+        except Exception:
+            self._metrics.label(outcome="exception")
+            raise
+        finally:
+            my_writes, my_avoided, my_skipped = self.user_state_write_counts()
+            self._metrics.size("user_state_writes", my_writes)
+            self._metrics.size("user_state_writes_avoided", my_avoided)
+            self._metrics.size("user_state_fields_skipped", my_skipped)
+            self._metrics.finish()
+            self._metrics = NULL_RECORDER
+
+    @staticmethod
+    def _response_outcome(response):
+        """
+        The outcome label of a handler response, for the metrics.
+        """
+        if response.get('renderedHTML') == 'Error':
+            return "renderer_error"
+        return "ok" if response['success'] else "refused"
+
+    def process_submission(self, request_original):
         """
         Handle the student's submission.
         """
@@ -1552,9 +1710,14 @@ class WeBWorKXBlock(
 
         #logger.info("Starting submit_webwork_iframed for {UID}".format(UID=self.unique_id))
 
+        # Only per-student values which really change in this request will be saved
+        self.snapshot_user_state()
+
         # Make sure server settings are up to date
-        self.reload_main_setting()
-        self.set_current_server_settings()
+        with self._metrics.phase("settings_reload"), tracer.span("webwork.settings_reload"):
+            self.reload_main_setting()
+            self.set_current_server_settings()
+        self._metrics.label(server=self.ww_server_id if self.settings_type == 1 else "manual")
 
         if self.current_server_settings.get("server_type") == 'standalone':
             # Settings for standalone calls
@@ -1570,17 +1733,19 @@ class WeBWorKXBlock(
             RESPONSE_PARAMETERS_SHOWCORRECT = HTML2XML_RESPONSE_PARAMETERS_SHOWCORRECT
         else:
             # This means that the server_type is not valid
-            return Response(
-                    text = json.dumps(response),
-                    content_type =  "application/json",
-                    status = 200,
-                )
+            self._metrics.label(outcome=self._response_outcome(response))
+            return json_response(request_original, response, self._metrics)
 
+        base_hash = None
         try:
             # Copy the submitted form data from the request_original.json element
             # for modification and future use.
             request = request_original.json.copy()
 
+            # The hash of the page shown by the browser ("" before it has one, None when
+            # the browser does not use delta responses), never sent to the renderer
+            base_hash = request.pop(BASE_HASH_FIELD, None)
+
             if self.current_server_settings.get("server_type") == 'html2xml':
                 # Normalize 'submit_type' to use the values which the Standalone renderer uses
                 if request['submit_type'] == "WWsubmit":
@@ -1591,9 +1756,12 @@ class WeBWorKXBlock(
                     request['submit_type'] = "showCorrectAnswers"
 
             self._sanitize_request(request)
+            self._metrics.label(submit_type=request.get('submit_type', ''))
+            tracer.annotate(**{"webwork.submit_type": request.get('submit_type', '')})
 
-            self.set_problem_period()
-            response.update( self.period_button_settings() )
+            with self._metrics.phase("period"), tracer.span("webwork.period"):
+                self.set_problem_period()
+                response.update( self.period_button_settings() )
 
             # TODO: Consider tranform into a match-case clause
             # after upgrading to python 3.10 and above
@@ -1605,34 +1773,7 @@ class WeBWorKXBlock(
             # Handle first by submission type to reduce code duplication
             if request['submit_type'] == "initialLoad":
                 request.pop('submit_type')
-                request.update(REQUEST_PARAMETERS)
-                webwork_response = self.request_webwork(request)
-                response['renderedHTML'] = self._problem_from_json(webwork_response)
-
-
-                # Prepare message to provide when the problem is locked / post-deadline
-                if self.problem_period is PPeriods.PostDueLocked:
-                    allow_submit = False
-                    part1 = self.runtime.service(self, "i18n").ugettext("Sorry, you cannot submit answers now.")
-                    if self.formatted_lock_date_end:
-                        part2 = "<br>" + self.runtime.service(self, "i18n").ugettext(
-                            "Additional use of the problem is not permitted until {unlock_datetime}").format(
-                                unlock_datetime = self.formatted_lock_date_end
-                                ) + "<br>"
-                    else:
-                        part2 = "<br>"
-                elif self.problem_period is PPeriods.PostDueUnLocked:
-                    part1 = self.runtime.service(self, "i18n").ugettext("This problem is after the deadline, so additional submissions are not for credit. You will get feedback on your answers.")
-                    part2 = "<br>"
-                else:
-                    part1 = ""
-                    part2 = ""
-                if response['renderedHTML'] == 'Error':
-                    response['success'] = False
-                    response['message'] = self.runtime.service(self, "i18n").ugettext("An error occurred. Please try again later, and if the problem occurs again, please report the issue to the support staff.")
-                else:
-                    response['success'] = True
-                    response['message'] = part1 + part2 + self.create_current_score_message()
+                self.process_initial_load(request, response, REQUEST_PARAMETERS)
             elif request['submit_type'] == "submitAnswers":
                 request.pop('submit_type')
                 # We will only modify self.student_answer only once we are certain that a submission is
@@ -1726,10 +1867,24 @@ class WeBWorKXBlock(
 
                         self.set_last_submission_time()
 
-                        self.submission_data_to_save = self._result_from_json(webwork_response)
-
-                        raw_ww_score = self.submission_data_to_save.get('current_submission_ww_raw_score',0.0)
-                        scaled_ww_score = self.submission_data_to_save.get('current_submission_scaled_score',0.0)
+                        with self._metrics.phase("result_from_json"), tracer.span("webwork.result_from_json"):
+                            submission_data = self._result_from_json(webwork_response)
+                            self.submission_data_to_save = encode_submission_data(submission_data)
+
+                        raw_ww_score = submission_data.get('current_submission_ww_raw_score',0.0)
+                        scaled_ww_score = submission_data.get('current_submission_scaled_score',0.0)
+
+                        with self._metrics.phase("submission_log"), tracer.span("webwork.submission_log"):
+                            log_submission(
+                                self.runtime.course_id,
+                                self.scope_ids.usage_id,
+                                getattr(self.runtime, 'anonymous_student_id', None),
+                                attempt = self.student_attempts,
+                                raw_score = raw_ww_score,
+                                scaled_score = scaled_ww_score,
+                                counted = save_grade,
+                                data = submission_data, # Complete, unlike the compact user state copy
+                            )
 
                         response['score'] = self.create_score_message(scaled_ww_score, save_grade)
                         response['scored'] = True
@@ -1778,20 +1933,21 @@ class WeBWorKXBlock(
                             if scaled_ww_score > self.best_student_score or not self.done:
                                 self.done = True
                                 self.best_student_score = scaled_ww_score
-                                myscore = self.calculate_score()
+                                myscore = self.get_score() # calculate_score() would replay the submissions
                                 #self.set_score(myscore) # would just set self.best_student_score again
 
-                                # We need to force a save so the call to "_publish_grade" has the current state data.
-                                self.save()
+                                with self._metrics.phase("save_publish_grade"), tracer.span("webwork.save_publish_grade"):
+                                    # We need to force a save so the call to "_publish_grade" has the current state data.
+                                    self.save()
 
-                                # An XBlock which sets a score needs to publish it.
-                                # We only want scores to change if they are increasing (keep the largest score)
-                                # so we would have liked to use "only_if_higher=True" below
-                                self._publish_grade(myscore)
-                                # but using
-                                #    self._publish_grade(myscore, only_if_higher=True)
-                                # gave errors apparently when there was no saved grade.
-                                # So handle the decision on that in our code
+                                    # An XBlock which sets a score needs to publish it.
+                                    # We only want scores to change if they are increasing (keep the largest score)
+                                    # so we would have liked to use "only_if_higher=True" below
+                                    self._publish_grade(myscore)
+                                    # but using
+                                    #    self._publish_grade(myscore, only_if_higher=True)
+                                    # gave errors apparently when there was no saved grade.
+                                    # So handle the decision on that in our code
 
                                 # Submissions API was designed for ORA and more complex grading needs.
                                 # When the sub_api is used mysql records are created in:
@@ -1836,7 +1992,7 @@ class WeBWorKXBlock(
                 elif self.problem_period is PPeriods.NoDue or self.problem_period is PPeriods.PreDue or self.problem_period is PPeriods.PostDueUnLocked:
                     # If PPeriods.PreDue and attempt limit hit - handled above
                     request.update(RESPONSE_PARAMETERS_PREVIEW)
-                    webwork_response = self.request_webwork(request)
+                    webwork_response = self.request_webwork(request, idempotent=True)
                     response['renderedHTML'] = self._problem_from_json(webwork_response)
                     # On preview we do not need to save result of the call, so we do not want to make any change to the XBlock state.
                     if response['renderedHTML'] == 'Error':
@@ -1910,7 +2066,7 @@ class WeBWorKXBlock(
                     request.update(RESPONSE_PARAMETERS_SHOWCORRECT)
                     if self.allow_ww_solutions_with_correct_answers:
                         request.update( { "showSolutions": "1" } )
-                    webwork_response = self.request_webwork(request)
+                    webwork_response = self.request_webwork(request, idempotent=True)
                     response['renderedHTML'] = self._problem_from_json(webwork_response)
                     if response['renderedHTML'] == 'Error':
                         response['success'] = False
@@ -1921,10 +2077,10 @@ class WeBWorKXBlock(
                         # Use self.submission_data_to_save to show that a "show correct answers" action was taken, but ONLY the first time.
                         if not self.student_viewed_correct_answers:
                             self.set_last_submission_time()
-                            self.submission_data_to_save = {
+                            self.submission_data_to_save = encode_submission_data({
                                 "action" : "show correct answers - called for the first time when permitted",
                                 'last_submission_time': str(self.last_submission_time)
-                            }
+                            })
                             if not self.student_answer is None:
                                 self.student_answer.clear()
                         self.student_viewed_correct_answers = True
@@ -1939,12 +2095,95 @@ class WeBWorKXBlock(
         except WeBWorKXBlockError as e:
             response['message'] = "fixme" # e.message
 
-        return Response(
-                text = json.dumps(response),
-                content_type =  "application/json",
-                status = 200,
-            )
+        self._metrics.label(outcome=self._response_outcome(response))
+        with self._metrics.phase("delta"), tracer.span("webwork.delta"):
+            rendered_pages.delta_response(self.rendered_pages_scope(), response, base_hash, self._metrics)
+        return json_response(request_original, response, self._metrics)
 
+    def rendered_pages_scope(self):
+        """
+        The scope of the stored pages of this block and student.
+        """
+        return "{usage}:{user}".format(usage=self.scope_ids.usage_id, user=self.scope_ids.user_id)
+
+    @XBlock.json_handler
+    def rendered_html(self, data, suffix=''):
+        """
+        The full page with the renderedHash in data, for a browser which could not
+        apply a renderedPatch.
+        """
+        my_hash = data.get('renderedHash')
+        my_html = rendered_pages.get(self.rendered_pages_scope(), my_hash) if isinstance(my_hash, str) else None
+        if my_html is None:
+            return {'success': False}
+        return {'success': True, 'renderedHTML': my_html, 'renderedHash': my_hash}
+
+    # ----------- Monitoring -----------
+    @XBlock.json_handler
+    def renderer_stats(self, data, suffix=''):
+        """
+        Staff only: the renderer endpoint, circuit breaker, learned timeout, render
+        cache, single-flight and user state save counters of the LMS process which
+        handles the call.
+        """
+        if not getattr(self.runtime, 'user_is_staff', False):
+            raise JsonHandlerError(403, "Only course staff can view the renderer statistics.")
+        return {
+            'endpoints': renderer_pools.stats(),
+            'circuit_breakers': circuit_breakers.stats(),
+            'adaptive_timeouts': adaptive_timeouts.stats(),
+            'render_cache': render_cache.stats(),
+            'single_flight': single_flight.stats(),
+            'user_state_saves': user_state_write_stats.stats(),
+        }
+
+    @XBlock.json_handler
+    def submission_history(self, data, suffix=''):
+        """
+        Staff only: a page of the logged submissions to this block, newest first.
+        data may hold "anonymous_user_id" or "username" (one student), "before"
+        (the "next" value of the previous page) and "page_size".
+        """
+        if not getattr(self.runtime, 'user_is_staff', False):
+            raise JsonHandlerError(403, "Only course staff can view the submission history.")
+        my_anonymous_id = data.get('anonymous_user_id')
+        if not my_anonymous_id and data.get('username'):
+            # Only available inside the LMS
+            from django.contrib.auth import get_user_model # pylint: disable=import-error
+            from common.djangoapps.student.models import anonymous_id_for_user # pylint: disable=import-error
+            try:
+                my_user = get_user_model().objects.get(username=data['username'])
+            except get_user_model().DoesNotExist:
+                raise JsonHandlerError(404, "Unknown user.")
+            my_anonymous_id = anonymous_id_for_user(my_user, self.runtime.course_id)
+        try:
+            my_submissions, my_next = read_submissions(
+                self.runtime.course_id, self.scope_ids.usage_id, my_anonymous_id,
+                before=data.get('before'), page_size=data.get('page_size'))
+        except (TypeError, ValueError):
+            raise JsonHandlerError(400, "Invalid before or page_size.")
+        return {'submissions': my_submissions, 'next': my_next}
+
+    @XBlock.handler
+    def grade_export(self, request, suffix=''):
+        """
+        Staff only: the grades and last submission data of all the students of
+        this problem, streamed as CSV (the default) or JSON Lines (?format=jsonl).
+        The whole course is exported by the /webwork/courses/<course id>/grades view.
+        """
+        if not getattr(self.runtime, 'user_is_staff', False):
+            return Response(status=403)
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response(status=400)
+        response = Response(
+            app_iter = export_stream(export_format, self.runtime.course_id, [self.scope_ids.usage_id]),
+            content_type = CONTENT_TYPES[export_format].split(";")[0],
+            charset = "utf-8",
+        )
+        response.content_disposition = 'attachment; filename="{name}"'.format(
+            name=export_filename(export_format, self.runtime.course_id, self.scope_ids.usage_id))
+        return response
 
     def studio_view(self, context):
         """
@@ -1953,7 +2192,8 @@ class WeBWorKXBlock(
 
         # Get updated main course settings from main course "Other course settings"
         # Do this now, before presenting the options, etc.
-        self.reload_main_setting()
+        # Studio always reads the current settings, and not the ones in the registry.
+        self.reload_main_setting(force=True)
 
         # The set the list of server_id_options to be displayed
         self.set_ww_server_id_options()
@@ -1969,7 +2209,7 @@ class WeBWorKXBlock(
         # Initialize the choices
         fragment = super().studio_view(context)
 
-        fragment.add_javascript(self.resource_string("static/js/xblock_studio_view.js"))
+        fragment.add_javascript(STUDIO_VIEW_JS)
 
         fragment.initialize_js('WebWorkXBlockInitStudio')
 